@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cost of fanning one game event out to a room, by room size.
+
+Compares the previous per-recipient path (each User.send encodes the JSON
+string again) with the serialize-once path (Protocol builds bytes once and
+every recipient shares them). Run: python benchmarks/bench_broadcast.py
+"""
+
+import sys
+import os
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.protocols import Protocol
+from server.game_manager import RealOthelloGame
+from server.user_manager import User
+
+ROOM_SIZES = [2, 8, 32, 128, 512]
+EVENTS = 2000
+
+
+class _NullConnection:
+    """Socket stand-in that discards writes"""
+
+    def sendall(self, data):
+        pass
+
+
+def _legacy_broadcast(users, game_state):
+    """Old path: one JSON string, encoded and framed again inside every User.send"""
+    message = json.dumps({"type": "game_update", "payload": {"game_state": game_state}})
+    for user in users:
+        user.send(message)
+
+
+def _shared_broadcast(users, game_state):
+    """New path: bytes built once and shared by every recipient"""
+    message = Protocol.game_update(game_state)
+    for user in users:
+        user.send(message)
+
+
+def _time(fn, users, game_state):
+    started = time.perf_counter()
+    for _ in range(EVENTS):
+        fn(users, game_state)
+    return (time.perf_counter() - started) / EVENTS * 1e6
+
+
+def main():
+    game_state = RealOthelloGame().get_game_state()
+    print(f"{'room size':>10} {'legacy us/event':>16} {'shared us/event':>16} {'speedup':>8}")
+    for size in ROOM_SIZES:
+        users = [User(_NullConnection(), ("bench", i)) for i in range(size)]
+        legacy = _time(_legacy_broadcast, users, game_state)
+        shared = _time(_shared_broadcast, users, game_state)
+        print(f"{size:>10} {legacy:>16.1f} {shared:>16.1f} {legacy / shared:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark: encode/decode throughput and size of the hot messages, JSON vs
+the negotiated binary codec (shared/codec.py), and how well the large JSON
+messages deflate with and without the preset dictionary.
+
+Decoding goes through the same split_frames path the server and client use.
+Run: python benchmarks/bench_codec.py
+"""
+
+import sys
+import os
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.protocols import Protocol
+from server.game_manager import RealOthelloGame
+from server.user_manager import User
+from shared import codec
+
+ITERATIONS = 20000
+
+
+def _messages():
+    """(name, build(binary)) for every message the binary codec covers"""
+    game = RealOthelloGame()
+    for move in [(2, 3), (2, 2), (2, 1), (1, 1)]:
+        game.make_move(move, 'black' if game.version % 2 == 0 else 'white')
+    move, color, flipped = game.last_move
+    state = game.get_game_state(compact=True)
+    return [
+        ('make_move', lambda binary: codec.encode_make_move(*move) if binary
+            else Protocol.create_message('make_move', {'move': list(move)})),
+        ('move_applied', lambda binary: Protocol.move_applied(
+            move, color, flipped, state['turn'], state['scores'], state['version'], binary=binary)),
+        ('game_update', lambda binary: Protocol.game_update(state, binary=binary)),
+        ('ping', lambda binary: Protocol.ping(binary=binary)),
+    ]
+
+
+def _decode_json(data):
+    return Protocol.parse_message(codec.split_frames(data)[0][0])
+
+
+def _decode_binary(data):
+    return codec.split_frames(data)[0][0]
+
+
+def _rate(fn, arg):
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn(arg)
+    return ITERATIONS / (time.perf_counter() - started) / 1000
+
+
+def main():
+    print(f"{'message':>13} {'codec':>7} {'bytes':>6} {'encode k/s':>11} {'decode k/s':>11}")
+    for name, build in _messages():
+        for binary, decode in ((False, _decode_json), (True, _decode_binary)):
+            data = build(binary)
+            assert decode(data)['type'] == name
+            encode_rate = _rate(build, binary)
+            decode_rate = _rate(decode, data)
+            label = 'binary' if binary else 'json'
+            print(f"{name:>13} {label:>7} {len(data):>6} {encode_rate:>11.0f} {decode_rate:>11.0f}")
+
+
+def _large_messages():
+    """(name, JSON bytes) for messages that are over the deflate threshold"""
+    game = RealOthelloGame()
+    players = [User(None, ("bench", i)) for i in range(2)]
+    for i, player in enumerate(players):
+        player.username = f"player{i}"
+    return [
+        ('game_start', Protocol.game_start(players, game.get_game_state())),
+        ('game_update', Protocol.game_update(game.get_game_state())),
+    ]
+
+
+def _deflate_plain(message):
+    compressor = zlib.compressobj(codec.DEFLATE_LEVEL, zlib.DEFLATED, -15)
+    return compressor.compress(message) + compressor.flush()
+
+
+def compression():
+    print(f"\n{'message':>13} {'json':>6} {'deflate':>8} {'+dict':>6} {'ratio':>6} "
+          f"{'compress us':>12} {'inflate us':>11}")
+    for name, message in _large_messages():
+        plain = _deflate_plain(message)
+        framed = codec.deflate_message(message)
+        compress_us = 1e3 / _rate(codec.deflate_message, message)
+        inflate_us = 1e3 / _rate(codec.split_frames, framed)
+        print(f"{name:>13} {len(message):>6} {len(plain):>8} {len(framed):>6} "
+              f"{len(framed) / len(message):>6.2f} {compress_us:>12.1f} {inflate_us:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
+    compression()
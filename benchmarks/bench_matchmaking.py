@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark: matchmaking queue operations per second, by queue depth.
+
+Measures enqueue + cancel pairs against a queue already holding N players
+whose ratings are too far apart to match, the average cost of a heartbeat
+tick over that queue, and enqueues that do match (room created, both players
+notified). Run: python benchmarks/bench_matchmaking.py
+"""
+
+import sys
+import os
+import contextlib
+import io
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.matchmaking import Matchmaker
+from server.password_hasher import PasswordHasher
+from server.room_manager import RoomManager
+from server.user_manager import UserManager
+from server.user_store import SqliteUserStore
+
+QUEUE_DEPTHS = [100, 1000, 10000]
+OPERATIONS = 20000
+MATCHES = 2000
+TICKS = 100
+
+
+class _NullConnection:
+    """Socket stand-in that discards writes"""
+
+    def sendall(self, data):
+        pass
+
+
+def _setup(directory, **windows):
+    store = SqliteUserStore(os.path.join(directory, "users.db"), json_path=None)
+    user_manager = UserManager(store=store, password_hasher=PasswordHasher(rounds=4))
+    user_manager.room_manager = RoomManager(user_manager)
+    return user_manager, Matchmaker(user_manager.room_manager, **windows)
+
+
+def _users(user_manager, count):
+    users = []
+    for i in range(count):
+        user = user_manager.add_user(_NullConnection(), ("bench", i))
+        user.username = f"player{i}"
+        users.append(user)
+    return users
+
+
+def bench_queue(depth):
+    """(enqueue + cancel pairs per second, seconds per tick) with `depth` players waiting"""
+    directory = tempfile.mkdtemp()
+    user_manager, matchmaker = _setup(directory, initial_window=0, window_growth=0)
+    try:
+        users = _users(user_manager, depth + 1)
+        for i, user in enumerate(users[:depth]):
+            matchmaker.enqueue(user, i * 10)  # Ten points apart: nobody matches
+        newcomer = users[depth]
+        start = time.perf_counter()
+        for i in range(OPERATIONS):
+            matchmaker.enqueue(newcomer, (i * 7919) % (depth * 10) + 5)
+            matchmaker.cancel(newcomer)
+        pairs_per_second = OPERATIONS / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(TICKS):
+            matchmaker.tick()
+        tick_seconds = (time.perf_counter() - start) / TICKS
+    finally:
+        user_manager.close()
+        shutil.rmtree(directory)
+    return pairs_per_second, tick_seconds
+
+
+def bench_matches():
+    """Matching enqueues per second: each second player completes a pair and a room"""
+    directory = tempfile.mkdtemp()
+    user_manager, matchmaker = _setup(directory)
+    try:
+        users = _users(user_manager, MATCHES * 2)
+        start = time.perf_counter()
+        for i, user in enumerate(users):
+            matchmaker.enqueue(user, (i // 2) * 1000)
+        elapsed = time.perf_counter() - start
+        assert len(user_manager.room_manager.rooms) == MATCHES
+    finally:
+        user_manager.close()
+        shutil.rmtree(directory)
+    return MATCHES * 2 / elapsed
+
+
+def main():
+    print(f"{'queued':>7}  {'enqueue+cancel/s':>16}  {'tick ms':>8}")
+    with contextlib.redirect_stdout(io.StringIO()):  # Room and match logging
+        results = [(depth, *bench_queue(depth)) for depth in QUEUE_DEPTHS]
+        matched = bench_matches()
+    for depth, pairs_per_second, tick_seconds in results:
+        print(f"{depth:>7}  {pairs_per_second:>16.0f}  {tick_seconds * 1000:>8.2f}")
+    print(f"\nMatching enqueues (room created, both notified): {matched:.0f}/s")
+
+
+if __name__ == "__main__":
+    main()
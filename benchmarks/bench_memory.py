@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: server memory per idle, logged-in connection.
+
+Builds N User objects the way a login leaves them (account fields taken
+from the store's record, a session token, one message through the rate
+limiter) and measures the Python heap they add with tracemalloc. The
+records themselves belong to the user store and are built beforehand. The
+previous layout, a plain object that also kept the account's email,
+password hash, score and created_at, is measured the same way. Sockets and
+handler threads are not included. Run: python benchmarks/bench_memory.py
+"""
+
+import sys
+import os
+import gc
+import secrets
+import threading
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.rate_limiter import RateLimiter
+from server.user_manager import User
+
+CONNECTION_COUNTS = [10_000, 50_000, 100_000]
+
+
+class _LegacyUser:
+    """The previous per-connection object: __dict__ attributes plus a copy of the account"""
+
+    def __init__(self, connection, address):
+        self.connection = connection
+        self.address = address
+        self.user_id = str(uuid.uuid4())
+        self.username = None
+        self.score = 0
+        self.current_room = None
+        self.last_seen = time.monotonic()
+        self.last_ping = 0.0
+        self.reaped = False
+        self.pending = b""
+        self.rate_limiter = RateLimiter()
+        self.features = frozenset()
+        self.session_token = None
+        self._outbox = []
+        self._send_lock = threading.Lock()
+
+
+def _account(index):
+    """A record as the user store holds it"""
+    return {
+        "user_id": str(uuid.uuid4()),
+        "username": f"player{index}",
+        "email": f"player{index}@example.com",
+        "password": "pbkdf2_sha256$1800$" + secrets.token_hex(16) + "$" + secrets.token_hex(32),
+        "score": index * 3,
+        "created_at": "2025-01-01T00:00:00.000000",
+    }
+
+
+def _log_in(user, account, legacy):
+    """Leave `user` in the state a login and one later message produce"""
+    user.user_id = account["user_id"]
+    user.username = account["username"]
+    user.session_token = secrets.token_urlsafe(32)
+    user.rate_limiter.allow("login_user")
+    if legacy:
+        user.email = account["email"]
+        user.password = account["password"]
+        user.score = account["score"]
+        user.created_at = account["created_at"]
+
+
+def bytes_per_connection(user_class, accounts, legacy=False):
+    connection = object()  # Shared stand-in; the socket itself is not counted
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    users = []
+    for i, account in enumerate(accounts):
+        user = user_class(connection, ("10.0.0.1", 40000 + i % 20000))
+        _log_in(user, account, legacy)
+        users.append(user)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del users
+    return used / len(accounts)
+
+
+def main():
+    print(f"{'connections':>11}  {'previous B/conn':>15}  {'slotted B/conn':>14}  {'saved':>6}")
+    for count in CONNECTION_COUNTS:
+        accounts = [_account(i) for i in range(count)]
+        legacy = bytes_per_connection(_LegacyUser, accounts, legacy=True)
+        current = bytes_per_connection(User, accounts)
+        print(f"{count:>11}  {legacy:>15.0f}  {current:>14.0f}  {1 - current / legacy:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark: JSON message encode/decode per backend.
+
+For every installed JSON backend, compares the previous path
+(json.dumps(...).encode() + newline) with the canonical encode_message path
+and the typed WireMessage classes, then times decode_message.
+Run: python benchmarks/bench_messages.py
+"""
+
+import sys
+import os
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.game_manager import RealOthelloGame
+from shared.messages import (
+    JSON_BACKENDS, json_backend, set_json_backend, encode_message, decode_message,
+    ErrorMessage, GameUpdateMessage, MoveAppliedMessage, RoomUpdateMessage
+)
+
+ITERATIONS = 20000
+
+
+def _messages():
+    """(name, WireMessage) pairs covering small, medium and large payloads"""
+    game = RealOthelloGame()
+    players = [{'user_id': f'00000000-0000-4000-8000-00000000000{i}', 'username': f'player{i}'}
+               for i in range(2)]
+    return [
+        ('error', ErrorMessage("Invalid move.")),
+        ('room_update', RoomUpdateMessage('ABC123', players)),
+        ('move_applied', MoveAppliedMessage([2, 3], 'black', [[3, 3]], 'white',
+                                            {'black': 4, 'white': 1}, 1)),
+        ('game_update', GameUpdateMessage(game.get_game_state())),
+    ]
+
+
+def _rate(fn):
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn()
+    return ITERATIONS / (time.perf_counter() - started) / 1000
+
+
+def main():
+    messages = _messages()
+    active = json_backend
+    print(f"{'backend':>8} {'message':>13} {'legacy enc':>11} {'encode':>8} {'typed enc':>10} "
+          f"{'legacy dec':>11} {'decode':>8}   (k msgs/s)")
+    for backend in JSON_BACKENDS:
+        try:
+            set_json_backend(backend)
+        except ImportError:
+            print(f"{backend:>8} (not installed)")
+            continue
+        for name, message in messages:
+            msg_type, payload = message.TYPE, message.to_payload()
+            data = message.encode()
+            legacy_enc = _rate(lambda: json.dumps({"type": msg_type, "payload": payload}).encode('utf-8') + b'\n')
+            encode = _rate(lambda: encode_message(msg_type, payload))
+            typed = _rate(message.encode)
+            legacy_dec = _rate(lambda: json.loads(data))
+            decode = _rate(lambda: decode_message(data))
+            print(f"{backend:>8} {name:>13} {legacy_enc:>11.0f} {encode:>8.0f} {typed:>10.0f} "
+                  f"{legacy_dec:>11.0f} {decode:>8.0f}")
+    set_json_backend(active)
+
+
+if __name__ == "__main__":
+    main()
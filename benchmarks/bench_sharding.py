@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark: registrations per second against the number of user store shards.
+
+Several threads add new users at once through the stack the server runs
+(open_user_store: a write-behind CachedUserStore in front of each SQLite
+shard), and the clock stops once every registration has been flushed to
+disk. With one shard every thread shares one cache lock, one dirty set and
+one writer; with N shards each has its own. Run: python benchmarks/bench_sharding.py
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.user_store import ShardedUserStore, SqliteUserStore, cache_layout, shard_path
+
+SHARD_COUNTS = [1, 2, 4, 8]
+THREADS = 8
+USERS_PER_THREAD = 5000
+
+
+def _record(username):
+    return {
+        "user_id": username,
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "hash",
+        "score": 0,
+        "created_at": None,
+    }
+
+
+def _register(store, thread_index):
+    for i in range(USERS_PER_THREAD):
+        store.add(_record(f"t{thread_index}-user{i}"))
+
+
+def bench(shards):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "users.db")
+    backing = [SqliteUserStore(shard_path(path, i, shards), json_path=None) for i in range(shards)]
+    # The layout open_user_store builds, on files in a scratch directory
+    store = cache_layout(backing[0] if shards == 1 else ShardedUserStore(backing))
+    threads = [threading.Thread(target=_register, args=(store, i)) for i in range(THREADS)]
+    try:
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        store.flush()
+        elapsed = time.perf_counter() - start
+        assert len(store.all_users()) == THREADS * USERS_PER_THREAD
+    finally:
+        store.close()
+        shutil.rmtree(directory)
+    return THREADS * USERS_PER_THREAD / elapsed
+
+
+def main():
+    print(f"{THREADS} threads registering {USERS_PER_THREAD} users each\n")
+    print(f"{'shards':>6}  {'registrations/s':>15}  {'vs 1 shard':>10}")
+    baseline = None
+    for shards in SHARD_COUNTS:
+        rate = bench(shards)
+        baseline = baseline or rate
+        print(f"{shards:>6}  {rate:>15.0f}  {rate / baseline:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
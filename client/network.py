@@ -1,9 +1,16 @@
 # client/network.py
 import socket
-import json
 import threading
 import time
 from typing import Callable, Optional
+from shared import codec
+from shared.messages import (
+    MSG_HELLO, MSG_HELLO_ACK, FEATURE_COMPACT_BOARD, FEATURE_BINARY_CODEC, FEATURE_DEFLATE,
+    encode_message, decode_message
+)
+
+# Optional protocol features this client asks the server for
+CLIENT_FEATURES = [FEATURE_COMPACT_BOARD, FEATURE_BINARY_CODEC, FEATURE_DEFLATE]
 
 class NetworkClient:
     """Handles network communication with the game server"""
@@ -17,6 +24,7 @@ class NetworkClient:
         self.receive_thread = None
         self.response_handlers = {}
         self.user_data = None
+        self.server_features = set()  # Features the server accepted in hello_ack
         
         # Game state information
         self.current_game_players = None
@@ -24,6 +32,15 @@ class NetworkClient:
         self.current_game_state = None
         self.current_room_code = None
         
+        # Optional hooks set by the game screen
+        self.on_move_made = None
+        self.on_move_rejected = None
+        self.on_game_over = None
+        
+        # make_move sequence numbers (per game) and callbacks waiting for their move_result
+        self._move_seq = 0
+        self._pending_moves = {}
+        
     def connect(self) -> bool:
         """Connect to the server"""
         try:
@@ -36,6 +53,9 @@ class NetworkClient:
             self.receive_thread = threading.Thread(target=self._receive_messages, daemon=True)
             self.receive_thread.start()
             
+            # Negotiate optional features; legacy servers simply ignore this
+            self.send_message(MSG_HELLO, {'features': CLIENT_FEATURES})
+            
             print(f"Connected to server at {self.host}:{self.port}")
             return True
             
@@ -60,18 +80,18 @@ class NetworkClient:
     
     def _receive_messages(self):
         """Thread function to receive messages from server"""
-        buffer = ""
+        decoder = codec.FrameDecoder()
         while self.running and self.connected:
             try:
-                data = self.socket.recv(1024*1024).decode('utf-8')
+                data = self.socket.recv(1024*1024)
                 if not data:
                     break
                 
-                buffer += data
-                while '\n' in buffer:
-                    line, buffer = buffer.split('\n', 1)
-                    if line.strip():
-                        self._handle_message(line.strip())
+                for message in decoder.feed(data):
+                    if isinstance(message, codec.CodecError):
+                        print(f"Failed to decode frame: {message}")
+                    elif isinstance(message, dict) or message.strip():
+                        self._handle_message(message)
                         
             except Exception as e:
                 if self.running:
@@ -81,41 +101,129 @@ class NetworkClient:
         self.connected = False
         self.running = False
     
-    def _handle_message(self, message_str: str):
-        """Handle incoming message from server"""
-        try:
-            message = json.loads(message_str)
-            msg_type = message.get('type')
-            payload = message.get('payload', {})
-            
-            print(f"Received message: {msg_type}")
-            
-            # Handle specific message types
-            if msg_type in self.response_handlers:
-                self.response_handlers[msg_type](payload)
-            
-            # Handle room update messages
-            if msg_type == 'room_update' and hasattr(self, 'on_room_update'):
-                self.on_room_update(payload)
-            
-            # Handle game start messages
-            if msg_type == 'game_start' and hasattr(self, 'on_game_start'):
-                self.current_game_players = payload.get('players', {})
-                self.current_game_player_info = payload.get('player_info', {})
-                self.current_game_state = payload.get('game_state', {})
-                self.on_game_start(payload)
-            
-            # Handle game update messages
-            if msg_type == 'game_update' and hasattr(self, 'on_game_update'):
-                self.current_game_state = payload.get('game_state', {})
+    def _handle_message(self, message_str):
+        """Handle incoming message from server (a JSON line or a decoded binary frame)"""
+        message = message_str if isinstance(message_str, dict) else decode_message(message_str)
+        if message is None:
+            print(f"Failed to parse message: {message_str!r}")
+            return
+        msg_type = message.get('type')
+        payload = message.get('payload', {})
+        
+        # Answer server heartbeats without involving the screens
+        if msg_type == 'ping':
+            if self.uses_binary_codec():
+                self._send_raw(codec.encode_pong())
+            else:
+                self.send_message('pong')
+            return
+        
+        print(f"Received message: {msg_type}")
+        
+        if msg_type == MSG_HELLO_ACK:
+            self.server_features = set(payload.get('features', []))
+        
+        # Handle specific message types
+        if msg_type in self.response_handlers:
+            self.response_handlers[msg_type](payload)
+        
+        # Handle room update messages
+        if msg_type == 'room_update' and hasattr(self, 'on_room_update'):
+            self.on_room_update(payload)
+        
+        # Handle game start messages
+        if msg_type == 'game_start':
+            self._move_seq = 0
+            self._pending_moves.clear()
+        if msg_type == 'game_start' and hasattr(self, 'on_game_start'):
+            self.current_game_players = payload.get('players', {})
+            self.current_game_player_info = payload.get('player_info', {})
+            self.current_game_state = payload.get('game_state', {})
+            self.on_game_start(payload)
+        
+        # Handle game update messages (full snapshots, also sent on resync)
+        if msg_type == 'game_update':
+            self.current_game_state = payload.get('game_state', {})
+            if hasattr(self, 'on_game_update'):
                 self.on_game_update(payload)
-            
-            # Handle move result messages  
-            if msg_type == 'move_made' and hasattr(self, 'on_move_made'):
-                self.on_move_made(payload)
-                
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse message: {e}")
+        
+        # Handle move deltas; a gap in versions triggers a full resync instead
+        if msg_type == 'move_applied':
+            if self._apply_move_delta(payload):
+                if self.on_move_made:
+                    self.on_move_made(payload)
+            elif payload.get('version', 0) > self._state_version():
+                self.resync()
+        
+        # Correlate move results with the make_move call that sent them
+        if msg_type == 'move_result':
+            callback = self._pending_moves.pop(payload.get('seq'), None)
+            if callback:
+                callback(payload)
+            if not payload.get('success'):
+                self._move_rejected(payload)
+        
+        if msg_type == 'invalid_move':
+            self._move_rejected(payload)
+        
+        if msg_type == 'game_over' and self.on_game_over:
+            self.on_game_over(payload)
+    
+    def _apply_move_delta(self, payload: dict) -> bool:
+        """Apply a move_applied delta to current_game_state; False if it is out of sequence"""
+        state = self.current_game_state
+        if not state or state.get('version', 0) + 1 != payload.get('version'):
+            return False
+        
+        color = payload['color']
+        squares = [payload['move']] + payload['flipped']
+        board = state.get('board')
+        if board:
+            for row, col in squares:
+                board[row][col] = color
+        board64 = state.get('board64')
+        if board64:
+            cells = list(board64)
+            symbol = 'B' if color == 'black' else 'W'
+            for row, col in squares:
+                cells[row * 8 + col] = symbol
+            state['board64'] = ''.join(cells)
+        state['turn'] = payload['turn']
+        state['scores'] = payload['scores']
+        state['version'] = payload['version']
+        return True
+    
+    def _move_rejected(self, payload: dict):
+        """A move was refused; resync first if the server is ahead of us"""
+        if payload.get('version', 0) > self._state_version():
+            self.resync()
+        if self.on_move_rejected:
+            self.on_move_rejected(payload)
+    
+    def _state_version(self) -> int:
+        return (self.current_game_state or {}).get('version', 0)
+    
+    def resync(self):
+        """Ask for every move after our state version (the server falls back to a full snapshot)"""
+        if self.current_game_state:
+            return self.send_message('resync', {'since': self._state_version()})
+        return self.send_message('resync')
+    
+    def uses_binary_codec(self) -> bool:
+        """True once the server has accepted the binary codec for hot messages"""
+        return FEATURE_BINARY_CODEC in self.server_features
+    
+    def _send_raw(self, data: bytes) -> bool:
+        """Send an already encoded message"""
+        if not self.connected:
+            print("Not connected to server")
+            return False
+        try:
+            self.socket.sendall(data)
+            return True
+        except Exception as e:
+            print(f"Failed to send message: {e}")
+            return False
     
     def send_message(self, msg_type: str, payload: dict = None):
         """Send a message to the server"""
@@ -124,13 +232,7 @@ class NetworkClient:
             return False
         
         try:
-            message = {
-                'type': msg_type,
-                'payload': payload if payload else {}
-            }
-            
-            message_str = json.dumps(message) + '\n'
-            self.socket.sendall(message_str.encode('utf-8'))
+            self.socket.sendall(encode_message(msg_type, payload if payload else {}))
             return True
             
         except Exception as e:
@@ -162,18 +264,33 @@ class NetworkClient:
     
     def login_user(self, username: str, password: str, callback: Callable):
         """Login user"""
+        self.register_handler('user_logged_in', self._login_handler(callback))
+        return self.send_message('login_user', {
+            'username': username,
+            'password': password
+        })
+    
+    def resume_session(self, callback: Callable):
+        """Authenticate this connection with the session token from an earlier login"""
+        token = self._session_token()
+        if not token:
+            return False
+        self.register_handler('user_logged_in', self._login_handler(callback))
+        return self.send_message('resume_session', {'token': token})
+    
+    def _login_handler(self, callback: Callable):
         def handle_response(payload):
             success = payload.get('success', False)
             user_data = payload.get('user') if success else None  # Changed from 'user_data' to 'user'
             if success and user_data:
-                self.user_data = user_data
+                # Screens pass user_data along, so the token travels with it to their connections
+                self.user_data = dict(user_data, session_token=payload.get('token'))
+                user_data = self.user_data
             callback(success, user_data)
-        
-        self.register_handler('user_logged_in', handle_response)
-        return self.send_message('login_user', {
-            'username': username,
-            'password': password
-        })
+        return handle_response
+    
+    def _session_token(self) -> Optional[str]:
+        return self.user_data.get('session_token') if self.user_data else None
     
     def create_room(self, callback: Callable):
         """Create a new game room"""
@@ -181,11 +298,10 @@ class NetworkClient:
             room_code = payload.get('room_code')
             callback(room_code)
         
-        # Include user info in create room request
+        # Identify this connection with the session token from login
         payload = {}
-        if self.user_data:
-            payload['user_data'] = self.user_data
-            print(f"Creating room with user data: {self.user_data}")
+        if self._session_token():
+            payload['session_token'] = self._session_token()
         
         self.register_handler('room_created', handle_response)
         return self.send_message('create_room', payload)
@@ -197,28 +313,76 @@ class NetworkClient:
             room_code = payload.get('room_code')
             callback(success, room_code)
         
-        # Include user info in join room request
+        # Identify this connection with the session token from login
         payload = {'room_code': room_code}
-        if self.user_data:
-            payload['user_data'] = self.user_data
-            print(f"Joining room with user data: {self.user_data}")
+        if self._session_token():
+            payload['session_token'] = self._session_token()
         
         self.register_handler('room_joined', handle_response)
         return self.send_message('join_room', payload)
     
+    def get_leaderboard(self, callback: Callable, offset: int = 0, limit: Optional[int] = None):
+        """Request a page of the leaderboard; `callback` receives [{'rank', 'username', 'score'}, ...]"""
+        self.register_handler('leaderboard_top', lambda payload: callback(payload.get('entries', [])))
+        payload = {'offset': offset}
+        if limit is not None:
+            payload['limit'] = limit
+        return self.send_message('leaderboard_top', payload)
+    
+    def get_rank(self, callback: Callable, username: Optional[str] = None):
+        """Request a user's rank (default: ours); `callback` receives (rank, score), both None if unranked"""
+        self.register_handler('leaderboard_rank',
+                              lambda payload: callback(payload.get('rank'), payload.get('score')))
+        return self.send_message('leaderboard_rank', {'username': username} if username else {})
+    
+    def list_rooms(self, callback: Callable, offset: int = 0, limit: Optional[int] = None,
+                   status: Optional[str] = None, search: Optional[str] = None):
+        """
+        Request a page of the lobby (default: rooms waiting for an opponent);
+        `callback` receives (total, [{'room_code', 'host', 'players', 'status'}, ...])
+        """
+        self.register_handler('room_list', lambda payload: callback(payload.get('total', 0), payload.get('rooms', [])))
+        payload = {'offset': offset}
+        for key, value in (('limit', limit), ('status', status), ('search', search)):
+            if value is not None:
+                payload[key] = value
+        return self.send_message('list_rooms', payload)
+    
+    def find_match(self, callback: Callable):
+        """
+        Join the matchmaking queue; `callback` receives (room_code, opponent)
+        once an opponent is found. The room then arrives like a joined one.
+        """
+        self.register_handler('match_found',
+                              lambda payload: callback(payload.get('room_code'), payload.get('opponent')))
+        payload = {}
+        if self._session_token():
+            payload['session_token'] = self._session_token()
+        return self.send_message('ready', payload)
+    
+    def cancel_match(self):
+        """Leave the matchmaking queue"""
+        self.remove_handler('match_found')
+        return self.send_message('ready', {'ready': False})
+    
     def make_move(self, row: int, col: int, callback: Callable = None):
-        """Make a game move"""
-        def handle_response(payload):
-            if callback:
-                callback(payload)
-        
+        """
+        Make a game move.
+        Each move carries a sequence number, so moves can be pipelined without
+        waiting for replies; `callback` receives this move's move_result payload
+        ({'seq', 'success', 'version'}).
+        """
+        self._move_seq += 1
+        seq = self._move_seq
         if callback:
-            self.register_handler('move_result', handle_response)
+            self._pending_moves[seq] = callback
         
         # Send move in the format expected by server - as list [row, col] in 0-based indexing
         move_data = [row - 1, col - 1]  # Convert to 0-based indexing for server
-        print(f"Sending move to server: row={row}, col={col}, move_data={move_data}")
-        return self.send_message('make_move', {'move': move_data})
+        print(f"Sending move to server: row={row}, col={col}, move_data={move_data}, seq={seq}")
+        if self.uses_binary_codec():
+            return self._send_raw(codec.encode_make_move(move_data[0], move_data[1], seq))
+        return self.send_message('make_move', {'move': move_data, 'seq': seq})
 
 # Global network client instance
 network_client = NetworkClient()
@@ -6,6 +6,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 from client.network import NetworkClient
 from client.constants import *
 
+# Maps compact board characters ('.', 'B', 'W') to grid values (0, 1, 2)
+_COMPACT_TO_CELLS = bytes.maketrans(b'.BW', bytes([0, 1, 2]))
+
 class Board:
     def __init__(self, size=8):
         self._current_player = 1  # 1 = black, 2 = white
@@ -634,20 +637,21 @@ class MultiplayerGameScreen:
                 self.update_board_from_server(game_state)
         
         def on_move_made(payload):
-            row = payload.get('row')
-            col = payload.get('col')
-            player = payload.get('player')
+            """Apply a move delta from the server: the move, flipped squares and next turn"""
+            row, col = payload['move']
+            piece = 1 if payload.get('color') == 'black' else 2
+            self.board._grid[row][col] = piece
+            for flip_row, flip_col in payload.get('flipped', []):
+                self.board._grid[flip_row][flip_col] = piece
             
-            if row is not None and col is not None:
-                # Update board state
-                if self.board.is_valid_move(row, col):
-                    self.board.make_move(row, col)
-                    self.your_turn = (self.board.get_current_player() == self.your_piece)
-                    self.waiting_for_opponent = not self.your_turn
-                    
-                    # Check if game is over
-                    if self.board.is_game_over():
-                        self.game_over = True
+            self.board._current_player = 1 if payload.get('turn') == 'black' else 2
+            self.your_turn = (self.board._current_player == self.your_piece)
+            self.waiting_for_opponent = not self.your_turn
+        
+        def on_move_rejected(payload):
+            """The server refused our move; hand the turn back if it is still ours"""
+            self.your_turn = (self.board._current_player == self.your_piece) and not self.game_over
+            self.waiting_for_opponent = not self.your_turn
         
         def on_game_over(payload):
             winner = payload.get('winner')
@@ -661,6 +665,8 @@ class MultiplayerGameScreen:
         self.network_client.on_game_update = on_game_update
         if hasattr(self.network_client, 'on_move_made'):
             self.network_client.on_move_made = on_move_made
+        if hasattr(self.network_client, 'on_move_rejected'):
+            self.network_client.on_move_rejected = on_move_rejected
         if hasattr(self.network_client, 'on_game_over'):
             self.network_client.on_game_over = on_game_over
         if hasattr(self.network_client, 'on_opponent_disconnected'):
@@ -996,6 +1002,7 @@ class MultiplayerGameScreen:
         
         # Get board data from server
         server_board = game_state.get('board', [])
+        board64 = game_state.get('board64')
         turn = game_state.get('turn', 'black')
         scores = game_state.get('scores', {'black': 2, 'white': 2})
         game_over = game_state.get('game_over', False)
@@ -1006,7 +1013,11 @@ class MultiplayerGameScreen:
         print(f"Scores: {scores}")
         print(f"Game over: {game_over}")
         
-        if server_board and len(server_board) == 8:
+        if board64 and len(board64) == 64:
+            # Compact board: translate all 64 cells at once, then slice into rows
+            cells = board64.encode('ascii').translate(_COMPACT_TO_CELLS)
+            self.board._grid = [list(cells[i:i + 8]) for i in range(0, 64, 8)]
+        elif server_board and len(server_board) == 8:
             # Update local board grid
             for i in range(8):
                 for j in range(8):
@@ -1017,7 +1028,8 @@ class MultiplayerGameScreen:
                         self.board._grid[i][j] = 2
                     else:
                         self.board._grid[i][j] = 0
-            
+        
+        if board64 or (server_board and len(server_board) == 8):
             # Update current player
             self.board._current_player = 1 if turn == 'black' else 2
             
@@ -3,9 +3,15 @@
 Othello board data structure and basic operations
 """
 
+from itertools import chain
 from typing import List, Tuple, Optional
 from shared.constants import BOARD_SIZE, EMPTY, BLACK, WHITE
 
+# One character per cell for compact board strings
+COMPACT_SYMBOLS = {EMPTY: '.', BLACK: 'B', WHITE: 'W'}
+COMPACT_VALUES = {symbol: value for value, symbol in COMPACT_SYMBOLS.items()}
+_CELLS_TO_COMPACT = bytes.maketrans(bytes([EMPTY, BLACK, WHITE]), b'.BW')
+
 class OthelloBoard:
     """
     Represents the Othello game board with basic operations
@@ -181,6 +187,34 @@ class OthelloBoard:
                     empty_cells.append((row, col))
         return empty_cells
     
+    def to_compact(self) -> str:
+        """
+        Encode the board as a row-major string with one character per cell
+        
+        Returns:
+            String of BOARD_SIZE * BOARD_SIZE characters ('.', 'B' or 'W')
+        """
+        # Cell values are small ints, so the whole board converts in C via bytes.translate
+        return bytes(chain.from_iterable(self.board)).translate(_CELLS_TO_COMPACT).decode('ascii')
+    
+    def load_compact(self, compact: str):
+        """
+        Set the board from a string produced by `to_compact`
+        
+        Args:
+            compact: Row-major string with one character per cell
+            
+        Raises:
+            ValueError: If the string has the wrong length or unknown characters
+        """
+        if len(compact) != self.size * self.size:
+            raise ValueError(f"Compact board must have {self.size * self.size} cells")
+        try:
+            cells = [COMPACT_VALUES[ch] for ch in compact]
+        except KeyError as e:
+            raise ValueError(f"Invalid compact cell: {e}")
+        self.board = [cells[row * self.size:(row + 1) * self.size] for row in range(self.size)]
+    
     def reset(self):
         """Reset the board to initial Othello position"""
         self.board = self._create_empty_board()
@@ -8,6 +8,14 @@ from typing import List, Tuple, Set
 from shared.constants import DIRECTIONS, EMPTY, BLACK, WHITE
 from .othello_board import OthelloBoard
 
+# Bitboards: bit (row * 8 + col) is set for each occupied square
+_FULL = (1 << 64) - 1
+_NOT_COL_0 = 0xFEFEFEFEFEFEFEFE  # Excludes squares a shift toward higher columns wrapped into
+_NOT_COL_7 = 0x7F7F7F7F7F7F7F7F  # Excludes squares a shift toward lower columns wrapped into
+# (shift, wrap mask) per direction; positive shifts move toward higher square indexes
+_BIT_DIRECTIONS = [(1, _NOT_COL_0), (-1, _NOT_COL_7), (8, _FULL), (-8, _FULL),
+                   (9, _NOT_COL_0), (7, _NOT_COL_7), (-7, _NOT_COL_0), (-9, _NOT_COL_7)]
+
 class OthelloRules:
     """
     Implements the core rules and logic for Othello game
@@ -148,6 +156,34 @@ class OthelloRules:
         
         return valid_moves
     
+    @staticmethod
+    def legal_moves_mask(player_bits: int, opponent_bits: int) -> int:
+        """
+        Get every valid move for a player at once, as a bitboard
+        
+        Args:
+            player_bits: Bitboard of the moving player's pieces
+            opponent_bits: Bitboard of the opponent's pieces
+            
+        Returns:
+            Bitboard with bit (row * 8 + col) set for each valid move
+        """
+        empty = ~(player_bits | opponent_bits) & _FULL
+        moves = 0
+        for shift, mask in _BIT_DIRECTIONS:
+            # Grow runs of opponent pieces out of our pieces, then step onto an empty square
+            if shift > 0:
+                run = (player_bits << shift) & mask & opponent_bits
+                for _ in range(5):
+                    run |= (run << shift) & mask & opponent_bits
+                moves |= (run << shift) & mask & empty
+            else:
+                run = (player_bits >> -shift) & mask & opponent_bits
+                for _ in range(5):
+                    run |= (run >> -shift) & mask & opponent_bits
+                moves |= (run >> -shift) & mask & empty
+        return moves
+    
     @staticmethod
     def has_valid_moves(board: OthelloBoard, player: int) -> bool:
         """
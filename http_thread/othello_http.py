@@ -3,7 +3,10 @@ import os
 import os.path
 import uuid
 import json
+import threading
 from glob import glob
+from itertools import islice
+from urllib.parse import urlsplit, parse_qs
 from datetime import datetime
 from board import Board
 
@@ -11,6 +14,12 @@ class OthelloHttpServer:
     def __init__(self):
         self.sessions = {}
         self.games = {}  # game_id -> game data
+        # Games waiting for a second player, in the order they opened; kept up to
+        # date by _refresh_lobby so the lobby never scans every game
+        self.open_games = {}  # game_id -> lobby entry
+        self._lobby_body = None  # Serialized default lobby response, None when stale
+        self._lobby_generation = 0  # Bumped on every lobby change, so a stale body is never cached
+        self._lobby_lock = threading.Lock()  # Request threads share open_games and the cached body
         self.waiting_players = []
         self.types = {}
         self.types['.pdf'] = 'application/pdf'
@@ -85,8 +94,8 @@ class OthelloHttpServer:
             # Extract session ID: /api/gamestate/session_id
             session_id = object_address[15:]
             return self.get_game_state(session_id)
-        elif object_address == '/api/lobby':
-            return self.get_lobby_info()
+        elif object_address == '/api/lobby' or object_address.startswith('/api/lobby?'):
+            return self.get_lobby_info(urlsplit(object_address).query)
         else:
             # Serve static files
             return self.serve_static_file(object_address)
@@ -508,6 +517,7 @@ class OthelloHttpServer:
             
             session['game_id'] = game_id
             session['player_color'] = 1
+            self._refresh_lobby(game_id)
             
             result = {
                 'success': True,
@@ -547,6 +557,7 @@ class OthelloHttpServer:
             game['players'][session_id] = {'name': session['player_name'], 'color': 2}
             session['game_id'] = game_id
             session['player_color'] = 2
+            self._refresh_lobby(game_id)
             
             result = {
                 'success': True,
@@ -596,6 +607,7 @@ class OthelloHttpServer:
                 if board.is_game_over():
                     game['game_over'] = True
                     game['winner'] = board.get_winner()
+                    self._refresh_lobby(game_id)
                 
                 result = {'success': True, 'message': 'Move successful'}
                 return self.response(200, 'OK', json.dumps(result), {'Content-Type': 'application/json'})
@@ -653,24 +665,56 @@ class OthelloHttpServer:
         
         return self.response(200, 'OK', json.dumps(result), {'Content-Type': 'application/json'})
 
-    def get_lobby_info(self):
-        """Get available games in lobby"""
-        available_games = []
-        
-        for game_id, game in self.games.items():
-            if len(game['players']) == 1 and not game['game_over']:
+    def _refresh_lobby(self, game_id):
+        """Update the lobby entry of one game after it was created, joined, left or finished"""
+        game = self.games.get(game_id)
+        with self._lobby_lock:
+            if game and len(game['players']) == 1 and not game['game_over']:
                 creator = list(game['players'].values())[0]['name']
-                available_games.append({
-                    'id': game_id,
-                    'creator': creator,
-                    'players': len(game['players'])
-                })
-        
+                self.open_games[game_id] = {'id': game_id, 'creator': creator, 'players': 1}
+            else:
+                self.open_games.pop(game_id, None)
+            self._lobby_body = None
+            self._lobby_generation += 1
+
+    def get_lobby_info(self, query=''):
+        """
+        Get available games in lobby. Optional query parameters: offset,
+        limit and creator (part of the creator's name). The plain request,
+        polled by every browser, is answered from a cached body.
+        """
+        params = parse_qs(query)
+        if not params:
+            with self._lobby_lock:
+                body = self._lobby_body
+                if body is None:
+                    games = list(self.open_games.values())
+                    generation = self._lobby_generation
+            if body is None:
+                body = json.dumps({'success': True, 'total': len(games), 'games': games})
+                with self._lobby_lock:
+                    # Keep the body only if no refresh landed while it was being built
+                    if self._lobby_generation == generation:
+                        self._lobby_body = body
+            return self.response(200, 'OK', body, {'Content-Type': 'application/json'})
+
+        try:
+            offset = max(0, int(params.get('offset', ['0'])[0]))
+            limit = max(1, min(int(params.get('limit', ['20'])[0]), 100))
+        except ValueError:
+            result = {'success': False, 'message': 'offset and limit must be numbers'}
+            return self.response(400, 'Bad Request', json.dumps(result), {'Content-Type': 'application/json'})
+
+        with self._lobby_lock:
+            games = list(self.open_games.values())
+        creator = params.get('creator', [''])[0].lower()
+        if creator:
+            games = [game for game in games if creator in game['creator'].lower()]
         result = {
             'success': True,
-            'games': available_games
+            'total': len(games),
+            'games': list(islice(games, offset, offset + limit))
         }
-        
         return self.response(200, 'OK', json.dumps(result), {'Content-Type': 'application/json'})
 
     def leave_game(self, post_body):
@@ -696,6 +740,7 @@ class OthelloHttpServer:
                 # If no players left, delete game
                 if len(game['players']) == 0:
                     del self.games[game_id]
+                self._refresh_lobby(game_id)
             
             # Clear session game info
             session['game_id'] = None
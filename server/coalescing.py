@@ -0,0 +1,53 @@
+# server/coalescing.py
+"""
+Per-connection write coalescing.
+
+While a thread is inside a `coalesce()` block, `User.send` only appends to the
+user's outbox; every touched user is flushed with a single `sendall` when the
+block exits. Outside a block, sends are flushed immediately.
+"""
+
+import threading
+from contextlib import contextmanager
+
+# Typical TCP payload per segment on Ethernet, used to estimate packet counts
+TCP_MSS = 1448
+
+_scope = threading.local()
+
+
+@contextmanager
+def coalesce():
+    """Defer flushing of every send made by this thread until the block exits"""
+    if getattr(_scope, 'pending', None) is not None:
+        # Nested block: the outermost one flushes
+        yield
+        return
+
+    pending = {}  # Used as an insertion-ordered set of users
+    _scope.pending = pending
+    try:
+        yield
+    finally:
+        _scope.pending = None
+        for user in pending:
+            user.flush()
+
+
+def defer_flush(user):
+    """
+    Register `user` for flushing at the end of the current block
+
+    Returns:
+        True if the flush was deferred, False if there is no active block
+    """
+    pending = getattr(_scope, 'pending', None)
+    if pending is None:
+        return False
+    pending[user] = None
+    return True
+
+
+def estimate_packets(num_bytes):
+    """Estimate the number of TCP segments needed to carry `num_bytes`"""
+    return max(1, -(-num_bytes // TCP_MSS))
@@ -0,0 +1,48 @@
+# server/compression.py
+"""
+Per-message deflate for clients that negotiated FEATURE_DEFLATE.
+
+Only JSON messages at least DEFLATE_THRESHOLD bytes long are compressed;
+small and binary-codec messages would barely shrink and are sent as is.
+Compression ratio and CPU time are recorded per message type.
+"""
+
+import threading
+import time
+
+from server.metrics import metrics
+from server.protocols import Protocol
+from shared import codec
+from shared.constants import DEFLATE_THRESHOLD
+from shared.messages import FEATURE_DEFLATE
+
+_totals_lock = threading.Lock()
+_totals = {}  # msg_type -> [bytes_in, bytes_out]
+
+
+def compress_for(message, features, threshold=DEFLATE_THRESHOLD):
+    """Return `message` as a deflate frame if the recipient's `features` allow it and it is worth it"""
+    if FEATURE_DEFLATE not in features or len(message) < threshold or message[:1] != b'{':
+        return message
+
+    started = time.perf_counter()
+    compressed = codec.deflate_message(message)
+    elapsed = time.perf_counter() - started
+
+    if len(compressed) >= len(message):
+        return message  # Incompressible; the plain line is cheaper to decode
+
+    msg_type = Protocol.peek_type(message) or 'unknown'
+    with _totals_lock:
+        totals = _totals.setdefault(msg_type, [0, 0])
+        totals[0] += len(message)
+        totals[1] += len(compressed)
+        ratio = totals[1] / totals[0]
+    metrics.incr_many((
+        ('compression.messages', 1),
+        (f'compression.bytes_in.{msg_type}', len(message)),
+        (f'compression.bytes_out.{msg_type}', len(compressed))
+    ))
+    metrics.set_gauge(f'compression.ratio.{msg_type}', round(ratio, 3))
+    metrics.observe(f'compression.cpu.{msg_type}', elapsed)
+    return compressed
@@ -1,12 +1,26 @@
 # server/game_manager.py
 import sys
 import os
+import threading
+from collections import OrderedDict
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from server.protocols import Protocol
+from server.compression import compress_for
+from server.metrics import metrics
 from game.othello_board import OthelloBoard
 from game.othello_rules import OthelloRules
+from shared.codec import board64_to_masks
 from shared.constants import BLACK, WHITE, EMPTY
+from shared.messages import (
+    FEATURE_COMPACT_BOARD, FEATURE_BINARY_CODEC,
+    ERROR_INVALID_MOVE, ERROR_NOT_YOUR_TURN, ERROR_GAME_NOT_ACTIVE, ERROR_STALE_MOVE
+)
+
+# Replies kept per player so retransmitted make_move seqs are answered, not re-applied
+MOVE_RESULT_WINDOW = 64
+# Largest make_move seq: the binary move_result carries it as a u32, and seqs start at 1
+MAX_MOVE_SEQ = 0xFFFFFFFF
 
 class RealOthelloGame:
     """Real Othello game implementation using proper game logic"""
@@ -16,9 +30,29 @@ class RealOthelloGame:
         self.current_turn = BLACK  # Black always goes first
         self.game_over = False
         self.winner = None
+        self.version = 0  # Incremented on every applied move
+        self.scores = {'black': 2, 'white': 2}  # Kept up to date incrementally
+        self.last_move = None  # (move, color, flipped pieces) of the latest move
+        self.move_log = []  # move_applied payloads; entry i produced version i + 1
+        self._compact_cache = (None, None)  # (version, compact board string)
+        self.legal_mask = self._legal_mask(BLACK)  # Valid moves for the side to move, one bit per square
     
-    def get_game_state(self):
-        """Get current game state in server format"""
+    def get_game_state(self, compact=False):
+        """
+        Get current game state in server format.
+        With `compact`, the board is a 64-character string under "board64"
+        (see OthelloBoard.to_compact) instead of nested lists of color names.
+        """
+        if compact:
+            return {
+                'board64': self.compact_board(),
+                'turn': 'black' if self.current_turn == BLACK else 'white',
+                'scores': dict(self.scores),
+                'game_over': self.game_over,
+                'winner': self.winner,
+                'version': self.version
+            }
+
         # Convert board to server format (string representation)
         board_state = []
         for row in range(8):
@@ -42,34 +76,52 @@ class RealOthelloGame:
             'turn': 'black' if self.current_turn == BLACK else 'white',
             'scores': {'black': black_count, 'white': white_count},
             'game_over': self.game_over,
-            'winner': self.winner
+            'winner': self.winner,
+            'version': self.version
         }
     
+    def compact_board(self):
+        """Compact board string, computed at most once per version"""
+        version, compact = self._compact_cache
+        if version != self.version:
+            compact = self.board.to_compact()
+            self._compact_cache = (self.version, compact)
+        return compact
+
+    def to_snapshot(self):
+        """Compact, JSON-serializable copy of the game for a server handoff"""
+        return {
+            'board': self.compact_board(),
+            'turn': 'black' if self.current_turn == BLACK else 'white',
+            'game_over': self.game_over,
+            'winner': self.winner,
+            'version': self.version,
+            'log': self.move_log
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Rebuild a game from `to_snapshot` output"""
+        game = cls()
+        game.board.load_compact(snapshot['board'])
+        game.current_turn = BLACK if snapshot['turn'] == 'black' else WHITE
+        game.game_over = snapshot['game_over']
+        game.winner = snapshot['winner']
+        game.version = snapshot.get('version', 0)
+        game.move_log = snapshot.get('log', [])
+        game._compact_cache = (None, None)  # Filled for the initial board by __init__
+        game.legal_mask = 0 if game.game_over else game._legal_mask(game.current_turn)
+        game.scores = {'black': game.board.count_pieces(BLACK), 'white': game.board.count_pieces(WHITE)}
+        return game
+
     def make_move(self, move, player_color):
-        """Make a move on the board"""
-        if self.game_over:
-            print(f"Game is over, cannot make move")
-            return False
-        
-        # Convert player color to internal representation
-        player = BLACK if player_color == 'black' else WHITE
-        
-        # Check if it's the player's turn
-        if player != self.current_turn:
-            print(f"Not {player_color}'s turn (current: {'black' if self.current_turn == BLACK else 'white'})")
+        """Make a move on the board; returns False if it is rejected (see rejection_reason)"""
+        if self.rejection_reason(move, player_color):
             return False
         
         r, c = move
-        print(f"Making move: {player_color} at ({r}, {c})")
-        
-        # Check if move is valid
-        if not OthelloRules.is_valid_move(self.board, r, c, player):
-            print(f"Invalid move: {player_color} at ({r}, {c})")
-            return False
-        
-        # Get pieces to flip
+        player = BLACK if player_color == 'black' else WHITE
         flipped_pieces = OthelloRules.get_flipped_pieces(self.board, r, c, player)
-        print(f"Flipping {len(flipped_pieces)} pieces: {flipped_pieces}")
         
         # Place the piece
         self.board.set_cell(r, c, player)
@@ -78,26 +130,67 @@ class RealOthelloGame:
         for flip_r, flip_c in flipped_pieces:
             self.board.set_cell(flip_r, flip_c, player)
         
+        opponent_color = 'white' if player_color == 'black' else 'black'
+        self.scores[player_color] += 1 + len(flipped_pieces)
+        self.scores[opponent_color] -= len(flipped_pieces)
+        self.version += 1
+        self.last_move = ((r, c), player_color, flipped_pieces)
+        
         # Switch turns
         self.current_turn = WHITE if self.current_turn == BLACK else BLACK
         
-        # Check for game over conditions
+        # Check for game over conditions (also refreshes legal_mask for the next turn)
         self._check_game_over()
         
-        print(f"Move successful, next turn: {'black' if self.current_turn == BLACK else 'white'}")
+        self.move_log.append({
+            'move': [r, c],
+            'color': player_color,
+            'flipped': [list(square) for square in flipped_pieces],
+            'turn': 'black' if self.current_turn == BLACK else 'white',
+            'scores': dict(self.scores),
+            'version': self.version
+        })
         return True
     
+    def rejection_reason(self, move, player_color):
+        """
+        Error code explaining why `move` by `player_color` would be rejected,
+        or None if it is valid. Validity is a single bit test against
+        legal_mask, which is computed once per turn.
+        """
+        if self.game_over:
+            return ERROR_GAME_NOT_ACTIVE
+        if player_color != ('black' if self.current_turn == BLACK else 'white'):
+            return ERROR_NOT_YOUR_TURN
+        try:
+            r, c = move
+        except (TypeError, ValueError):
+            return ERROR_INVALID_MOVE
+        if type(r) is not int or type(c) is not int or not (0 <= r < 8 and 0 <= c < 8):
+            return ERROR_INVALID_MOVE
+        if not (self.legal_mask >> (r * 8 + c)) & 1:
+            return ERROR_INVALID_MOVE
+        return None
+    
+    def moves_since(self, version):
+        """Logged move_applied payloads after `version`, or None if they are not all available"""
+        if not isinstance(version, int) or not 0 <= version <= self.version:
+            return None
+        start = version - (self.version - len(self.move_log))
+        if start < 0:
+            return None
+        return self.move_log[start:]
+
     def _check_game_over(self):
-        """Check if the game is over"""
-        # Check if current player has valid moves
-        current_has_moves = self._has_valid_moves(self.current_turn)
+        """Check if the game is over, passing the turn if the side to move has no moves"""
+        self.legal_mask = self._legal_mask(self.current_turn)
         
-        if not current_has_moves:
+        if not self.legal_mask:
             # Switch to other player and check
             other_player = WHITE if self.current_turn == BLACK else BLACK
-            other_has_moves = self._has_valid_moves(other_player)
+            self.legal_mask = self._legal_mask(other_player)
             
-            if not other_has_moves:
+            if not self.legal_mask:
                 # Neither player has moves - game over
                 self.game_over = True
                 self._determine_winner()
@@ -105,19 +198,17 @@ class RealOthelloGame:
                 # Current player has no moves, switch to other player
                 self.current_turn = other_player
     
-    def _has_valid_moves(self, player):
-        """Check if a player has any valid moves"""
-        for row in range(8):
-            for col in range(8):
-                if OthelloRules.is_valid_move(self.board, row, col, player):
-                    return True
-        return False
+    def _legal_mask(self, player):
+        """Bitboard of valid moves for a player"""
+        black, white = board64_to_masks(self.compact_board())
+        if player == BLACK:
+            return OthelloRules.legal_moves_mask(black, white)
+        return OthelloRules.legal_moves_mask(white, black)
     
     def _determine_winner(self):
         """Determine the winner based on piece count"""
-        game_state = self.get_game_state()
-        black_score = game_state['scores']['black']
-        white_score = game_state['scores']['white']
+        black_score = self.scores['black']
+        white_score = self.scores['white']
         
         if black_score > white_score:
             self.winner = 'black'
@@ -127,17 +218,27 @@ class RealOthelloGame:
             self.winner = None  # Tie
 
 class GameManager:
-    def __init__(self, room_code, players, user_manager):
+    def __init__(self, room_code, players, user_manager, game=None):
         self.room_code = room_code
         self.players = {p.user_id: p for p in players} # map user_id to player object
         self.user_manager = user_manager
-        self.game = RealOthelloGame()  # Use real Othello game instead of placeholder
         # In Othello, black always goes first, so assign first player as black
         self.player_colors = {
             players[0].user_id: 'black',   # First player is black (goes first)
             players[1].user_id: 'white'    # Second player is white
         }
-        self.start_game()
+        # Per-player make_move sequence numbers: the highest seen and recent encoded replies
+        self.last_seq = {}
+        self._move_results = {}
+        # Each player's connection thread calls in; a move changes the turn before it refreshes
+        # legal_mask, so moves and resyncs see the game one at a time
+        self.lock = threading.Lock()
+        if game is None:
+            self.game = RealOthelloGame()  # Use real Othello game instead of placeholder
+            self.start_game()
+        else:
+            # Resuming a game restored from a handoff snapshot; players already have the board
+            self.game = game
 
     def start_game(self):
         """Broadcasts the start of the game to both players."""
@@ -145,39 +246,128 @@ class GameManager:
         print(f"[GameManager-{self.room_code}] Players: {[(p.user_id, p.username) for p in self.players.values()]}")
         print(f"[GameManager-{self.room_code}] Player colors: {self.player_colors}")
         
-        initial_state = self.game.get_game_state()
-        start_message = Protocol.game_start(list(self.players.values()), initial_state)
-        print(f"[GameManager-{self.room_code}] Sending game_start message: {start_message}")
-        self.broadcast(start_message)
+        players = list(self.players.values())
+        print(f"[GameManager-{self.room_code}] Sending game_start message")
+        self.broadcast_state(lambda state: Protocol.game_start(players, state))
 
-    def handle_move(self, player, move_data):
-        """Handles a move request from a player."""
+    def handle_move(self, player, move_data, seq=None):
+        """
+        Handles a move request from a player.
+        With `seq` (increasing per player and game) the player gets a move_result,
+        and a retransmitted seq is answered again without applying the move twice.
+        """
+        with self.lock:
+            self._handle_move_locked(player, move_data, seq)
+
+    def _handle_move_locked(self, player, move_data, seq):
         player_color = self.player_colors.get(player.user_id)
         if not player_color:
             player.send(Protocol.error("You are not a player in this game."))
             return
 
-        if self.game.make_move(move_data, player_color):
-            print(f"[GameManager-{self.room_code}] Player {player.username} made a valid move.")
-            self.broadcast_game_update()
-            if self.game.game_over:
-                self.end_game()
+        if seq is not None:
+            if type(seq) is not int or not 1 <= seq <= MAX_MOVE_SEQ:
+                player.send(Protocol.error("Invalid move sequence number."))
+                return
+            results = self._move_results.setdefault(player.user_id, OrderedDict())
+            if seq in results:
+                metrics.incr('moves.duplicates')
+                player.send(results[seq])
+                return
+            if seq <= self.last_seq.get(player.user_id, 0):
+                # Older than the reply window; the client resyncs from the version
+                metrics.incr('moves.stale')
+                player.send(self._move_result(player, seq, ERROR_STALE_MOVE, self.game.version))
+                return
+
+        # Illegal moves are turned away by a bit test, before any flip search
+        reason = self.game.rejection_reason(move_data, player_color)
+        if seq is not None:
+            # Encoded before the move is applied, so a reply that cannot be built changes nothing
+            version = self.game.version + 1 if reason is None else self.game.version
+            reply = self._move_result(player, seq, reason, version)
+        if reason is None:
+            self.game.make_move(move_data, player_color)
+            metrics.incr('moves.applied')
+            self.broadcast_move_applied()
         else:
-            print(f"[GameManager-{self.room_code}] Player {player.username} made an invalid move.")
-            player.send(Protocol.error("Invalid move."))
+            metrics.incr(f'moves.rejected.{reason}')
+            if seq is None:
+                player.send(Protocol.invalid_move(reason, self.game.version,
+                                                  binary=FEATURE_BINARY_CODEC in player.features))
+
+        if seq is not None:
+            self.last_seq[player.user_id] = seq
+            results[seq] = reply
+            if len(results) > MOVE_RESULT_WINDOW:
+                results.popitem(last=False)
+            player.send(reply)
+
+        if reason is None and self.game.game_over:
+            self.end_game()
+
+    def _move_result(self, player, seq, reason, version):
+        """move_result for `seq` at game `version`; `reason` is None for an applied move"""
+        return Protocol.move_result(seq, reason is None, version, reason,
+                                    binary=FEATURE_BINARY_CODEC in player.features)
 
-    def broadcast_game_update(self):
-        """Sends the current game state to both players."""
-        update_message = Protocol.game_update(self.game.get_game_state())
-        self.broadcast(update_message)
+    def broadcast_move_applied(self):
+        """Sends only what the last move changed; clients apply it to their board."""
+        entry = self.game.move_log[-1]
+        self.broadcast_encoded(lambda features: _move_applied(entry, features))
+
+    def send_snapshot(self, player, since=None):
+        """
+        Sends a player that asked to resync every move after version `since`,
+        or the full game state when `since` is not given or too old.
+        """
+        features = player.features
+        with self.lock:
+            entries = self.game.moves_since(since) if since is not None else None
+            if entries is None:
+                state = self.state_for(features)
+        if entries is None:
+            metrics.incr('resync.full')
+            player.send(Protocol.game_update(state, binary=FEATURE_BINARY_CODEC in features))
+            return
+        metrics.incr('resync.incremental')
+        for entry in entries:
+            player.send(_move_applied(entry, features))
+
+    def state_for(self, features):
+        """Game state in the board format a client with `features` understands."""
+        compact = FEATURE_COMPACT_BOARD in features or FEATURE_BINARY_CODEC in features
+        return self.game.get_game_state(compact=compact)
+
+    def broadcast_state(self, build):
+        """Broadcasts a JSON message built from the game state by `build(state)`."""
+        self.broadcast_encoded(lambda features: build(self.state_for(features)))
+
+    def broadcast_encoded(self, build):
+        """
+        Broadcasts the message returned by `build(features)`.
+        It is serialized (and compressed) once per negotiated feature set in
+        the room, so legacy, compact-board and binary clients can play together.
+        """
+        encoded = {}
+        for player in self.players.values():
+            message = encoded.get(player.features)
+            if message is None:
+                message = encoded[player.features] = compress_for(build(player.features), player.features)
+            player.send(message)
 
     def end_game(self):
-        """Announces the end of the game and updates the winner's score."""
+        """Announces the end of the game, then queues the winner's score update."""
         winner_color = self.game.winner
         scores = self.game.get_game_state()['scores']
         
         print(f"[GameManager-{self.room_code}] Game over. Winner: {winner_color}")
 
+        # Players hear the result first; the score is committed in the background
+        self.broadcast(Protocol.game_over(winner_color, scores))
+        if self.user_manager.room_manager:
+            self.user_manager.room_manager.game_finished(self.room_code)
+
         winner_user_id = None
         for user_id, color in self.player_colors.items():
             if color == winner_color:
@@ -190,10 +380,13 @@ class GameManager:
                 points = scores[winner_color]
                 self.user_manager.update_user_score(winner_player.username, points)
 
-        end_message = Protocol.game_over(winner_color, scores)
-        self.broadcast(end_message)
-
     def broadcast(self, message):
-        """Sends a message to all players in the game."""
+        """Sends one pre-encoded message to all players in the game."""
         for player in self.players.values():
-            player.send(message)
\ No newline at end of file
+            player.send(message)
+
+
+def _move_applied(entry, features):
+    """Encode one move_log entry for a client with `features`"""
+    return Protocol.move_applied(entry['move'], entry['color'], entry['flipped'], entry['turn'],
+                                 entry['scores'], entry['version'], binary=FEATURE_BINARY_CODEC in features)
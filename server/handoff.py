@@ -0,0 +1,182 @@
+# server/handoff.py
+"""
+Zero-downtime restart with live game state handoff (Unix only).
+
+On SIGUSR2 the running server stops accepting and drains message handling.
+It then writes rooms, boards, turns, seats and per-connection state to a
+compact snapshot file. A new server process is started with the listening
+socket and every client socket passed as inherited file descriptors. The
+new process restores the snapshot, keeps serving the same connections and
+acknowledges over a pipe, after which the old process exits. If no
+acknowledgement arrives in time, the old process resumes serving.
+"""
+
+import json
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from server.metrics import metrics
+
+HANDOFF_ENV = 'OTHELLO_HANDOFF'          # Path of the snapshot file
+HANDOFF_ACK_ENV = 'OTHELLO_HANDOFF_ACK'  # Pipe fd the new process writes to when ready
+HANDOFF_TIMEOUT = 10  # Seconds to wait for the new process before aborting
+SNAPSHOT_VERSION = 2  # 2: read buffers are bytes (binary codec frames)
+
+
+def install_signal_handler(server):
+    """Trigger a handoff when the process receives SIGUSR2"""
+    if not hasattr(signal, 'SIGUSR2'):
+        print("[Handoff] SIGUSR2 is not available on this platform; handoff disabled.")
+        return
+
+    def handle_signal(signum, frame):
+        perform_handoff(server)
+
+    signal.signal(signal.SIGUSR2, handle_signal)
+
+
+def snapshot_server(server):
+    """Capture everything a new process needs to take over, as plain data"""
+    with server.user_manager.lock:
+        users = list(server.user_manager.users.values())
+    connections = []
+    for user in users:
+        connections.append({
+            'fd': user.connection.fileno(),
+            'address': list(user.address) if isinstance(user.address, tuple) else user.address,
+            'user_id': user.user_id,
+            'username': user.username,
+            'features': sorted(user.features),
+            'session_token': user.session_token,
+            'pending': user.pending.decode('latin-1')  # Raw bytes, possibly a partial frame
+        })
+    return {
+        'version': SNAPSHOT_VERSION,
+        'listen_fd': server.socket.fileno(),
+        'connections': connections,
+        'rooms': server.room_manager.to_snapshot(),
+        'sessions': server.user_manager.sessions.to_snapshot(),
+        'matchmaking': server.matchmaker.to_snapshot()
+    }
+
+
+def write_snapshot(state):
+    """Write a snapshot to a private temporary file and return its path"""
+    fd, path = tempfile.mkstemp(prefix='othello-handoff-', suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(state, f, separators=(',', ':'))
+    return path
+
+
+def perform_handoff(server):
+    """
+    Hand the listening socket, client connections and game state to a new process
+
+    Runs in the main thread (from the signal handler) while the accept loop is
+    paused. Exits the process on success; on failure the server keeps running.
+    """
+    started = time.monotonic()
+    print("[Handoff] Draining message handling...")
+    server.heartbeat.stop()
+    server.drain()
+    for user in list(server.user_manager.users.values()):
+        user.flush()
+    # Pending logins reply now; the new process loads users from the backing store
+    server.user_manager.password_hasher.wait_idle()
+    server.user_manager.score_committer.flush()
+    server.user_manager.store.flush()
+
+    state = snapshot_server(server)
+    path = write_snapshot(state)
+    fds = [state['listen_fd']] + [c['fd'] for c in state['connections']]
+    ack_read, ack_write = os.pipe()
+
+    env = dict(os.environ)
+    env[HANDOFF_ENV] = path
+    env[HANDOFF_ACK_ENV] = str(ack_write)
+    print(f"[Handoff] Starting new process with {len(state['connections'])} connections "
+          f"and {len(state['rooms'])} rooms")
+    child = None
+    try:
+        child = subprocess.Popen([sys.executable] + sys.argv, env=env,
+                                 pass_fds=fds + [ack_write])
+        os.close(ack_write)
+        ready, _, _ = select.select([ack_read], [], [], HANDOFF_TIMEOUT)
+        acknowledged = bool(ready) and os.read(ack_read, 1) == b'1'
+    except OSError as e:
+        print(f"[Handoff] Failed to start new process: {e}")
+        acknowledged = False
+    finally:
+        os.close(ack_read)
+
+    if acknowledged:
+        elapsed = (time.monotonic() - started) * 1000
+        print(f"[Handoff] New process {child.pid} took over in {elapsed:.1f} ms; exiting.")
+        # Skip normal cleanup: the connections now belong to the new process
+        os._exit(0)
+
+    print("[Handoff] New process did not acknowledge; resuming service.")
+    metrics.incr('handoff.aborted')
+    if child is not None and child.poll() is None:
+        child.kill()
+    if os.path.exists(path):
+        os.remove(path)
+    server.resume()
+    server.heartbeat.start()
+
+
+def restore_server(server, path):
+    """
+    Restore state handed off by a previous process into a fresh Server
+
+    Adopts the inherited listening socket, resumes every client connection on
+    its own handler thread and acknowledges to the previous process.
+    """
+    started = time.monotonic()
+    with open(path) as f:
+        state = json.load(f)
+    os.remove(path)
+    if state.get('version') not in (1, SNAPSHOT_VERSION):
+        raise ValueError(f"Unsupported handoff snapshot version: {state.get('version')}")
+
+    server.adopt_listener(socket.socket(fileno=state['listen_fd']))
+
+    restored = []
+    users_by_id = {}
+    for data in state['connections']:
+        connection = socket.socket(fileno=data['fd'])
+        address = tuple(data['address']) if isinstance(data['address'], list) else data['address']
+        user = server.user_manager.add_user(connection, address)
+        user.user_id = data['user_id']
+        user.username = data['username']
+        user.features = frozenset(data.get('features', ()))
+        user.session_token = data.get('session_token')
+        user.pending = data['pending'].encode('latin-1' if state['version'] >= 2 else 'utf-8')
+        restored.append(user)
+        users_by_id[user.user_id] = user
+
+    server.room_manager.restore_snapshot(state['rooms'], users_by_id)
+    server.user_manager.sessions.restore_snapshot(state.get('sessions', {}))
+    server.matchmaker.restore_snapshot(state.get('matchmaking', []), users_by_id)
+
+    for user in restored:
+        thread = threading.Thread(target=server.handle_client, args=(user.connection, user.address, user))
+        thread.daemon = True
+        thread.start()
+
+    elapsed = time.monotonic() - started
+    metrics.observe('handoff.restore', elapsed)
+    print(f"[Handoff] Restored {len(restored)} connections and {len(server.room_manager.rooms)} "
+          f"rooms in {elapsed * 1000:.1f} ms")
+
+    ack_fd = os.environ.pop(HANDOFF_ACK_ENV, None)
+    if ack_fd is not None:
+        os.write(int(ack_fd), b'1')
+        os.close(int(ack_fd))
@@ -0,0 +1,91 @@
+# server/heartbeat.py
+"""
+Server-driven heartbeats and idle connection reaping.
+
+A single timer thread scans every connection once per tick: quiet
+connections get a ping, and connections silent for longer than the timeout
+are shut down so their handler thread exits and frees the user's room seat.
+"""
+
+import socket
+import threading
+import time
+
+from server.protocols import Protocol
+from server.metrics import metrics
+from shared.constants import CONNECTION_TIMEOUT, HEARTBEAT_INTERVAL
+from shared.messages import FEATURE_BINARY_CODEC
+
+# Every ping is identical, so it is serialized once per codec
+_PING = Protocol.ping()
+_BINARY_PING = Protocol.ping(binary=True)
+
+
+class HeartbeatMonitor:
+    """Pings idle connections and reaps dead ones from one timer thread"""
+
+    def __init__(self, user_manager, interval=HEARTBEAT_INTERVAL, timeout=CONNECTION_TIMEOUT):
+        self.user_manager = user_manager
+        self.interval = interval
+        self.timeout = timeout
+        self.tasks = []  # Extra callables run once per tick
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the timer thread"""
+        if self._thread is None:
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the timer thread"""
+        self._stop.set()
+        self._thread = None
+
+    def add_task(self, callback):
+        """Run `callback()` on every tick of the timer thread"""
+        self.tasks.append(callback)
+
+    def _run(self, stop):
+        # Tick faster than the ping interval so timeouts are detected promptly
+        period = max(0.05, min(self.interval, self.timeout) / 2)
+        while not stop.wait(period):
+            self.tick()
+
+    def tick(self, now=None):
+        """Ping quiet connections and reap silent ones"""
+        now = time.monotonic() if now is None else now
+        with self.user_manager.lock:
+            users = list(self.user_manager.users.values())
+
+        for user in users:
+            idle = now - user.last_seen
+            if idle >= self.timeout:
+                self.reap(user)
+            elif idle >= self.interval and now - user.last_ping >= self.interval:
+                user.last_ping = now
+                user.send(_BINARY_PING if FEATURE_BINARY_CODEC in user.features else _PING)
+                metrics.incr('heartbeat.pings_sent')
+
+        metrics.set_gauge('connections.active', len(users))
+        for task in self.tasks:
+            try:
+                task()
+            except Exception as e:
+                print(f"[Heartbeat] Periodic task failed: {e}")
+
+    def reap(self, user):
+        """Shut down a silent connection; its handler thread cleans up the rest"""
+        if user.reaped:
+            return
+        user.reaped = True
+        print(f"[Heartbeat] Reaping idle connection {user.username or user.address}")
+        metrics.incr('heartbeat.reaped_connections')
+        if user.current_room:
+            metrics.incr('heartbeat.reclaimed_seats')
+        try:
+            user.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            user.connection.close()
@@ -0,0 +1,220 @@
+# server/leaderboard.py
+"""
+Score leaderboard with O(log n) updates, rank lookups and page reads.
+
+Users are kept in an indexable skip list ordered by (score descending,
+username). Every link records how many entries it skips, so the rank of an
+entry and the entry at a rank are both found in one O(log n) descent.
+The index is loaded from the user store at startup and updated as game
+results are committed.
+
+The first page (the top TOP_CACHE_SIZE) is the one almost everyone asks
+for. It is served from an encoded cache that is only rebuilt after a score
+change that moved someone into, out of or within it.
+"""
+
+import random
+import threading
+
+from server.metrics import metrics
+from server.protocols import Protocol
+
+MAX_LEVEL = 24        # Enough for ~16M users at p = 1/4
+LEVEL_PROBABILITY = 0.25
+TOP_CACHE_SIZE = 100  # Entries on the cached first page
+MAX_PAGE_SIZE = 100   # Largest page a client can request
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level  # Bottom-level steps to next[i] (to the end for None)
+
+
+class IndexableSkipList:
+    """Sorted container of unique keys with O(log n) insert, remove, rank and index"""
+
+    def __init__(self):
+        self._head = _Node(None, MAX_LEVEL)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _random_level(self):
+        level = 1
+        while level < MAX_LEVEL and random.random() < LEVEL_PROBABILITY:
+            level += 1
+        return level
+
+    def _predecessors(self, key):
+        """Last node before `key` on every level, with its 0-based position (head is 0)"""
+        update = [None] * MAX_LEVEL
+        positions = [0] * MAX_LEVEL
+        node, position = self._head, 0
+        for i in range(MAX_LEVEL - 1, -1, -1):
+            while node.next[i] is not None and node.next[i].key < key:
+                position += node.width[i]
+                node = node.next[i]
+            update[i] = node
+            positions[i] = position
+        return update, positions
+
+    def insert(self, key):
+        update, positions = self._predecessors(key)
+        new_position = positions[0] + 1
+        level = self._random_level()
+        node = _Node(key, level)
+        for i in range(level):
+            before = update[i]
+            node.next[i] = before.next[i]
+            before.next[i] = node
+            # Everything after the new node moved one place to the right
+            node.width[i] = positions[i] + before.width[i] + 1 - new_position
+            before.width[i] = new_position - positions[i]
+        for i in range(level, MAX_LEVEL):
+            update[i].width[i] += 1
+        self._size += 1
+
+    def remove(self, key):
+        update, _ = self._predecessors(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for i in range(MAX_LEVEL):
+            before = update[i]
+            if before.next[i] is node:
+                before.width[i] += node.width[i] - 1
+                before.next[i] = node.next[i]
+            else:
+                before.width[i] -= 1
+        self._size -= 1
+
+    def rank(self, key):
+        """0-based position of `key`"""
+        update, positions = self._predecessors(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        return positions[0]
+
+    def slice(self, start, count):
+        """Up to `count` keys starting at 0-based position `start`"""
+        if start >= self._size or count <= 0:
+            return []
+        target = start + 1
+        node, position = self._head, 0
+        for i in range(MAX_LEVEL - 1, -1, -1):
+            while node.next[i] is not None and position + node.width[i] <= target:
+                position += node.width[i]
+                node = node.next[i]
+        keys = []
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Leaderboard:
+    """Ranks users by score; thread-safe"""
+
+    def __init__(self, top_size=TOP_CACHE_SIZE):
+        self.top_size = top_size
+        self._index = IndexableSkipList()
+        self._scores = {}  # username -> score
+        self._lock = threading.Lock()
+        self._top_entries = None  # First page as payload entries, None when stale
+        self._top_encoded = {}    # limit -> encoded first page
+        self._generation = 0      # Bumped whenever the first page changes
+
+    def load(self, records):
+        """Index every user record, e.g. from UserStore.all_users()"""
+        for record in records:
+            self.update(record['username'], record.get('score', 0))
+
+    def update(self, username, score):
+        """Record a user's new total score"""
+        with self._lock:
+            old = self._scores.get(username)
+            if old == score:
+                return
+            if old is None:
+                old_rank = len(self._index)
+            else:
+                old_key = (-old, username)
+                old_rank = self._index.rank(old_key)
+                self._index.remove(old_key)
+            new_key = (-score, username)
+            self._index.insert(new_key)
+            self._scores[username] = score
+            if min(old_rank, self._index.rank(new_key)) < self.top_size:
+                self._top_entries = None
+                self._top_encoded = {}
+                self._generation += 1
+            metrics.set_gauge('leaderboard.size', len(self._scores))
+        metrics.incr('leaderboard.updates')
+
+    def update_many(self, scores):
+        """Apply {username: new score}; unknown users (None) are skipped"""
+        for username, score in scores.items():
+            if score is not None:
+                self.update(username, score)
+
+    def rank(self, username):
+        """(1-based rank, score) of `username`, or None"""
+        with self._lock:
+            score = self._scores.get(username)
+            if score is None:
+                return None
+            return self._index.rank((-score, username)) + 1, score
+
+    def top(self, offset=0, limit=MAX_PAGE_SIZE):
+        """Entries {'rank', 'username', 'score'} for ranks offset+1 .. offset+limit"""
+        with self._lock:
+            keys = self._index.slice(offset, limit)
+        return _entries(offset, keys)
+
+    def _top_entries_locked(self):
+        """The first page's entries; called with self._lock held"""
+        return _entries(0, self._index.slice(0, self.top_size))
+
+    def top_message(self, offset=0, limit=None):
+        """Encoded leaderboard_top reply (`limit` defaults to the cached page); the first page comes from the cache"""
+        offset = offset if isinstance(offset, int) and not isinstance(offset, bool) and offset > 0 else 0
+        if not isinstance(limit, int) or isinstance(limit, bool):
+            limit = self.top_size
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        if offset or limit > self.top_size:
+            return Protocol.leaderboard_top(offset, self.top(offset, limit))
+
+        with self._lock:
+            encoded = self._top_encoded.get(limit)
+            if encoded is not None:
+                metrics.incr('leaderboard.cache_hits')
+                return encoded
+            entries = self._top_entries
+            if entries is None:
+                entries = self._top_entries_locked()
+                metrics.incr('leaderboard.cache_rebuilds')
+            generation = self._generation
+        # Encode outside the lock; keep the result only if no update changed the page meanwhile
+        encoded = Protocol.leaderboard_top(0, entries[:limit])
+        with self._lock:
+            if self._generation == generation:
+                self._top_entries = entries
+                self._top_encoded[limit] = encoded
+        return encoded
+
+    def rank_message(self, username):
+        """Encoded leaderboard_rank reply for `username`"""
+        found = self.rank(username) if username else None
+        rank, score = found if found else (None, None)
+        return Protocol.leaderboard_rank(username, rank, score)
+
+
+def _entries(offset, keys):
+    return [{'rank': offset + i + 1, 'username': username, 'score': -negated}
+            for i, (negated, username) in enumerate(keys)]
@@ -0,0 +1,122 @@
+# server/lobby.py
+"""
+Room index for lobby listings.
+
+RoomManager updates the index whenever a room is created, joined or left
+and when its game finishes, so listing rooms never walks every room.
+Rooms are grouped by status (waiting for an opponent, playing, finished)
+in insertion-ordered dicts: a page of one status costs O(offset + limit),
+oldest room first. A search on the host's name scans that status only.
+
+The unfiltered first page of waiting rooms is what every lobby screen
+polls. It is served from an encoded cache that is only rebuilt after the
+waiting rooms change.
+"""
+
+import itertools
+import threading
+
+from server.metrics import metrics
+from server.protocols import Protocol
+
+LOBBY_WAITING = 'waiting'
+LOBBY_PLAYING = 'playing'
+LOBBY_FINISHED = 'finished'
+LOBBY_STATUSES = (LOBBY_WAITING, LOBBY_PLAYING, LOBBY_FINISHED)
+
+PAGE_SIZE = 20       # Rooms on a page when the client does not ask for a limit
+MAX_PAGE_SIZE = 100  # Largest page a client can request
+
+
+def room_status(room):
+    """Lobby status of a Room"""
+    if room.game_manager is None:
+        return LOBBY_WAITING
+    return LOBBY_FINISHED if room.game_manager.game.game_over else LOBBY_PLAYING
+
+
+class LobbyIndex:
+    """Rooms by status, in creation order; thread-safe"""
+
+    def __init__(self, page_size=PAGE_SIZE, lock=None):
+        self.page_size = page_size
+        self._rooms = {status: {} for status in LOBBY_STATUSES}  # status -> {room code: entry}
+        self._status = {}  # room code -> status
+        # RoomManager passes its own re-entrant lock, so a listing never sees a half-made change
+        self._lock = lock or threading.Lock()
+        self._first_page = {}  # limit -> encoded first page of waiting rooms
+        self._generation = 0   # Bumped whenever the waiting rooms change
+
+    def __len__(self):
+        return len(self._status)
+
+    def update(self, room):
+        """Record the current players and status of `room`"""
+        status = room_status(room)
+        entry = {
+            'room_code': room.code,
+            'host': room.players[0].username if room.players else None,
+            'players': len(room.players),
+            'status': status
+        }
+        with self._lock:
+            old_status = self._status.get(room.code)
+            if old_status is not None and old_status != status:
+                del self._rooms[old_status][room.code]
+            # Re-assigning an existing key keeps the room's place in the listing
+            self._rooms[status][room.code] = entry
+            self._status[room.code] = status
+            if LOBBY_WAITING in (old_status, status):
+                self._invalidate_locked()
+        metrics.incr('lobby.updates')
+
+    def remove(self, room_code):
+        with self._lock:
+            status = self._status.pop(room_code, None)
+            if status is None:
+                return
+            del self._rooms[status][room_code]
+            if status == LOBBY_WAITING:
+                self._invalidate_locked()
+        metrics.incr('lobby.updates')
+
+    def _invalidate_locked(self):
+        self._first_page = {}
+        self._generation += 1
+        metrics.set_gauge('lobby.waiting', len(self._rooms[LOBBY_WAITING]))
+
+    def page(self, status=LOBBY_WAITING, offset=0, limit=None, search=None):
+        """(total matching rooms, room entries from offset to offset + limit)"""
+        limit = self.page_size if limit is None else limit
+        with self._lock:
+            rooms = self._rooms[status].values()
+            if search:
+                search = search.lower()
+                matching = [entry for entry in rooms if entry['host'] and search in entry['host'].lower()]
+                return len(matching), [dict(entry) for entry in matching[offset:offset + limit]]
+            return len(rooms), [dict(entry) for entry in itertools.islice(rooms, offset, offset + limit)]
+
+    def page_message(self, status=None, offset=0, limit=None, search=None):
+        """Encoded room_list reply; arguments from the client are validated here"""
+        status = status if status in LOBBY_STATUSES else LOBBY_WAITING
+        offset = offset if isinstance(offset, int) and not isinstance(offset, bool) and offset > 0 else 0
+        if not isinstance(limit, int) or isinstance(limit, bool):
+            limit = self.page_size
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        search = search.strip()[:32] if isinstance(search, str) else None
+        if status != LOBBY_WAITING or offset or search:
+            return Protocol.room_list(status, offset, *self.page(status, offset, limit, search))
+
+        with self._lock:
+            encoded = self._first_page.get(limit)
+            if encoded is not None:
+                metrics.incr('lobby.cache_hits')
+                return encoded
+            generation = self._generation
+        metrics.incr('lobby.cache_rebuilds')
+        encoded = Protocol.room_list(status, 0, *self.page(status, 0, limit))
+        with self._lock:
+            # Keep the page only if no update landed while it was being built
+            if self._generation == generation:
+                self._first_page[limit] = encoded
+        return encoded
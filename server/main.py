@@ -11,6 +11,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from server.main_server import Server
+from server import handoff
 
 # Server configuration
 HOST = '0.0.0.0'  # Listen on all interfaces
@@ -23,11 +24,17 @@ def main():
     print("=" * 50)
     print(f"Starting server on {HOST}:{PORT}")
     print("Press Ctrl+C to stop the server")
+    print("Send SIGUSR2 for a zero-downtime restart")
     print("=" * 50)
     
     try:
         # Create and start the server
         server = Server(HOST, PORT)
+        snapshot_path = os.environ.pop(handoff.HANDOFF_ENV, None)
+        if snapshot_path:
+            # Started by a previous server process that is handing over
+            handoff.restore_server(server, snapshot_path)
+        handoff.install_signal_handler(server)
         server.start()
     except KeyboardInterrupt:
         print("\n[Main] Server stopped by user.")
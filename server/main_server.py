@@ -1,33 +1,81 @@
 # server/main_server.py
+import select
 import socket
 import threading
+import time
 from server.user_manager import UserManager
 from server.room_manager import RoomManager
+from server.matchmaking import Matchmaker
+from server.heartbeat import HeartbeatMonitor
+from server.protocols import Protocol
+from server.coalescing import coalesce
+from server.metrics import metrics
+from shared.codec import CodecError, split_frames
+from shared.messages import FEATURE_BINARY_CODEC, FEATURE_DEFLATE
 
 HOST = '0.0.0.0'
 PORT = 55555
+# Outbound writes are coalesced per handled message, so Nagle's algorithm
+# would only add latency on top of it.
+TCP_NODELAY = True
+
+# Admission control: over these limits the server answers with a fast
+# server_full rejection instead of slowing down everyone already playing.
+LISTEN_BACKLOG = 128
+MAX_CONNECTIONS = 1000
+MAX_ROOMS = 500
+MAX_INFLIGHT = 64  # Handler threads reading or processing a message at once
+MAX_MESSAGE_SIZE = 64 * 1024  # Longest JSON line or deflate frame a client may send; also caps its read buffer
 
 class Server:
-    def __init__(self, host, port):
+    def __init__(self, host, port, tcp_nodelay=TCP_NODELAY, max_connections=MAX_CONNECTIONS,
+                 max_rooms=MAX_ROOMS, max_inflight=MAX_INFLIGHT, listen_backlog=LISTEN_BACKLOG):
         self.host = host
         self.port = port
+        self.tcp_nodelay = tcp_nodelay
+        self.max_connections = max_connections
+        self.max_inflight = max_inflight
+        self.listen_backlog = listen_backlog
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listening = False  # True once bound, or after adopting a handed-off socket
+
+        # Message dispatch gate, closed while draining for a handoff
+        self.draining = False
+        self._inflight = 0
+        self._dispatch_cond = threading.Condition()
         
         # Initialize managers
         self.user_manager = UserManager()
-        self.room_manager = RoomManager(self.user_manager)
+        self.room_manager = RoomManager(self.user_manager, max_rooms=max_rooms)
         self.user_manager.room_manager = self.room_manager
+        self.matchmaker = Matchmaker(self.room_manager)
+        self.user_manager.matchmaker = self.matchmaker
+        self.heartbeat = HeartbeatMonitor(self.user_manager)
+        self.heartbeat.add_task(self.user_manager.sessions.sweep)
+        self.heartbeat.add_task(self.matchmaker.tick)  # Pairs players whose rating windows have widened
+
+    def adopt_listener(self, listener):
+        """Serve on an already listening socket inherited from a previous process."""
+        self.socket.close()
+        self.socket = listener
+        self.listening = True
 
     def start(self):
         """Binds the server and starts listening for connections."""
-        self.socket.bind((self.host, self.port))
-        self.socket.listen()
+        if not self.listening:
+            self.socket.bind((self.host, self.port))
+            self.socket.listen(self.listen_backlog)
+            self.listening = True
         print(f"[MainServer] Server started and listening on {self.host}:{self.port}")
+        self.heartbeat.start()
 
         try:
             while True:
                 connection, address = self.socket.accept()
+                if len(self.user_manager.users) >= self.max_connections:
+                    self._reject_connection(connection, address)
+                    continue
                 # Create a new thread for each client to handle their connection
                 thread = threading.Thread(target=self.handle_client, args=(connection, address))
                 thread.daemon = True
@@ -35,36 +83,127 @@ class Server:
         except KeyboardInterrupt:
             print("\n[MainServer] Shutting down.")
         finally:
+            self.heartbeat.stop()
             self.socket.close()
+            self.user_manager.close()  # Commits queued scores and flushes the user store
+
+    def _reject_connection(self, connection, address):
+        """Answer an over-capacity connection with server_full and close it, without a thread."""
+        metrics.incr('admission.rejected_connections')
+        print(f"[MainServer] Server full, rejecting {address}")
+        try:
+            connection.setblocking(False)
+            connection.send(_SERVER_FULL_CONNECTIONS)
+        except OSError:
+            pass
+        finally:
+            connection.close()
+
+    def drain(self):
+        """Close the dispatch gate and wait until no handler is reading or processing."""
+        with self._dispatch_cond:
+            self.draining = True
+            while self._inflight:
+                self._dispatch_cond.wait()
+
+    def resume(self):
+        """Reopen the dispatch gate after an aborted handoff."""
+        with self._dispatch_cond:
+            self.draining = False
+            self._dispatch_cond.notify_all()
 
-    def handle_client(self, connection, address):
+    def _enter_dispatch(self):
+        """Register a handler as in flight; returns True if the server is over capacity."""
+        with self._dispatch_cond:
+            while self.draining:
+                self._dispatch_cond.wait()
+            self._inflight += 1
+            metrics.set_gauge('admission.inflight', self._inflight)
+            return self._inflight > self.max_inflight
+
+    def _exit_dispatch(self):
+        with self._dispatch_cond:
+            self._inflight -= 1
+            if self._inflight == 0:
+                self._dispatch_cond.notify_all()
+
+    def handle_client(self, connection, address, user=None):
         """
         Manages a single client connection from start to finish.
+        `user` is given when resuming a connection handed off by a previous process.
         """
-        user = self.user_manager.add_user(connection, address)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if self.tcp_nodelay else 0)
+        if user is None:
+            user = self.user_manager.add_user(connection, address)
         
-        buffer = ""
         try:
+            # Finish any messages that were already buffered before a handoff
+            overloaded = self._enter_dispatch()
+            try:
+                self._process_pending(user, overloaded)
+            finally:
+                self._exit_dispatch()
+
             while True:
-                data = connection.recv(1024*1024).decode('utf-8')
-                if not data:
-                    break # Client disconnected
-                
-                buffer += data
-                # Messages are delimited by newlines
-                while '\n' in buffer:
-                    message, buffer = buffer.split('\n', 1)
-                    if message:
-                        self.user_manager.handle_message(user, message)
+                # Only read once the gate is open, so a handoff never strands bytes
+                # that were read but not yet processed.
+                _wait_readable(connection)
+                overloaded = self._enter_dispatch()
+                try:
+                    data = connection.recv(1024*1024)
+                    if not data:
+                        break # Client disconnected
+                    
+                    metrics.incr('net.recv_syscalls')
+                    user.last_seen = time.monotonic()
+                    user.pending += data
+                    self._process_pending(user, overloaded)
+                finally:
+                    self._exit_dispatch()
 
         except (ConnectionResetError, ConnectionAbortedError) as e:
             print(f"[MainServer] Connection with {address} was lost: {e}")
+        except CodecError as e:
+            metrics.incr('net.protocol_violations')
+            print(f"[MainServer] Dropping {address} for a protocol violation: {e}")
         except Exception as e:
             print(f"[MainServer] An unexpected error occurred with {address}: {e}")
         finally:
             print(f"[MainServer] Closing connection for {address}.")
-            self.user_manager.remove_user(user)
+            with coalesce():
+                self.user_manager.remove_user(user)
             connection.close()
+            if user.reaped:
+                metrics.incr('heartbeat.reclaimed_threads')
+
+    def _process_pending(self, user, overloaded=False):
+        """Handle every complete message in the user's read buffer, or shed them when overloaded."""
+        # JSON messages are delimited by newlines; negotiated binary frames are length-prefixed.
+        # Raises CodecError for an unnegotiated binary or deflate frame or a message over MAX_MESSAGE_SIZE.
+        messages, user.pending = split_frames(user.pending, allow_deflate=FEATURE_DEFLATE in user.features,
+                                              max_length=MAX_MESSAGE_SIZE,
+                                              allow_binary=FEATURE_BINARY_CODEC in user.features)
+        for message in messages:
+            # Replies and broadcasts caused by this message go out in one write per peer
+            with coalesce():
+                if overloaded:
+                    self.user_manager.shed_message(user, message)
+                else:
+                    self.user_manager.handle_message(user, message)
+
+
+_SERVER_FULL_CONNECTIONS = Protocol.server_full('connections')
+
+
+def _wait_readable(connection):
+    """Block until the socket has data, EOF or an error to report."""
+    if hasattr(select, 'poll'):
+        # poll has no FD_SETSIZE limit, unlike select
+        poller = select.poll()
+        poller.register(connection, select.POLLIN | select.POLLPRI)
+        poller.poll()
+    else:
+        select.select([connection], [], [connection])
 
 
 if __name__ == "__main__":
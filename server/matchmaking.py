@@ -0,0 +1,233 @@
+# server/matchmaking.py
+"""
+Rating-based matchmaking.
+
+A player who sends "ready" is queued by rating (their leaderboard score).
+Two queued players are paired when their ratings differ by no more than
+the match window of whichever has waited longer. The window starts at
+INITIAL_WINDOW and widens by WINDOW_GROWTH rating points per second of
+waiting, up to MAX_WINDOW, so a player far from everyone else is still
+matched eventually. Each pair gets a room from RoomManager and both players
+are told with match_found.
+
+The queue is an IndexableSkipList (see server/leaderboard.py) keyed by
+(rating, ticket number), so enqueue, cancel and finding a new player's
+nearest neighbours are O(log n). A new player is matched against their
+neighbours at once. Since windows only grow, the time at which each pair of
+neighbours will fit is known in advance; those times are kept in a heap,
+and the heartbeat thread's tick() only looks at pairs that have come due
+since, instead of walking the queue.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+from server.leaderboard import IndexableSkipList
+from server.metrics import metrics
+from server.protocols import Protocol
+from shared.messages import MSG_READY
+
+INITIAL_WINDOW = 50  # Rating difference accepted straight away
+WINDOW_GROWTH = 25   # Extra rating difference accepted per second waited
+MAX_WINDOW = 1000    # Widest window, reached after (MAX_WINDOW - INITIAL_WINDOW) / WINDOW_GROWTH seconds
+
+
+class _Ticket:
+    __slots__ = ('user', 'rating', 'key', 'enqueued_at')
+
+    def __init__(self, user, rating, number, enqueued_at):
+        self.user = user
+        self.rating = rating
+        self.key = (rating, number)
+        self.enqueued_at = enqueued_at
+
+
+class Matchmaker:
+    """Queue of players waiting for an opponent; thread-safe"""
+
+    def __init__(self, room_manager, initial_window=INITIAL_WINDOW, window_growth=WINDOW_GROWTH,
+                 max_window=MAX_WINDOW):
+        self.room_manager = room_manager
+        self.initial_window = initial_window
+        self.window_growth = window_growth
+        self.max_window = max_window
+        self._queue = IndexableSkipList()
+        self._tickets = {}  # user -> _Ticket
+        self._by_key = {}   # queue key -> _Ticket
+        self._numbers = itertools.count()
+        # (time their windows overlap, lower key, upper key) for queue neighbours. Entries for
+        # pairs that are no longer neighbours are dropped when they come due.
+        self._due = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def window(self, ticket, now):
+        """Largest rating difference `ticket` accepts after waiting until `now`"""
+        return min(self.max_window, self.initial_window + self.window_growth * (now - ticket.enqueued_at))
+
+    def _fits(self, a, b, now):
+        return abs(a.rating - b.rating) <= max(self.window(a, now), self.window(b, now))
+
+    def _due_at(self, a, b):
+        """When the longer-waiting of `a` and `b` first accepts the other, or None for never"""
+        gap = abs(a.rating - b.rating)
+        waited_since = min(a.enqueued_at, b.enqueued_at)
+        if gap > self.max_window:
+            return None
+        if gap <= self.initial_window:
+            return waited_since
+        if self.window_growth <= 0:
+            return None
+        return waited_since + (gap - self.initial_window) / self.window_growth
+
+    def enqueue(self, user, rating, now=None):
+        """
+        Queue `user` at `rating` and match them at once if a neighbour fits.
+        Returns False if the user was already queued.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if user in self._tickets:
+                return False
+            ticket = self._add_locked(user, rating, now)
+            candidates = [other for other in self._neighbours_locked(ticket.key)
+                          if other is not None and self._fits(ticket, other, now)]
+            pair = None
+            if candidates:
+                opponent = min(candidates, key=lambda other: abs(other.rating - rating))
+                pair = (opponent, ticket)  # The longer-waiting player gets the first seat
+                self._remove_locked(opponent)
+                self._remove_locked(ticket)
+            metrics.set_gauge('matchmaking.queue_depth', len(self._tickets))
+        metrics.incr('matchmaking.enqueued')
+        if pair:
+            self._start_match(pair, now)
+        return True
+
+    def cancel(self, user):
+        """Take `user` out of the queue; returns True if they were queued"""
+        with self._lock:
+            ticket = self._tickets.get(user)
+            if ticket is None:
+                return False
+            self._remove_locked(ticket)
+            metrics.set_gauge('matchmaking.queue_depth', len(self._tickets))
+        metrics.incr('matchmaking.cancelled')
+        return True
+
+    def tick(self, now=None):
+        """Pair neighbours whose windows now overlap; returns the number of matches"""
+        now = time.monotonic() if now is None else now
+        pairs = []
+        with self._lock:
+            early = []
+            while self._due and self._due[0][0] <= now:
+                entry = heapq.heappop(self._due)
+                lower, upper = self._by_key.get(entry[1]), self._by_key.get(entry[2])
+                if lower is None or upper is None or self._neighbours_locked(lower.key)[1] is not upper:
+                    continue
+                if not self._fits(lower, upper, now):
+                    early.append(entry)  # Due by a rounding error; looked at again next tick
+                    continue
+                pairs.append((lower, upper) if lower.enqueued_at <= upper.enqueued_at else (upper, lower))
+                self._remove_locked(lower)
+                self._remove_locked(upper)
+            for entry in early:
+                heapq.heappush(self._due, entry)
+            metrics.set_gauge('matchmaking.queue_depth', len(self._tickets))
+        for pair in pairs:
+            self._start_match(pair, now)
+        return len(pairs)
+
+    def _neighbours_locked(self, key):
+        """(ticket below `key`, ticket above it) in the queue; None where there is none"""
+        position = self._queue.rank(key)
+        start = max(position - 1, 0)
+        keys = self._queue.slice(start, 3)
+        index = position - start  # Where `key` sits in keys
+        below = self._by_key[keys[index - 1]] if index else None
+        above = self._by_key[keys[index + 1]] if index + 1 < len(keys) else None
+        return below, above
+
+    def _schedule_locked(self, lower, upper):
+        """Remember when the neighbours `lower` and `upper` will fit"""
+        if lower is None or upper is None:
+            return
+        due = self._due_at(lower, upper)
+        if due is not None:
+            heapq.heappush(self._due, (due, lower.key, upper.key))
+
+    def _add_locked(self, user, rating, enqueued_at):
+        ticket = _Ticket(user, rating, next(self._numbers), enqueued_at)
+        self._queue.insert(ticket.key)
+        self._tickets[user] = ticket
+        self._by_key[ticket.key] = ticket
+        below, above = self._neighbours_locked(ticket.key)
+        self._schedule_locked(below, ticket)
+        self._schedule_locked(ticket, above)
+        return ticket
+
+    def _remove_locked(self, ticket):
+        below, above = self._neighbours_locked(ticket.key)
+        self._queue.remove(ticket.key)
+        del self._tickets[ticket.user]
+        del self._by_key[ticket.key]
+        self._schedule_locked(below, above)  # They are neighbours now
+
+    def _start_match(self, pair, now):
+        """Seat a matched pair in a new room and tell both players"""
+        user_manager = self.room_manager.user_manager
+        # Holding the connection table lock means neither player can be removed mid-setup, and
+        # the room lock keeps room handlers from seating either player or joining the new room
+        with user_manager.lock, self.room_manager.lock:
+            present = [ticket for ticket in pair
+                       if ticket.user.connection in user_manager.users and ticket.user.current_room is None]
+            if len(present) < 2:
+                # One player left or found a room meanwhile; the other keeps their place in line
+                for ticket in present:
+                    with self._lock:
+                        if ticket.user not in self._tickets:
+                            self._add_locked(ticket.user, ticket.rating, ticket.enqueued_at)
+                return
+            first, second = pair
+            room_code = self.room_manager.create_room(first.user)
+            if room_code is None:
+                metrics.incr('admission.rejected_rooms')
+                for ticket in pair:
+                    ticket.user.send(Protocol.server_full('rooms', MSG_READY))
+                return
+            for ticket, opponent in ((first, second), (second, first)):
+                ticket.user.send(Protocol.match_found(room_code, opponent.user.username, opponent.rating))
+            # Seating the second player starts the game, so game_start follows match_found
+            self.room_manager.join_room(second.user, room_code)
+            room = self.room_manager.rooms[room_code]
+            update = Protocol.room_update(room_code, room.players)
+            for ticket in pair:
+                ticket.user.send(update)
+
+        metrics.incr('matchmaking.matches')
+        for ticket in pair:
+            metrics.observe('matchmaking.wait_time', now - ticket.enqueued_at)
+        print(f"[Matchmaker] Matched {first.user.username or first.user.user_id} ({first.rating}) with "
+              f"{second.user.username or second.user.user_id} ({second.rating}) in room {room_code}")
+
+    def to_snapshot(self, now=None):
+        """Queued players as [user_id, rating, seconds waited] for a handoff"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return [[ticket.user.user_id, ticket.rating, now - ticket.enqueued_at]
+                    for ticket in self._tickets.values()]
+
+    def restore_snapshot(self, entries, users_by_id, now=None):
+        """Requeue the players of `to_snapshot` output, keeping their waiting time"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for user_id, rating, waited in entries:
+                user = users_by_id.get(user_id)
+                if user is not None and user not in self._tickets:
+                    self._add_locked(user, rating, now - waited)
+            metrics.set_gauge('matchmaking.queue_depth', len(self._tickets))
@@ -0,0 +1,81 @@
+# server/metrics.py
+"""
+Process-wide counters, gauges and timings for the server.
+Subsystems record into the shared `metrics` instance; a snapshot is sent to
+clients that ask for `server_stats`.
+"""
+
+import threading
+
+
+class Metrics:
+    """Thread-safe registry of named counters, gauges and timings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}  # name -> [count, total_seconds, max_seconds]
+
+    def incr(self, name, amount=1):
+        """Add `amount` to a counter"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def incr_many(self, amounts):
+        """Add to several counters under one lock acquisition (for hot paths)"""
+        with self._lock:
+            counters = self._counters
+            for name, amount in amounts:
+                counters[name] = counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        """Record the current value of a gauge"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, seconds):
+        """Record one timing sample"""
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                self._timings[name] = [1, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                if seconds > timing[2]:
+                    timing[2] = seconds
+
+    def get(self, name, default=0):
+        """Return the current value of a counter or gauge"""
+        with self._lock:
+            if name in self._counters:
+                return self._counters[name]
+            return self._gauges.get(name, default)
+
+    def snapshot(self):
+        """Return a JSON-serializable copy of every metric"""
+        with self._lock:
+            timings = {}
+            for name, (count, total, peak) in self._timings.items():
+                timings[name] = {
+                    'count': count,
+                    'avg_ms': round(total / count * 1000, 3),
+                    'max_ms': round(peak * 1000, 3)
+                }
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'timings': timings
+            }
+
+    def reset(self):
+        """Clear every metric (used by tests and benchmarks)"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+
+
+# Global metrics instance
+metrics = Metrics()
@@ -0,0 +1,173 @@
+# server/password_hasher.py
+"""
+Salted, deliberately slow password hashing on a bounded worker pool.
+
+Hashes are bcrypt ("$2b$..."). Without the bcrypt package, which is listed
+in requirements.txt, PBKDF2-SHA256 from the standard library is used
+instead ("pbkdf2_sha256$<iterations>$<salt>$<hash>"). Both scale with the
+same cost factor. Unsalted SHA-256 hex digests from older user files are
+still accepted and are replaced with a current hash on the next login.
+
+Hashing runs on PasswordHasher's threads, never on a connection thread,
+so a burst of logins delays other logins rather than games in progress.
+Both bcrypt and hashlib release the GIL while hashing.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from server.metrics import metrics
+
+try:
+    import bcrypt
+except ImportError:
+    bcrypt = None
+
+HASH_ROUNDS = 12       # Cost factor: bcrypt log2 rounds; PBKDF2 uses PBKDF2_ITERATIONS_PER_ROUND << rounds
+PBKDF2_ITERATIONS_PER_ROUND = 150  # 12 rounds -> 614,400 iterations
+HASH_WORKERS = 4       # Passwords hashed at once
+MAX_QUEUED = 64        # Requests waiting for a worker before new ones are refused
+MAX_PASSWORD_BYTES = 72  # bcrypt only reads this much (bcrypt 5 refuses more); longer passwords are refused
+
+_PBKDF2_PREFIX = 'pbkdf2_sha256'
+
+
+def hash_password(password, rounds=HASH_ROUNDS):
+    """Salted slow hash of `password` in the preferred format"""
+    if bcrypt is not None:
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('ascii')
+    iterations = PBKDF2_ITERATIONS_PER_ROUND << rounds
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return '$'.join((_PBKDF2_PREFIX, str(iterations),
+                     base64.b64encode(salt).decode('ascii'), base64.b64encode(digest).decode('ascii')))
+
+
+def is_legacy_hash(stored):
+    """True for the unsalted SHA-256 hex digests written by older servers"""
+    return len(stored) == 64 and all(c in '0123456789abcdef' for c in stored)
+
+
+def verify_password(password, stored):
+    """Check `password` against a hash in any supported format"""
+    if not stored:
+        return False
+    encoded = password.encode('utf-8')
+    if stored.startswith('$2'):
+        # Older bcrypt releases silently used the first 72 bytes when the hash was made
+        return bcrypt is not None and bcrypt.checkpw(encoded[:MAX_PASSWORD_BYTES], stored.encode('ascii'))
+    if stored.startswith(_PBKDF2_PREFIX + '$'):
+        try:
+            _, iterations, salt, digest = stored.split('$')
+            expected = base64.b64decode(digest)
+            actual = hashlib.pbkdf2_hmac('sha256', encoded, base64.b64decode(salt), int(iterations))
+        except ValueError:
+            return False
+        return hmac.compare_digest(actual, expected)
+    if is_legacy_hash(stored):
+        return hmac.compare_digest(hashlib.sha256(encoded).hexdigest(), stored)
+    return False
+
+
+def needs_rehash(stored, rounds=HASH_ROUNDS):
+    """True if `stored` is not in the preferred format at the current cost"""
+    if bcrypt is not None:
+        return not stored.startswith(f'$2b${rounds:02d}$')
+    return not stored.startswith(f'{_PBKDF2_PREFIX}${PBKDF2_ITERATIONS_PER_ROUND << rounds}$')
+
+
+class PasswordHasher:
+    """
+    Bounded pool that hashes and verifies passwords off the connection threads.
+
+    hash() and verify() return at once; the callback runs on a worker thread
+    with the result, or with a failed result if hashing raised, so every
+    request is answered. They return False without queueing when
+    `max_queued` requests are already waiting, so the caller can refuse the
+    request.
+    """
+
+    def __init__(self, rounds=HASH_ROUNDS, workers=HASH_WORKERS, max_queued=MAX_QUEUED):
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hasher")
+        self._slots = threading.BoundedSemaphore(workers + max_queued)
+        self._queued = 0       # Waiting for a worker
+        self._outstanding = 0  # Waiting or running
+        self._idle = threading.Condition()
+
+    def hash(self, password, callback):
+        """Hash `password`; `callback(hashed)` runs when done, with None if hashing failed"""
+        return self._submit('hash', lambda: (self._timed_hash(password),), callback, (None,))
+
+    def verify(self, password, stored, callback):
+        """
+        Check `password` against `stored`; `callback(ok, upgraded)` runs when done.
+        `upgraded` is a fresh hash to store when `stored` is legacy or at an old cost, else None.
+        A malformed `stored` hash counts as a wrong password.
+        """
+        def work():
+            started = time.monotonic()
+            ok = verify_password(password, stored)
+            metrics.observe('auth.verify_time', time.monotonic() - started)
+            upgraded = None
+            if ok and needs_rehash(stored, self.rounds):
+                upgraded = self._timed_hash(password)
+            return ok, upgraded
+        return self._submit('verify', work, callback, (False, None))
+
+    def _timed_hash(self, password):
+        started = time.monotonic()
+        hashed = hash_password(password, self.rounds)
+        metrics.observe('auth.hash_time', time.monotonic() - started)
+        return hashed
+
+    def _submit(self, kind, work, callback, failed):
+        """Run `work` on the pool and pass its result tuple, or `failed` if it raised, to `callback`"""
+        if not self._slots.acquire(blocking=False):
+            metrics.incr('auth.rejected')
+            return False
+        with self._idle:
+            self._queued += 1
+            self._outstanding += 1
+            metrics.set_gauge('auth.queued', self._queued)
+        queued_at = time.monotonic()
+
+        def run():
+            started = time.monotonic()
+            with self._idle:
+                self._queued -= 1
+                metrics.set_gauge('auth.queued', self._queued)
+            metrics.observe('auth.queue_wait', started - queued_at)
+            try:
+                try:
+                    result = work()
+                except Exception as e:
+                    print(f"[PasswordHasher] {kind} failed: {e}")
+                    metrics.incr('auth.errors')
+                    result = failed
+                callback(*result)
+            except Exception as e:
+                print(f"[PasswordHasher] {kind} reply failed: {e}")
+            finally:
+                self._slots.release()
+                with self._idle:
+                    self._outstanding -= 1
+                    if not self._outstanding:
+                        self._idle.notify_all()
+
+        self._executor.submit(run)
+        return True
+
+    def wait_idle(self):
+        """Block until every submitted request has finished and replied"""
+        with self._idle:
+            self._idle.wait_for(lambda: not self._outstanding)
+
+    def close(self):
+        """Finish queued requests and stop the workers"""
+        self._executor.shutdown(wait=True)
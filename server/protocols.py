@@ -1,42 +1,90 @@
-import json
+import re
+
+from shared import codec
+from shared.messages import (
+    ERROR_SERVER_FULL, encode_message, decode_message,
+    UserRegisteredMessage, UserLoggedInMessage, ErrorMessage, HelloAckMessage,
+    RoomCreatedMessage, RoomJoinedMessage, RoomUpdateMessage, GameStartMessage,
+    GameUpdateMessage, MoveAppliedMessage, MoveResultMessage, InvalidMoveMessage, GameOverMessage,
+    PingMessage, PongMessage, LeaderboardTopMessage, LeaderboardRankMessage, ReadyMessage, MatchFoundMessage,
+    RoomListMessage
+)
+
+# The leading "type" field of a JSON message; encode_message always serializes it first
+_TYPE_PREFIX = re.compile(rb'\s*\{\s*"type"\s*:\s*"([A-Za-z_]{1,32})"')
 
 class Protocol:
     @staticmethod
     def create_message(msg_type, payload):
-        """Creates a JSON message string."""
-        return json.dumps({"type": msg_type, "payload": payload})
+        """
+        Creates a wire-ready message: UTF-8 JSON terminated by a newline.
+        Built once per event and shared by every recipient, so broadcasts
+        never re-serialize or re-encode per player.
+        """
+        return encode_message(msg_type, payload)
 
     @staticmethod
-    def parse_message(data_str):
-        """Parses a JSON message string into a dictionary."""
-        try:
-            return json.loads(data_str)
-        except json.JSONDecodeError:
+    def decode_message(data):
+        """
+        Decodes one item from codec.split_frames: binary frames arrive already
+        decoded, JSON lines are parsed. Returns None if the message is malformed.
+        """
+        if isinstance(data, dict):
+            return data
+        if isinstance(data, codec.CodecError):
             return None
+        return Protocol.parse_message(data)
+
+    @staticmethod
+    def peek_type(data):
+        """
+        Message type of a raw JSON line or decoded binary frame without a full
+        parse, or None if it cannot be read from the start of the message.
+        """
+        if isinstance(data, dict):
+            return data.get("type")
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        elif not isinstance(data, bytes):
+            return None  # A binary frame that failed to decode
+        match = _TYPE_PREFIX.match(data)
+        return match.group(1).decode('ascii') if match else None
+
+    @staticmethod
+    def parse_message(data_str):
+        """Parses a JSON message (str or bytes) into a dictionary."""
+        return decode_message(data_str)
 
     # --- S2C (Server-to-Client) Message Creators ---
     @staticmethod
     def user_registered(success, user_id):
-        return Protocol.create_message("user_registered", {"success": success, "user_id": user_id})
+        return UserRegisteredMessage(success, user_id).encode()
 
     @staticmethod
-    def user_logged_in(success, user_data=None):
-        payload = {"success": success}
-        if user_data:
-            payload["user"] = user_data
-        return Protocol.create_message("user_logged_in", payload)
+    def user_logged_in(success, user_data=None, token=None):
+        return UserLoggedInMessage(success, user_data or None, token).encode()
 
     @staticmethod
-    def error(message):
-        return Protocol.create_message("error", {"message": message})
+    def error(message, code=None):
+        return ErrorMessage(message, code or None).encode()
+
+    @staticmethod
+    def hello_ack(features):
+        return HelloAckMessage(sorted(features)).encode()
+
+    @staticmethod
+    def server_full(resource, msg_type=None):
+        """Structured load-shedding rejection; `resource` names the exhausted limit."""
+        return ErrorMessage("Server is at capacity, please retry shortly.",
+                            ERROR_SERVER_FULL, resource, msg_type or None).encode()
 
     @staticmethod
     def room_created(room_code):
-        return Protocol.create_message("room_created", {"room_code": room_code})
+        return RoomCreatedMessage(room_code).encode()
     
     @staticmethod
     def room_joined(success, room_code):
-        return Protocol.create_message("room_joined", {"success": success, "room_code": room_code})
+        return RoomJoinedMessage(success, room_code).encode()
 
     @staticmethod
     def room_update(room_code, players):
@@ -46,7 +94,7 @@ class Protocol:
                 'user_id': p.user_id,
                 'username': p.username or 'Unknown'
             })
-        return Protocol.create_message("room_update", {"room_code": room_code, "players": player_data})
+        return RoomUpdateMessage(room_code, player_data).encode()
 
     @staticmethod
     def game_start(players, game_state):
@@ -63,17 +111,73 @@ class Protocol:
                 'username': player.username or 'Unknown'
             }
         
-        return Protocol.create_message("game_start", {
-            "players": player_map, 
-            "player_info": player_info,
-            "game_state": game_state
-        })
+        return GameStartMessage(player_map, player_info, game_state).encode()
 
     @staticmethod
-    def game_update(game_state):
-        return Protocol.create_message("game_update", {"game_state": game_state})
+    def game_update(game_state, binary=False):
+        """With `binary`, game_state must be compact (see RealOthelloGame.get_game_state)."""
+        if binary:
+            return codec.encode_game_update(game_state)
+        return GameUpdateMessage(game_state).encode()
     
+    @staticmethod
+    def move_applied(move, color, flipped, turn, scores, version, binary=False):
+        """Delta update: the move, the squares it flipped and who moves next."""
+        if binary:
+            return codec.encode_move_applied(move, color, flipped, turn, scores, version)
+        return MoveAppliedMessage(list(move), color, [list(square) for square in flipped],
+                                  turn, scores, version).encode()
+
+    @staticmethod
+    def move_result(seq, success, version, reason=None, binary=False):
+        """Answer to a make_move carrying `seq`, with the state version after it."""
+        if binary:
+            return codec.encode_move_result(seq, success, version, reason)
+        return MoveResultMessage(seq, success, version, reason).encode()
+
+    @staticmethod
+    def invalid_move(reason, version, binary=False):
+        """Compact rejection of a make_move without a seq; `version` lets the client resync."""
+        if binary:
+            return codec.encode_invalid_move(reason, version)
+        return InvalidMoveMessage(reason, version).encode()
+
     @staticmethod
     def game_over(winner, scores):
-        return Protocol.create_message("game_over", {"winner": winner, "scores": scores})
+        return GameOverMessage(winner, scores).encode()
+
+    @staticmethod
+    def ping(binary=False):
+        if binary:
+            return codec.encode_ping()
+        return PingMessage().encode()
+
+    @staticmethod
+    def pong(binary=False):
+        if binary:
+            return codec.encode_pong()
+        return PongMessage().encode()
+
+    @staticmethod
+    def leaderboard_top(offset, entries):
+        return LeaderboardTopMessage(offset, entries).encode()
+
+    @staticmethod
+    def leaderboard_rank(username, rank=None, score=None):
+        return LeaderboardRankMessage(username, rank, score).encode()
+
+    @staticmethod
+    def room_list(status, offset, total, rooms):
+        return RoomListMessage(status, offset, total, rooms).encode()
+
+    @staticmethod
+    def ready(queued, rating=None):
+        return ReadyMessage(queued, rating).encode()
+
+    @staticmethod
+    def match_found(room_code, opponent, opponent_rating):
+        return MatchFoundMessage(room_code, opponent, opponent_rating).encode()
 
+    @staticmethod
+    def server_stats(stats):
+        return Protocol.create_message("server_stats", stats)
@@ -0,0 +1,101 @@
+# server/rate_limiter.py
+"""
+Token-bucket rate limiting per connection and per message type.
+Checked before a message is parsed past its type field, so floods are
+rejected cheaply.
+"""
+
+import time
+
+# Message type -> (tokens per second, burst size)
+RATE_LIMITS = {
+    'make_move': (10, 20),
+    'create_room': (0.5, 3),
+    'join_room': (1, 5),
+    'register_user': (0.2, 3),
+    'login_user': (0.5, 5),
+    'resume_session': (1, 5),
+    'ready': (1, 5),
+    'leaderboard_top': (2, 10),
+    'leaderboard_rank': (2, 10),
+    'list_rooms': (2, 10),
+    'server_stats': (1, 5),
+}
+# All message types combined, for a single connection
+CONNECTION_RATE_LIMIT = (50, 100)
+
+
+class TokenBucket:
+    """Classic token bucket refilled lazily on each check"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def consume(self, now, amount=1):
+        """Take `amount` tokens if available; returns False when throttled"""
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+
+class RateLimiter:
+    """Rate limits for one connection; buckets are created on first use"""
+
+    __slots__ = ('limits', 'connection_bucket', 'buckets', 'throttled')
+
+    def __init__(self, limits=RATE_LIMITS, connection_limit=CONNECTION_RATE_LIMIT):
+        self.limits = limits
+        self.connection_bucket = TokenBucket(*connection_limit)
+        self.buckets = {}
+        self.throttled = None  # Set of types currently being rejected, created on the first rejection
+
+    def allow(self, msg_type, now=None):
+        """
+        Check and consume the budget for one message
+
+        Returns:
+            Tuple of (allowed, first_rejection); `first_rejection` is True only
+            for the first rejected message of a throttled streak, so callers can
+            reply once instead of once per flooded message.
+        """
+        now = time.monotonic() if now is None else now
+        allowed = self.connection_bucket.consume(now) and self._consume_type(msg_type, now)
+        return self._result(msg_type, allowed)
+
+    def allow_type(self, msg_type, now=None):
+        """
+        Like allow(), but only charges the bucket of `msg_type`: for a message
+        whose type was only known after parsing it, and whose connection-wide
+        budget allow() already took
+        """
+        now = time.monotonic() if now is None else now
+        return self._result(msg_type, self._consume_type(msg_type, now))
+
+    def _consume_type(self, msg_type, now):
+        if msg_type not in self.limits:
+            return True
+        bucket = self.buckets.get(msg_type)
+        if bucket is None:
+            bucket = self.buckets[msg_type] = TokenBucket(*self.limits[msg_type], now=now)
+        return bucket.consume(now)
+
+    def _result(self, msg_type, allowed):
+        if allowed:
+            if self.throttled:
+                self.throttled.discard(msg_type)
+            return True, False
+        if self.throttled is None:
+            self.throttled = set()
+        first_rejection = msg_type not in self.throttled
+        self.throttled.add(msg_type)
+        return False, first_rejection
@@ -1,7 +1,9 @@
 # server/room_manager.py
 import random
 import string
-from server.game_manager import GameManager
+import threading
+from server.game_manager import GameManager, RealOthelloGame
+from server.lobby import LobbyIndex
 
 class Room:
     def __init__(self, room_code, user_manager):
@@ -33,42 +35,105 @@ class Room:
             self.game_manager = GameManager(self.code, self.players, self.user_manager)
 
 class RoomManager:
-    def __init__(self, user_manager):
+    def __init__(self, user_manager, max_rooms=None):
         self.rooms = {} # Maps room_code to Room object
         self.user_manager = user_manager
+        self.max_rooms = max_rooms  # None means unlimited
+        # Serializes room changes from handler threads and the matchmaker's heartbeat;
+        # re-entrant so a caller can hold it across several calls. Shared with the lobby.
+        self.lock = threading.RLock()
+        self.lobby = LobbyIndex(lock=self.lock)  # Kept in step with every change to self.rooms
+
+    def is_full(self):
+        return self.max_rooms is not None and len(self.rooms) >= self.max_rooms
 
     def create_room(self, player):
-        room_code = self._generate_room_code()
-        room = Room(room_code, self.user_manager)
-        self.rooms[room_code] = room
-        print(f"[RoomManager] Created room {room_code}")
-        self.join_room(player, room_code)
-        return room_code
+        """Creates a room and seats the player; returns None when the room limit is reached."""
+        with self.lock:
+            if self.is_full():
+                return None
+            room_code = self._generate_room_code()
+            room = Room(room_code, self.user_manager)
+            self.rooms[room_code] = room
+            print(f"[RoomManager] Created room {room_code}")
+            self.join_room(player, room_code)
+            return room_code
 
     def join_room(self, player, room_code):
-        room = self.rooms.get(room_code)
-        if not room:
-            return False, "Room not found."
-        
-        if room.add_player(player):
-            print(f"[RoomManager] Player {player.username} joined room {room_code}")
-            print(f"[RoomManager] Room {room_code} now has {len(room.players)} players")
-            if room.is_full():
-                print(f"[RoomManager] Room {room_code} is full, starting game...")
-                room.start_game()
-            return True, "Joined successfully."
-        else:
-            return False, "Room is full."
+        with self.lock:
+            room = self.rooms.get(room_code)
+            if not room:
+                return False, "Room not found."
+            if player.current_room:
+                return False, "Already in a room."
+
+            if room.add_player(player):
+                print(f"[RoomManager] Player {player.username} joined room {room_code}")
+                print(f"[RoomManager] Room {room_code} now has {len(room.players)} players")
+                if room.is_full():
+                    print(f"[RoomManager] Room {room_code} is full, starting game...")
+                    room.start_game()
+                self.lobby.update(room)
+                return True, "Joined successfully."
+            else:
+                return False, "Room is full."
 
     def leave_room(self, player):
-        room = player.current_room
-        if room and room.remove_player(player):
-            print(f"[RoomManager] Player {player.username} left room {room.code}")
-            if not room.players: # If room is empty, delete it
-                del self.rooms[room.code]
-                print(f"[RoomManager] Room {room.code} is empty and has been deleted.")
-            return True
-        return False
+        with self.lock:
+            room = player.current_room
+            if room and room.remove_player(player):
+                print(f"[RoomManager] Player {player.username} left room {room.code}")
+                if not room.players: # If room is empty, delete it
+                    del self.rooms[room.code]
+                    self.lobby.remove(room.code)
+                    print(f"[RoomManager] Room {room.code} is empty and has been deleted.")
+                else:
+                    self.lobby.update(room)
+                return True
+            return False
+
+    def to_snapshot(self):
+        """Rooms, seats and games as plain data for a server handoff"""
+        rooms = []
+        with self.lock:
+            for room in self.rooms.values():
+                game = None
+                move_seqs = {}
+                if room.game_manager:
+                    game = room.game_manager.game.to_snapshot()
+                    move_seqs = room.game_manager.last_seq
+                rooms.append({
+                    'code': room.code,
+                    'players': [p.user_id for p in room.players],  # Seat order is color order
+                    'game': game,
+                    'move_seqs': move_seqs
+                })
+        return rooms
+
+    def restore_snapshot(self, rooms, users_by_id):
+        """Recreate rooms from `to_snapshot` output, seating the given users"""
+        with self.lock:
+            for data in rooms:
+                room = Room(data['code'], self.user_manager)
+                for user_id in data['players']:
+                    player = users_by_id.get(user_id)
+                    if player:
+                        room.add_player(player)
+                if not room.players:
+                    continue
+                if data['game'] and room.is_full():
+                    game = RealOthelloGame.from_snapshot(data['game'])
+                    room.game_manager = GameManager(room.code, room.players, self.user_manager, game=game)
+                    room.game_manager.last_seq = dict(data.get('move_seqs', {}))
+                self.rooms[room.code] = room
+                self.lobby.update(room)
+
+    def game_finished(self, room_code):
+        """Called by GameManager when a game ends, to move the room to the finished listing"""
+        with self.lock:
+            room = self.rooms.get(room_code)
+            if room:
+                self.lobby.update(room)
 
     def get_room_by_player(self, player):
         return player.current_room
@@ -0,0 +1,96 @@
+# server/score_committer.py
+"""
+Background committer for game results.
+
+GameManager.end_game only enqueues the winner's points, so game_over is
+broadcast without waiting on storage. A single worker thread drains the
+queue, sums the points per user and applies each batch with one
+UserStore.add_scores call (one transaction in SQLite).
+"""
+
+import queue
+import threading
+import time
+
+from server.metrics import metrics
+
+MAX_BATCH = 256  # Most results committed in one storage call
+LINGER = 0.05    # Seconds to wait for more results before committing a batch
+
+_STOP = object()
+
+
+class ScoreCommitter:
+    """Queue-fed worker that commits score updates to a UserStore in batches"""
+
+    def __init__(self, store, max_batch=MAX_BATCH, linger=LINGER, on_commit=None):
+        self.store = store
+        self.on_commit = on_commit  # Called with {username: new score or None} after each batch
+        self.max_batch = max_batch
+        self.linger = linger
+        self.queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="score-committer", daemon=True)
+        self._worker.start()
+
+    def submit(self, username, points):
+        """Queue `points` for `username`; returns immediately"""
+        self.queue.put((username, points, time.monotonic()))
+        metrics.set_gauge('scores.queued', self.queue.qsize())
+
+    def flush(self):
+        """Block until every submitted result has been committed"""
+        self.queue.join()
+
+    def close(self):
+        """Commit what is queued and stop the worker"""
+        self.queue.put(_STOP)
+        self._worker.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is _STOP:
+                self.queue.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self.queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self._commit(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _commit(self, batch):
+        deltas = {}
+        for username, points, _ in batch:
+            deltas[username] = deltas.get(username, 0) + points
+
+        started = time.monotonic()
+        try:
+            scores = self.store.add_scores(deltas)
+        except Exception as e:
+            print(f"[ScoreCommitter] Failed to commit {len(batch)} results: {e}")
+            metrics.incr('scores.commit_errors')
+            return
+        finished = time.monotonic()
+
+        for username, score in scores.items():
+            if score is None:
+                print(f"[ScoreCommitter] User {username} not found, cannot update score.")
+        if self.on_commit:
+            self.on_commit(scores)
+        metrics.incr_many((('scores.batches', 1), ('scores.committed', len(batch))))
+        metrics.set_gauge('scores.queued', self.queue.qsize())
+        metrics.observe('scores.commit_latency', finished - started)
+        metrics.observe('scores.queue_delay', finished - batch[0][2])  # Oldest result in the batch
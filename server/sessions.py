@@ -0,0 +1,98 @@
+# server/sessions.py
+"""
+Server-issued session tokens.
+
+A successful login returns a random token. Later connections from the same
+client (each screen opens its own) present it with resume_session or in
+create_room/join_room, which costs one dict lookup instead of a password
+hash. Tokens live only in memory and expire after SESSION_TTL seconds
+without use; the heartbeat thread sweeps expired ones.
+"""
+
+import heapq
+import secrets
+import threading
+import time
+
+from server.metrics import metrics
+
+SESSION_TTL = 12 * 3600  # Seconds a token stays valid after its last use
+TOKEN_BYTES = 32
+
+
+class SessionTable:
+    """In-memory token -> username table with sliding expiry"""
+
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}  # token -> [username, expires_at]
+        self._expiry_heap = []  # (expires_at as issued, token); stale entries are re-checked on sweep
+        self._lock = threading.Lock()
+
+    def issue(self, username, now=None):
+        """Create a new token for `username`"""
+        now = time.monotonic() if now is None else now
+        token = secrets.token_urlsafe(TOKEN_BYTES)
+        expires_at = now + self.ttl
+        with self._lock:
+            self._sessions[token] = [username, expires_at]
+            heapq.heappush(self._expiry_heap, (expires_at, token))
+            metrics.set_gauge('sessions.active', len(self._sessions))
+        metrics.incr('sessions.issued')
+        return token
+
+    def resume(self, token, now=None):
+        """Username of a live session, extending its expiry, or None"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            session = self._sessions.get(token) if isinstance(token, str) else None
+            if session is None or session[1] <= now:
+                metrics.incr('sessions.rejected')
+                return None
+            session[1] = now + self.ttl
+        metrics.incr('sessions.resumed')
+        return session[0]
+
+    def revoke(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+            metrics.set_gauge('sessions.active', len(self._sessions))
+
+    def sweep(self, now=None):
+        """Drop expired sessions; cost is proportional to the expired count, not the table size"""
+        now = time.monotonic() if now is None else now
+        expired = 0
+        with self._lock:
+            heap = self._expiry_heap
+            while heap and heap[0][0] <= now:
+                _, token = heapq.heappop(heap)
+                session = self._sessions.get(token)
+                if session is None:
+                    continue  # Revoked
+                if session[1] > now:
+                    heapq.heappush(heap, (session[1], token))  # Used since it was queued
+                else:
+                    del self._sessions[token]
+                    expired += 1
+            metrics.set_gauge('sessions.active', len(self._sessions))
+        if expired:
+            metrics.incr('sessions.expired', expired)
+        return expired
+
+    def to_snapshot(self, now=None):
+        """Live sessions as {token: [username, seconds left]} for a handoff"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return {token: [username, expires_at - now]
+                    for token, (username, expires_at) in self._sessions.items() if expires_at > now}
+
+    def restore_snapshot(self, snapshot, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for token, (username, remaining) in snapshot.items():
+                self._sessions[token] = [username, now + remaining]
+                heapq.heappush(self._expiry_heap, (now + remaining, token))
+            metrics.set_gauge('sessions.active', len(self._sessions))
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,233 @@
+# server/user_admin.py
+"""
+Offline maintenance for the user store. Run it while the server is stopped.
+
+    python -m server.user_admin rebalance --backend sqlite --from-shards 1 --to-shards 8
+    python -m server.user_admin export --output users.jsonl
+    python -m server.user_admin import --input users.jsonl
+
+rebalance copies every user from one shard layout into another (see
+OTHELLO_USER_SHARDS in server/user_store.py), so the server can then start
+with the new shard count. The source files are left in place; delete them
+once the server runs on the new layout.
+
+export and import stream users as JSONL, one record per line, in batches.
+import also reads the old users.json format (--format json). Imported
+users replace stored users with the same username.
+
+With the sqlite backend, memory use of all three commands does not grow
+with the number of users. The other backends limit that: the journal
+backend holds every user in memory anyway, and the json backend rewrites
+its whole file for every batch, so large imports into it are slow. Move
+large user sets with sqlite.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# Allow running as a script from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.user_store import (USER_FIELDS, USER_STORES, USER_STORE_ENV, USER_SHARDS_ENV, iter_json_users,
+                               open_layout)
+
+BATCH_SIZE = 1000        # Users written per put_many
+PROGRESS_INTERVAL = 1.0  # Seconds between progress lines
+
+# Fields an imported record must carry; score defaults to 0 and created_at to None
+REQUIRED_FIELDS = ('user_id', 'username', 'email', 'password')
+
+
+class _Progress:
+    """Prints a running count to stderr at most every PROGRESS_INTERVAL seconds"""
+
+    def __init__(self, label):
+        self.label = label
+        self.started = self._last = time.monotonic()
+
+    def __call__(self, count, final=False):
+        now = time.monotonic()
+        if final or now - self._last >= PROGRESS_INTERVAL:
+            self._last = now
+            rate = count / max(now - self.started, 1e-9)
+            print(f"{self.label} {count} users ({rate:.0f}/s)", file=sys.stderr)
+
+
+def load(records, target, batch_size=BATCH_SIZE, progress=None):
+    """Write `records` into `target` with one put_many per batch; returns the number written"""
+    batch = []
+    written = 0
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            target.put_many(batch)
+            written += len(batch)
+            batch = []
+            if progress:
+                progress(written)
+    if batch:
+        target.put_many(batch)
+        written += len(batch)
+    target.flush()
+    return written
+
+
+def rebalance(source, target, batch_size=BATCH_SIZE, progress=None):
+    """Copy every user of `source` into `target` in batches; returns the number copied"""
+    return load(source.iter_users(), target, batch_size, progress)
+
+
+def export_users(store, out, progress=None):
+    """Write every user of `store` to the text stream `out` as JSONL; returns the number written"""
+    count = 0
+    for record in store.iter_users():
+        out.write(json.dumps(record, separators=(',', ':')) + '\n')
+        count += 1
+        if progress and count % BATCH_SIZE == 0:
+            progress(count)
+    return count
+
+
+def read_jsonl(lines):
+    """User records from JSONL lines; blank lines are skipped. Raises ValueError naming the bad line."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {number}: {e}") from None
+        yield _user_record(record, f"line {number}")
+
+
+def read_users_json(path):
+    """User records from a users.json file, parsed incrementally"""
+    try:
+        for number, record in enumerate(iter_json_users(path), 1):
+            yield _user_record(record, f"record {number}")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{path}: {e}") from None
+
+
+def _user_record(record, where):
+    """`record` reduced to USER_FIELDS, or ValueError if it is not a user"""
+    if not isinstance(record, dict):
+        raise ValueError(f"{where}: expected an object")
+    missing = [field for field in REQUIRED_FIELDS if not isinstance(record.get(field), str)]
+    if missing:
+        raise ValueError(f"{where}: missing {', '.join(missing)}")
+    user = {field: record.get(field) for field in USER_FIELDS}
+    user['score'] = record.get('score') or 0
+    return user
+
+
+def _rebalance_command(args):
+    if args.from_shards == args.to_shards:
+        print("Source and target layouts are the same; nothing to do.")
+        return 1
+    started = time.monotonic()
+    source = open_layout(args.backend, args.from_shards)
+    target = open_layout(args.backend, args.to_shards)
+    try:
+        if next(target.iter_users(), None) is not None:
+            print(f"The {args.to_shards}-shard layout already holds users; refusing to merge into it.")
+            return 1
+        copied = rebalance(source, target, progress=_Progress("Copied"))
+        stored = sum(1 for _ in target.iter_users())
+    finally:
+        source.close()
+        target.close()
+    if stored != copied:
+        print(f"Copied {copied} users but the target holds {stored}; check for duplicate usernames.")
+        return 1
+    print(f"Moved {copied} users from {args.from_shards} to {args.to_shards} {args.backend} shards "
+          f"in {time.monotonic() - started:.1f} s. Start the server with OTHELLO_USER_SHARDS={args.to_shards}.")
+    return 0
+
+
+def _open_stream(path, mode):
+    if path == '-':
+        return sys.stdout if mode == 'w' else sys.stdin
+    return open(path, mode, encoding='utf-8')
+
+
+def _export_command(args):
+    store = open_layout(args.backend, args.shards)
+    out = _open_stream(args.output, 'w')
+    progress = _Progress("Exported")
+    try:
+        count = export_users(store, out, progress)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        store.close()
+    progress(count, final=True)
+    return 0
+
+
+def _import_command(args):
+    input_format = args.format or ('json' if args.input.endswith('.json') else 'jsonl')
+    try:
+        lines = None if input_format == 'json' else _open_stream(args.input, 'r')
+        if lines is None:
+            open(args.input, 'rb').close()  # Report a missing file before the store is created
+    except OSError as e:
+        print(f"Cannot read {args.input}: {e.strerror}", file=sys.stderr)
+        return 1
+    store = open_layout(args.backend, args.shards)
+    progress = _Progress("Imported")
+    records = read_users_json(args.input) if lines is None else read_jsonl(lines)
+    try:
+        count = load(records, store, args.batch_size, progress)
+    except (ValueError, OSError) as e:  # json.JSONDecodeError is a ValueError
+        print(f"Import stopped at {e}; earlier batches were kept.", file=sys.stderr)
+        return 1
+    finally:
+        if lines not in (None, sys.stdin):
+            lines.close()
+        store.close()
+    progress(count, final=True)
+    return 0
+
+
+def _add_layout_arguments(parser):
+    parser.add_argument('--backend', choices=USER_STORES, default=os.environ.get(USER_STORE_ENV, 'sqlite'),
+                        help='Storage backend (default: $OTHELLO_USER_STORE or sqlite)')
+    parser.add_argument('--shards', type=int, default=int(os.environ.get(USER_SHARDS_ENV, 1)),
+                        help='Shard count (default: $OTHELLO_USER_SHARDS or 1)')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Othello user store maintenance')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    rebalance_parser = commands.add_parser('rebalance', help='Copy users into a different number of shards')
+    rebalance_parser.add_argument('--backend', choices=USER_STORES,
+                                  default=os.environ.get(USER_STORE_ENV, 'sqlite'),
+                                  help='Storage backend (default: $OTHELLO_USER_STORE or sqlite)')
+    rebalance_parser.add_argument('--from-shards', type=int, required=True, help='Current shard count')
+    rebalance_parser.add_argument('--to-shards', type=int, required=True, help='New shard count')
+    rebalance_parser.set_defaults(handler=_rebalance_command)
+
+    export_parser = commands.add_parser('export', help='Write every user as JSONL')
+    _add_layout_arguments(export_parser)
+    export_parser.add_argument('--output', default='-', help='JSONL file to write (default: stdout)')
+    export_parser.set_defaults(handler=_export_command)
+
+    import_parser = commands.add_parser('import', help='Add or replace users from JSONL or users.json')
+    _add_layout_arguments(import_parser)
+    import_parser.add_argument('--input', default='-', help='File to read (default: stdin)')
+    import_parser.add_argument('--format', choices=('jsonl', 'json'),
+                               help='Input format (default: json for *.json files, else jsonl)')
+    import_parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Users written per batch')
+    import_parser.set_defaults(handler=_import_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,88 +1,168 @@
 import uuid
 import threading
-import os
-import json
-import hashlib
+import time
 from datetime import datetime
 from server.protocols import Protocol
+from server.rate_limiter import RateLimiter
+from server.coalescing import defer_flush, estimate_packets
+from server.compression import compress_for
+from server.metrics import metrics
+from server.user_store import open_user_store
+from server.score_committer import ScoreCommitter
+from server.password_hasher import MAX_PASSWORD_BYTES, PasswordHasher
+from server.sessions import SessionTable
+from server.leaderboard import Leaderboard
+from shared.messages import ERROR_RATE_LIMITED, FEATURE_COMPACT_BOARD, FEATURE_BINARY_CODEC, FEATURE_DEFLATE
+
+# Optional protocol features this server can speak, negotiated with "hello"
+SUPPORTED_FEATURES = frozenset([FEATURE_COMPACT_BOARD, FEATURE_BINARY_CODEC, FEATURE_DEFLATE])
 
 class User:
+    """
+    State of one client connection. Slotted, because an idle server holds one
+    per open socket. The account itself (email, password hash, score) is not
+    copied here: it stays in the user store and is read when a reply needs it.
+    """
+
+    __slots__ = ('connection', 'address', 'user_id', 'username', 'current_room', 'last_seen', 'last_ping',
+                 'reaped', 'pending', 'rate_limiter', 'features', 'session_token', '_outbox', '_send_lock')
+
     def __init__(self, connection, address):
         self.connection = connection
         self.address = address
         self.user_id = str(uuid.uuid4())
         self.username = None
-        self.score = 0
         self.current_room = None
+        self.last_seen = time.monotonic()  # Updated on every read from the client
+        self.last_ping = 0.0
+        self.reaped = False
+        self.pending = b""  # Received bytes not yet split into messages
+        self.rate_limiter = RateLimiter()
+        self.features = frozenset()  # Negotiated protocol features; empty for legacy clients
+        self.session_token = None  # Set once the connection has logged in or resumed a session
+        self._outbox = []
+        self._send_lock = threading.Lock()
 
     def send(self, message):
-        """Sends a message to this user's client."""
-        try:
-            self.connection.sendall(message.encode('utf-8') + b'\n')
-        except (BrokenPipeError, ConnectionResetError):
-            print(f"Failed to send to {self.username or self.address}. Connection lost.")
-            # The main server loop will handle the disconnect.
+        """
+        Queues a message for this user's client and flushes it unless coalescing.
+        `message` is the wire-ready bytes built by Protocol; str is still accepted.
+        """
+        if isinstance(message, str):
+            message = message.encode('utf-8') + b'\n'
+        if self.features:
+            message = compress_for(message, self.features)
+        with self._send_lock:
+            self._outbox.append(message)
+        if not defer_flush(self):
+            self.flush()
+
+    def flush(self):
+        """Writes every queued message to the socket with a single sendall."""
+        with self._send_lock:
+            if not self._outbox:
+                return
+            count = len(self._outbox)
+            data = self._outbox[0] if count == 1 else b''.join(self._outbox)
+            self._outbox.clear()
+            try:
+                self.connection.sendall(data)
+            except (BrokenPipeError, ConnectionResetError, OSError):
+                print(f"Failed to send to {self.username or self.address}. Connection lost.")
+                # The main server loop will handle the disconnect.
+                return
+        metrics.incr_many((
+            ('net.send_syscalls', 1),
+            ('net.packets_out', estimate_packets(len(data))),
+            ('net.messages_out', count),
+            ('net.bytes_out', len(data))
+        ))
 
     def __str__(self):
         return f"User(id={self.user_id}, name={self.username})"
 
+# Replies with fixed content are serialized once
+_RATE_LIMITED_REPLY = Protocol.error("Rate limit exceeded.", ERROR_RATE_LIMITED)
+_PONG = Protocol.pong()
+_BINARY_PONG = Protocol.pong(binary=True)
+
 class UserManager:
-    def __init__(self):
+    def __init__(self, store=None, password_hasher=None):
         self.users = {} # Maps connection to User object
         self.room_manager = None # Will be set by Server after initialization
+        self.matchmaker = None  # Also set by Server; None disables "ready"
         self.lock = threading.Lock()
-        self.users_file = os.path.join(os.path.dirname(__file__), '..', 'data', 'users.json')
-        self._init_users_file()
+        self.store = store or open_user_store()  # Registered accounts
+        self.leaderboard = Leaderboard()
+        self.leaderboard.load(self.store.all_users())
+        self.score_committer = ScoreCommitter(self.store, on_commit=self.leaderboard.update_many)
+        self.password_hasher = password_hasher or PasswordHasher()
+        self.sessions = SessionTable()  # Swept by the heartbeat thread
 
-    def _init_users_file(self):
-        with self.lock:
-            if not os.path.exists(self.users_file):
-                # Create data directory if it doesn't exist
-                os.makedirs(os.path.dirname(self.users_file), exist_ok=True)
-                with open(self.users_file, 'w') as f:
-                    json.dump({}, f)
+    def _finish_registration(self, user, username, email, hashed_password):
+        """Store a new account once its password is hashed (runs on a hasher thread)"""
+        if hashed_password is None:
+            user.send(Protocol.user_registered(False, None))
+            return
+        user_data = {
+            "user_id": user.user_id,
+            "username": username,
+            "email": email,
+            "password": hashed_password, # Storing hashed password
+            "score": 0,
+            "created_at": datetime.now().isoformat()
+        }
+        # The insert is the uniqueness check, so two racing registrations cannot both win
+        if not self.store.add(user_data):
+            user.send(Protocol.user_registered(False, None))
+            return
 
-    def _save_user(self, user_data):
-        with self.lock:
-            try:
-                # Ensure the directory exists
-                os.makedirs(os.path.dirname(self.users_file), exist_ok=True)
-                
-                # Read existing users, or start with an empty dict if file doesn't exist/is empty
-                try:
-                    with open(self.users_file, 'r') as f:
-                        users = json.load(f)
-                except (FileNotFoundError, json.JSONDecodeError):
-                    users = {}
+        user.username = username
+        self.leaderboard.update(username, 0)
+
+        user.send(Protocol.user_registered(True, user.user_id))
 
-                # Add new user and write back, using username as the key
-                users[user_data['username']] = user_data
-                with open(self.users_file, 'w') as f:
-                    json.dump(users, f, indent=4)
+    def _finish_login(self, user, user_data, ok, upgraded):
+        """Complete a login once the password is verified (runs on a hasher thread)"""
+        if not ok:
+            user.send(Protocol.user_logged_in(False))
+            return
+
+        if upgraded:
+            # Legacy or outdated hash: replace it now that we know the password
+            self.store.set_password(user_data['username'], upgraded)
+            user_data['password'] = upgraded
+            metrics.incr('auth.upgraded')
+
+        self._authenticate(user, user_data, self.sessions.issue(user_data['username']))
+        user.send(Protocol.user_logged_in(True, _public_user(user_data), user.session_token))
+
+    def _resume_session(self, user, token):
+        """Authenticate `user` from a session token; returns the account or None"""
+        if not token:
+            return None
+        if user.session_token == token:
+            return self.store.get(user.username)
+        username = self.sessions.resume(token)
+        user_data = self.store.get(username) if username else None
+        if user_data:
+            self._authenticate(user, user_data, token)
+        return user_data
 
-            except IOError as e:
-                print(f"Error saving user data: {e}")
+    def _authenticate(self, user, user_data, token):
+        user.user_id = user_data['user_id']
+        user.username = user_data['username']
+        user.session_token = token
 
     def update_user_score(self, username, points_to_add):
-        users = self._load_users()
-        if username in users:
-            users[username]['score'] = users[username].get('score', 0) + points_to_add
-            try:
-                with open(self.users_file, 'w') as f:
-                    json.dump(users, f, indent=4)
-                print(f"[UserManager] Updated score for {username}. New score: {users[username]['score']}")
-            except IOError as e:
-                print(f"[UserManager] Error updating user score: {e}")
-        else:
-            print(f"[UserManager] User {username} not found, cannot update score.")
-
-    def _load_users(self):
-        with self.lock:
-            try:
-                with open(self.users_file, 'r') as f:
-                    return json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                return {}
+        """Queue a score update; it is committed in the background with other game results"""
+        self.score_committer.submit(username, points_to_add)
+
+    def close(self):
+        """Finish pending logins, commit queued game results and close the user store"""
+        self.password_hasher.close()
+        self.score_committer.close()
+        self.store.close()
 
     def add_user(self, connection, address):
         user = User(connection, address)
@@ -103,22 +183,61 @@ class UserManager:
                     for p in room.players:
                         p.send(update_msg)
                 
+                if self.matchmaker is not None:
+                    self.matchmaker.cancel(user)
                 del self.users[user.connection]
                 print(f"[UserManager] Removed user: {user.username or user.address}")
 
-    def handle_message(self, user, message_str):
-        """Routes a message from a user to the appropriate handler."""
-        message = Protocol.parse_message(message_str)
+    def shed_message(self, user, data):
+        """Rejects a message without handling it while the server is over capacity."""
+        msg_type = Protocol.peek_type(data)
+        if msg_type == "pong":
+            return  # Reading it already refreshed last_seen
+        metrics.incr('admission.shed_messages')
+        user.send(Protocol.server_full('workers', msg_type))
+
+    def _allow(self, user, msg_type, check):
+        """Apply a rate limiter `check` to one message; answers the first rejection of a streak"""
+        allowed, first_rejection = check(msg_type)
+        if not allowed:
+            msg_type = msg_type or 'unknown'
+            metrics.incr('ratelimit.throttled')
+            metrics.incr(f'ratelimit.throttled.{msg_type}')
+            if first_rejection:
+                metrics.incr('ratelimit.throttled_streaks')
+                user.send(_RATE_LIMITED_REPLY)
+        return allowed
+
+    def handle_message(self, user, data):
+        """
+        Routes a message from a user to the appropriate handler.
+        `data` is a JSON line (str or bytes) or a binary frame decoded by shared.codec.
+        """
+        # Rate limit on the type field alone, before paying for the JSON parse
+        peeked = Protocol.peek_type(data)
+        if not self._allow(user, peeked, user.rate_limiter.allow):
+            return
+
+        message = Protocol.decode_message(data)
         if not message:
             user.send(Protocol.error("Invalid message format."))
             return
 
         msg_type = message.get("type")
         payload = message.get("payload", {})
+        # "type" was not the first key, so its own bucket has not been charged yet
+        if peeked is None and isinstance(msg_type, str) and \
+                not self._allow(user, msg_type, user.rate_limiter.allow_type):
+            return
         
         print(f"[UserManager] Received from {user.username or user.user_id}: type={msg_type}")
 
-        if msg_type == "register_user":
+        if msg_type == "hello":
+            requested = payload.get("features") or []
+            user.features = SUPPORTED_FEATURES.intersection(requested)
+            user.send(Protocol.hello_ack(user.features))
+
+        elif msg_type == "register_user":
             username = payload.get("username")
             email = payload.get("email")
             password = payload.get("password")
@@ -126,31 +245,14 @@ class UserManager:
             if not all([username, email, password]):
                 user.send(Protocol.error("Username, email, and password are required."))
                 return
-
-            users = self._load_users()
-            if username in users:
-                user.send(Protocol.user_registered(False, None))
+            if not isinstance(password, str) or len(password.encode('utf-8')) > MAX_PASSWORD_BYTES:
+                user.send(Protocol.error(f"Password must be at most {MAX_PASSWORD_BYTES} bytes."))
                 return
 
-            hashed_password = hashlib.sha256(password.encode()).hexdigest()
-
-            user.username = username
-            user.email = email
-            user.password = hashed_password
-            user.score = 0
-            user.created_at = datetime.now().isoformat()
-
-            user_data = {
-                "user_id": user.user_id,
-                "username": user.username,
-                "email": user.email,
-                "password": hashed_password, # Storing hashed password
-                "score": user.score,
-                "created_at": user.created_at
-            }
-            self._save_user(user_data)
-
-            user.send(Protocol.user_registered(True, user.user_id))
+            # Hashing is slow on purpose; the reply is sent from the hasher pool
+            if not self.password_hasher.hash(
+                    password, lambda hashed: self._finish_registration(user, username, email, hashed)):
+                user.send(Protocol.server_full('auth', msg_type))
 
         elif msg_type == "login_user":
             username = payload.get("username")
@@ -160,64 +262,113 @@ class UserManager:
                 user.send(Protocol.error("Username and password are required."))
                 return
 
-            users = self._load_users()
-            logged_in_user = None
-            hashed_password_input = hashlib.sha256(password.encode()).hexdigest()
-
-            if username in users and users[username]['password'] == hashed_password_input:
-                user_data = users[username]
-                user.user_id = user_data['user_id']
-                user.username = user_data['username']
-                user.email = user_data['email']
-                user.password = user_data['password']
-                user.score = user_data['score']
-                user.created_at = user_data.get('created_at')
-                logged_in_user = user_data
-            
-            if logged_in_user:
-                user.send(Protocol.user_logged_in(True, logged_in_user))
+            user_data = self.store.get(username)
+            if not user_data:
+                user.send(Protocol.user_logged_in(False))
+                return
+
+            if not self.password_hasher.verify(
+                    password, user_data['password'],
+                    lambda ok, upgraded: self._finish_login(user, user_data, ok, upgraded)):
+                user.send(Protocol.server_full('auth', msg_type))
+
+        elif msg_type == "resume_session":
+            user_data = self._resume_session(user, payload.get("token"))
+            if user_data:
+                user.send(Protocol.user_logged_in(True, _public_user(user_data), user.session_token))
             else:
                 user.send(Protocol.user_logged_in(False))
 
         elif msg_type == "create_room":
-            # Get user_data from payload if provided
-            user_data = payload.get("user_data", {})
-            if user_data.get("username"):
-                user.username = user_data["username"]
-            if user_data.get("user_id"):
-                user.user_id = user_data["user_id"]
-            
-            room_code = self.room_manager.create_room(user)
-            user.send(Protocol.room_created(room_code))
-            # The join automatically sends a room_update
-            room = self.room_manager.get_room_by_player(user)
-            if room:
-                 update_msg = Protocol.room_update(room.code, room.players)
-                 user.send(update_msg)
+            # A fresh connection identifies itself with the token from its login
+            self._resume_session(user, payload.get("session_token"))
+
+            # Held until the replies are out, so the matchmaker cannot change the room meanwhile
+            with self.room_manager.lock:
+                if user.current_room:
+                    # Seating them elsewhere would strand the room they are in
+                    user.send(Protocol.error("You are already in a room."))
+                    return
+                room_code = self.room_manager.create_room(user)
+                if room_code is None:
+                    metrics.incr('admission.rejected_rooms')
+                    user.send(Protocol.server_full('rooms', msg_type))
+                    return
+                user.send(Protocol.room_created(room_code))
+                # The join automatically sends a room_update
+                room = self.room_manager.get_room_by_player(user)
+                if room:
+                     update_msg = Protocol.room_update(room.code, room.players)
+                     user.send(update_msg)
 
         elif msg_type == "join_room":
             room_code = payload.get("room_code")
-            # Get user_data from payload if provided
-            user_data = payload.get("user_data", {})
-            if user_data.get("username"):
-                user.username = user_data["username"]
-            if user_data.get("user_id"):
-                user.user_id = user_data["user_id"]
-            
-            success, message = self.room_manager.join_room(user, room_code)
-            user.send(Protocol.room_joined(success, room_code))
-            if success:
-                room = self.room_manager.get_room_by_player(user)
-                # Notify everyone in the room about the new player
-                update_msg = Protocol.room_update(room.code, room.players)
-                for p in room.players:
-                    p.send(update_msg)
-                print(f"[UserManager] Room {room_code} now has {len(room.players)} players: {[p.username for p in room.players]}")
+            # A fresh connection identifies itself with the token from its login
+            self._resume_session(user, payload.get("session_token"))
+
+            with self.room_manager.lock:
+                success, message = self.room_manager.join_room(user, room_code)
+                user.send(Protocol.room_joined(success, room_code))
+                if success:
+                    room = self.room_manager.get_room_by_player(user)
+                    # Notify everyone in the room about the new player
+                    update_msg = Protocol.room_update(room.code, room.players)
+                    for p in room.players:
+                        p.send(update_msg)
+                    print(f"[UserManager] Room {room_code} now has {len(room.players)} players: {[p.username for p in room.players]}")
+
+        elif msg_type == "ready":
+            # Matchmaking: queue at the player's leaderboard score, or leave the queue
+            self._resume_session(user, payload.get("session_token"))
+            if self.matchmaker is None:
+                user.send(Protocol.error("Matchmaking is not available."))
+            elif payload.get("ready", True) is False:
+                self.matchmaker.cancel(user)
+                user.send(Protocol.ready(False))
+            elif user.current_room:
+                user.send(Protocol.error("You are already in a room."))
+            else:
+                ranked = self.leaderboard.rank(user.username) if user.username else None
+                rating = ranked[1] if ranked else 0
+                # Acknowledge first: a waiting opponent may be found during enqueue
+                user.send(Protocol.ready(True, rating))
+                self.matchmaker.enqueue(user, rating)
+
+        elif msg_type == "ping":
+            user.send(_BINARY_PONG if FEATURE_BINARY_CODEC in user.features else _PONG)
+
+        elif msg_type == "pong":
+            pass  # last_seen is refreshed on every read
+
+        elif msg_type == "leaderboard_top":
+            user.send(self.leaderboard.top_message(payload.get("offset", 0), payload.get("limit")))
+
+        elif msg_type == "leaderboard_rank":
+            user.send(self.leaderboard.rank_message(payload.get("username") or user.username))
+
+        elif msg_type == "list_rooms":
+            user.send(self.room_manager.lobby.page_message(
+                payload.get("status"), payload.get("offset", 0), payload.get("limit"), payload.get("search")))
+
+        elif msg_type == "server_stats":
+            user.send(Protocol.server_stats(metrics.snapshot()))
 
         elif msg_type == "make_move":
             room = user.current_room
             if room and room.game_manager:
-                room.game_manager.handle_move(user, payload.get("move"))
+                room.game_manager.handle_move(user, payload.get("move"), payload.get("seq"))
             else:
                 user.send(Protocol.error("You are not in an active game."))
 
+        elif msg_type == "resync":
+            room = user.current_room
+            if room and room.game_manager:
+                room.game_manager.send_snapshot(user, payload.get("since"))
+            else:
+                user.send(Protocol.error("You are not in an active game."))
+
+
+
+def _public_user(user_data):
+    """Account fields safe to send to the client (no password hash)"""
+    return {key: value for key, value in user_data.items() if key != 'password'}
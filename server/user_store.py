@@ -0,0 +1,877 @@
+# server/user_store.py
+"""
+Persistent storage for registered user accounts.
+
+UserManager talks to a UserStore rather than to a file. SqliteUserStore is
+the default: username is the primary key and email is indexed, so
+registration, login and score updates each touch one row. JournalUserStore
+is the file-based alternative: an append-only journal of changes with
+periodic snapshots. JsonUserStore keeps the old data/users.json file, which
+is handy during development. The backend is picked with the
+OTHELLO_USER_STORE environment variable. With OTHELLO_USER_SHARDS=N the
+users are hash-partitioned over N independent stores (ShardedUserStore);
+server/user_admin.py moves users between layouts.
+
+The server puts a CachedUserStore in front of the backend, one per shard:
+every account is held in memory, so logins are a dict lookup, and changes
+are written behind in batches by a background thread. Each shard's cache
+has its own lock, dirty set and writer, so shards share no lock at all.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from server.metrics import metrics
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+JSON_PATH = os.path.join(DATA_DIR, 'users.json')
+SQLITE_PATH = os.path.join(DATA_DIR, 'users.db')
+SNAPSHOT_PATH = os.path.join(DATA_DIR, 'users.snapshot.json')
+JOURNAL_PATH = os.path.join(DATA_DIR, 'users.journal')
+
+USER_STORE_ENV = 'OTHELLO_USER_STORE'  # "sqlite" (default), "journal" or "json"
+USER_SHARDS_ENV = 'OTHELLO_USER_SHARDS'  # Number of hash partitions (default 1)
+
+FLUSH_INTERVAL = 1.0      # Seconds between write-behind flushes
+MAX_DIRTY = 1024          # Unflushed users before writers wait for the flush
+DIRTY_WAIT_TIMEOUT = 5.0  # Longest a writer waits on a full dirty set
+
+FSYNC_BATCH = 64           # Journal entries appended before an fsync is forced
+FSYNC_INTERVAL = 0.2       # Seconds before unsynced journal entries are fsynced anyway
+COMPACT_THRESHOLD = 10000  # Journal entries that trigger a new snapshot
+
+PAGE_SIZE = 1000       # Rows per query when streaming every user out of SQLite
+READ_CHUNK = 1 << 16   # Characters read at a time when streaming a users.json file
+IMPORT_BATCH = 1000    # Records per put_many when importing users.json into shards
+
+# Columns of a user record, in the order they are stored
+USER_FIELDS = ('user_id', 'username', 'email', 'password', 'score', 'created_at')
+
+
+class UserStore:
+    """Interface every user storage backend implements. Records are plain dicts keyed by USER_FIELDS."""
+
+    def get(self, username):
+        """The record for `username`, or None"""
+        raise NotImplementedError
+
+    def add(self, user_data):
+        """Store a new user. Returns False if the username is already taken."""
+        raise NotImplementedError
+
+    def add_score(self, username, points):
+        """Add `points` to a user's score and return the new score, or None for an unknown user"""
+        raise NotImplementedError
+
+    def set_password(self, username, password_hash):
+        """Replace a user's stored password hash"""
+        raise NotImplementedError
+
+    def add_scores(self, deltas):
+        """Apply {username: points} in one write; returns {username: new score or None}"""
+        return {username: self.add_score(username, points) for username, points in deltas.items()}
+
+    def all_users(self):
+        """Every stored record"""
+        raise NotImplementedError
+
+    def iter_users(self):
+        """Every stored record, one at a time; backends that page through storage override this"""
+        return iter(self.all_users())
+
+    def put_many(self, records):
+        """Insert or replace several records in one write"""
+        raise NotImplementedError
+
+    def flush(self):
+        """Make every accepted change durable"""
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonUserStore(UserStore):
+    """The whole user table in one JSON file, rewritten on every change. For development only."""
+
+    def __init__(self, path=JSON_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        with self.lock:
+            if not os.path.exists(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._write({})
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write(self, users):
+        with open(self.path, 'w') as f:
+            json.dump(users, f, indent=4)
+
+    def get(self, username):
+        with self.lock:
+            return self._read().get(username)
+
+    def add(self, user_data):
+        with self.lock:
+            users = self._read()
+            if user_data['username'] in users:
+                return False
+            users[user_data['username']] = user_data
+            self._write(users)
+            return True
+
+    def add_score(self, username, points):
+        with self.lock:
+            users = self._read()
+            if username not in users:
+                return None
+            users[username]['score'] = users[username].get('score', 0) + points
+            self._write(users)
+            return users[username]['score']
+
+    def add_scores(self, deltas):
+        with self.lock:
+            users = self._read()
+            scores = {}
+            for username, points in deltas.items():
+                if username in users:
+                    users[username]['score'] = users[username].get('score', 0) + points
+                    scores[username] = users[username]['score']
+                else:
+                    scores[username] = None
+            self._write(users)
+            return scores
+
+    def set_password(self, username, password_hash):
+        with self.lock:
+            users = self._read()
+            if username in users:
+                users[username]['password'] = password_hash
+                self._write(users)
+
+    def all_users(self):
+        with self.lock:
+            return list(self._read().values())
+
+    def put_many(self, records):
+        with self.lock:
+            users = self._read()
+            for record in records:
+                users[record['username']] = record
+            self._write(users)
+
+
+class SqliteUserStore(UserStore):
+    """
+    Users in an SQLite database in WAL mode.
+
+    On first open the rows of `json_path` are imported in one transaction;
+    PRAGMA user_version records that the migration ran, so it never repeats.
+    """
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path=SQLITE_PATH, json_path=JSON_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # One connection shared by the connection threads, serialized by self.lock
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints; safe with WAL
+        with self.lock:
+            if self.db.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+                self._create_schema(json_path)
+
+    def _create_schema(self, json_path):
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    username   TEXT PRIMARY KEY,
+                    user_id    TEXT NOT NULL,
+                    email      TEXT NOT NULL,
+                    password   TEXT NOT NULL,
+                    score      INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT
+                )""")
+            self.db.execute("CREATE INDEX IF NOT EXISTS users_email ON users (email)")
+            migrated = self._import_json(json_path) if json_path else 0
+            self.db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        if migrated:
+            print(f"[UserStore] Migrated {migrated} users from {json_path}")
+
+    def _import_json(self, json_path):
+        if not os.path.exists(json_path):
+            return 0
+        rows = (tuple(record.get(field) if field != 'score' else record.get('score', 0)
+                      for field in USER_FIELDS)
+                for record in iter_json_users(json_path))
+        # A malformed file imports nothing, as if it were absent
+        self.db.execute("SAVEPOINT import_json")
+        try:
+            cursor = self.db.executemany(
+                "INSERT OR IGNORE INTO users (user_id, username, email, password, score, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        except json.JSONDecodeError:
+            self.db.execute("ROLLBACK TO import_json")
+            return 0
+        finally:
+            self.db.execute("RELEASE import_json")
+        return cursor.rowcount
+
+    def get(self, username):
+        with self.lock:
+            row = self.db.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+        return {field: row[field] for field in USER_FIELDS} if row else None
+
+    def add(self, user_data):
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO users (user_id, username, email, password, score, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", tuple(user_data.get(field) for field in USER_FIELDS))
+        return cursor.rowcount == 1
+
+    def add_score(self, username, points):
+        with self.lock:
+            cursor = self.db.execute(
+                "UPDATE users SET score = score + ? WHERE username = ?", (points, username))
+            if cursor.rowcount != 1:
+                return None
+            return self.db.execute("SELECT score FROM users WHERE username = ?", (username,)).fetchone()[0]
+
+    def add_scores(self, deltas):
+        scores = {}
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                for username, points in deltas.items():
+                    self.db.execute("UPDATE users SET score = score + ? WHERE username = ?", (points, username))
+                    row = self.db.execute("SELECT score FROM users WHERE username = ?", (username,)).fetchone()
+                    scores[username] = row[0] if row else None
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        return scores
+
+    def set_password(self, username, password_hash):
+        with self.lock:
+            self.db.execute("UPDATE users SET password = ? WHERE username = ?", (password_hash, username))
+
+    def all_users(self):
+        with self.lock:
+            rows = self.db.execute("SELECT * FROM users").fetchall()
+        return [{field: row[field] for field in USER_FIELDS} for row in rows]
+
+    def iter_users(self, page_size=PAGE_SIZE):
+        """Every record in username order, read page_size rows at a time so memory stays flat"""
+        query, params = "SELECT * FROM users ORDER BY username LIMIT ?", (page_size,)
+        while True:
+            with self.lock:
+                rows = self.db.execute(query, params).fetchall()
+            for row in rows:
+                yield {field: row[field] for field in USER_FIELDS}
+            if len(rows) < page_size:
+                return
+            query = "SELECT * FROM users WHERE username > ? ORDER BY username LIMIT ?"
+            params = (rows[-1]['username'], page_size)
+
+    def put_many(self, records):
+        rows = [tuple(record.get(field) for field in USER_FIELDS) for record in records]
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO users (user_id, username, email, password, score, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", rows)
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class JournalUserStore(UserStore):
+    """
+    File-based store: a compacted snapshot plus an append-only journal.
+
+    Every mutation appends one JSON line carrying a sequence number, so a
+    write costs O(1) however many users exist. Appends are fsynced in
+    batches: every FSYNC_BATCH entries, by a background thread every
+    FSYNC_INTERVAL seconds, and on flush(). Once the journal holds
+    COMPACT_THRESHOLD entries the same thread writes a new snapshot to a
+    temporary file and renames it into place, so no crash can leave a
+    half-written snapshot. Startup loads the snapshot and replays the
+    journal entries after its sequence number; a torn final line from a
+    crash is discarded.
+    """
+
+    def __init__(self, snapshot_path=SNAPSHOT_PATH, journal_path=JOURNAL_PATH, json_path=JSON_PATH,
+                 fsync_batch=FSYNC_BATCH, fsync_interval=FSYNC_INTERVAL, compact_threshold=COMPACT_THRESHOLD):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+        self.lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+
+        self.users, self.seq = self._load_snapshot(json_path)
+        self.entries = 0  # Journal entries since the last compaction
+        for path in (self._rotated_path, journal_path):
+            self._replay(path)
+        self._journal = open(journal_path, 'a', encoding='utf-8')
+        self._unsynced = 0
+        if os.path.exists(self._rotated_path):
+            # The last compaction was interrupted; finish it with what was just replayed
+            self._write_snapshot(self.users, self.seq)
+            os.remove(self._rotated_path)
+        metrics.set_gauge('journal.entries', self.entries)
+
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="user-journal", daemon=True)
+        self._thread.start()
+
+    @property
+    def _rotated_path(self):
+        """Journal set aside by a compaction that has not finished yet"""
+        return self.journal_path + '.1'
+
+    def _load_snapshot(self, json_path):
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            return snapshot['users'], snapshot['seq']
+        except FileNotFoundError:
+            pass
+        # First start: take over the users of a JsonUserStore file, if any
+        try:
+            with open(json_path, 'r') as f:
+                users = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            users = {}
+        if users:
+            # Persisted before any request is served: the journal only holds later changes
+            self._write_snapshot(users, 0)
+            print(f"[UserStore] Imported {len(users)} users from {json_path}")
+        return users, 0
+
+    def _replay(self, path):
+        try:
+            f = open(path, 'rb+')
+        except FileNotFoundError:
+            return
+        with f:
+            good = 0
+            for line in iter(f.readline, b''):
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("no newline")
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash mid-append leaves a torn last line; drop it so appends stay parseable
+                    print(f"[UserStore] Discarding torn journal entry at byte {good} of {path}")
+                    f.truncate(good)
+                    metrics.incr('journal.torn_entries')
+                    break
+                good = f.tell()
+                if entry['seq'] > self.seq:
+                    self._apply(entry)
+                    self.seq = entry['seq']
+                    self.entries += 1
+
+    def _apply(self, entry):
+        op = entry['op']
+        if op == 'put':
+            self.users[entry['user']['username']] = entry['user']
+        elif op == 'score':
+            record = self.users.get(entry['username'])
+            if record is not None:
+                record['score'] = record.get('score', 0) + entry['points']
+        elif op == 'password':
+            record = self.users.get(entry['username'])
+            if record is not None:
+                record['password'] = entry['password']
+
+    def _append(self, entries):
+        """Apply and journal mutations; called with self.lock held"""
+        lines = []
+        for entry in entries:
+            self.seq += 1
+            entry['seq'] = self.seq
+            self._apply(entry)
+            lines.append(json.dumps(entry, separators=(',', ':')))
+        self._journal.write('\n'.join(lines) + '\n')
+        self._unsynced += len(lines)
+        self.entries += len(lines)
+        metrics.incr('journal.appends', len(lines))
+        metrics.set_gauge('journal.entries', self.entries)
+        if self._unsynced >= self.fsync_batch:
+            self._sync()
+
+    def _sync(self):
+        """Called with self.lock held"""
+        if not self._unsynced:
+            return
+        started = time.monotonic()
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        metrics.incr('journal.fsyncs')
+        metrics.observe('journal.fsync_time', time.monotonic() - started)
+        self._unsynced = 0
+
+    def get(self, username):
+        with self.lock:
+            record = self.users.get(username)
+            return dict(record) if record else None
+
+    def add(self, user_data):
+        with self.lock:
+            if user_data['username'] in self.users:
+                return False
+            self._append([{'op': 'put', 'user': dict(user_data)}])
+            return True
+
+    def add_score(self, username, points):
+        return self.add_scores({username: points})[username]
+
+    def add_scores(self, deltas):
+        with self.lock:
+            entries = [{'op': 'score', 'username': username, 'points': points}
+                       for username, points in deltas.items() if username in self.users]
+            if entries:
+                self._append(entries)
+            return {username: self.users[username]['score'] if username in self.users else None
+                    for username in deltas}
+
+    def set_password(self, username, password_hash):
+        with self.lock:
+            if username in self.users:
+                self._append([{'op': 'password', 'username': username, 'password': password_hash}])
+
+    def put_many(self, records):
+        if records:
+            with self.lock:
+                self._append([{'op': 'put', 'user': dict(record)} for record in records])
+
+    def all_users(self):
+        with self.lock:
+            return [dict(record) for record in self.users.values()]
+
+    def flush(self):
+        with self.lock:
+            self._sync()
+
+    def compact(self):
+        """Write every user to a new snapshot and drop the journal entries it covers"""
+        with self._compact_lock:
+            started = time.monotonic()
+            with self.lock:
+                # Set the journal aside; later appends start a fresh one
+                self._sync()
+                self._journal.close()
+                os.replace(self.journal_path, self._rotated_path)
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+                users = {name: dict(record) for name, record in self.users.items()}
+                seq = self.seq
+                compacted, self.entries = self.entries, 0
+                metrics.set_gauge('journal.entries', 0)
+
+            self._write_snapshot(users, seq)
+            os.remove(self._rotated_path)
+
+            metrics.incr('journal.compactions')
+            metrics.observe('journal.compaction_time', time.monotonic() - started)
+            return compacted
+
+    def _write_snapshot(self, users, seq):
+        """Readers only ever see the old or the new snapshot, never a partial one"""
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'seq': seq, 'users': users}, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        _fsync_directory(self.snapshot_path)
+
+    def _run(self):
+        while not self._closed.wait(self.fsync_interval):
+            try:
+                self.flush()
+                if self.entries >= self.compact_threshold:
+                    self.compact()
+            except OSError as e:
+                print(f"[UserStore] Journal maintenance failed: {e}")
+                metrics.incr('journal.errors')
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+        with self.lock:
+            self._sync()
+            self._journal.close()
+
+
+def _fsync_directory(path):
+    """Make a rename in the directory of `path` durable (no-op where directories can't be opened)"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class ShardedUserStore(UserStore):
+    """
+    Users partitioned over several stores by a stable hash of the username.
+
+    Each shard is a complete store with its own file or database and lock,
+    so operations on users in different shards never wait for each other.
+    Batch operations are split per shard.
+    """
+
+    def __init__(self, shards):
+        self.shards = list(shards)
+
+    def shard_index(self, username):
+        """Index of the shard that owns `username`; crc32 keeps placement stable across processes"""
+        return zlib.crc32(username.encode('utf-8')) % len(self.shards)
+
+    def shard_for(self, username):
+        return self.shards[self.shard_index(username)]
+
+    def _group(self, items, username_of):
+        """(shard, items owned by it) for every shard that owns any of `items`"""
+        groups = {}
+        for item in items:
+            groups.setdefault(self.shard_index(username_of(item)), []).append(item)
+        return [(self.shards[index], group) for index, group in groups.items()]
+
+    def get(self, username):
+        return self.shard_for(username).get(username)
+
+    def add(self, user_data):
+        return self.shard_for(user_data['username']).add(user_data)
+
+    def add_score(self, username, points):
+        return self.shard_for(username).add_score(username, points)
+
+    def add_scores(self, deltas):
+        scores = {}
+        for shard, usernames in self._group(deltas, lambda username: username):
+            scores.update(shard.add_scores({username: deltas[username] for username in usernames}))
+        return scores
+
+    def set_password(self, username, password_hash):
+        self.shard_for(username).set_password(username, password_hash)
+
+    def put_many(self, records):
+        for shard, group in self._group(records, lambda record: record['username']):
+            shard.put_many(group)
+
+    def all_users(self):
+        return [record for shard in self.shards for record in shard.all_users()]
+
+    def iter_users(self):
+        for shard in self.shards:
+            yield from shard.iter_users()
+
+    def flush(self):
+        for shard in self.shards:
+            shard.flush()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+
+class CachedUserStore(UserStore):
+    """
+    In-memory index of every user over a backing store, with write-behind.
+
+    Reads never touch the backing store. Mutations update the index and mark
+    the user dirty; a writer thread flushes dirty users in one put_many every
+    `flush_interval` seconds, as soon as `max_dirty` users are waiting, and
+    on close(). A full dirty set makes mutating threads wait for the flush.
+    """
+
+    def __init__(self, backing, flush_interval=FLUSH_INTERVAL, max_dirty=MAX_DIRTY):
+        self.backing = backing
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self.users = {record['username']: record for record in backing.all_users()}
+        self.dirty = set()
+        self._dirty_since = None  # When the oldest unflushed change was made
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # One flush at a time, outside _cond
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="user-store-writer", daemon=True)
+        self._writer.start()
+
+    def get(self, username):
+        record = self.users.get(username)
+        return dict(record) if record else None
+
+    def add(self, user_data):
+        with self._cond:
+            if user_data['username'] in self.users:
+                return False
+            self.users[user_data['username']] = dict(user_data)
+            self._mark_dirty(user_data['username'])
+        return True
+
+    def add_score(self, username, points):
+        with self._cond:
+            record = self.users.get(username)
+            if record is None:
+                return None
+            record['score'] = record.get('score', 0) + points
+            self._mark_dirty(username)
+            return record['score']
+
+    def add_scores(self, deltas):
+        scores = {}
+        with self._cond:
+            for username, points in deltas.items():
+                record = self.users.get(username)
+                if record is None:
+                    scores[username] = None
+                    continue
+                record['score'] = record.get('score', 0) + points
+                scores[username] = record['score']
+                self._mark_dirty(username)
+        return scores
+
+    def set_password(self, username, password_hash):
+        with self._cond:
+            record = self.users.get(username)
+            if record is not None:
+                record['password'] = password_hash
+                self._mark_dirty(username)
+
+    def all_users(self):
+        with self._cond:
+            return [dict(record) for record in self.users.values()]
+
+    def put_many(self, records):
+        with self._cond:
+            for record in records:
+                self.users[record['username']] = dict(record)
+                self._mark_dirty(record['username'])
+
+    def _mark_dirty(self, username):
+        """Called with _cond held"""
+        if not self.dirty:
+            self._dirty_since = time.monotonic()
+        self.dirty.add(username)
+        metrics.set_gauge('userstore.dirty', len(self.dirty))
+        if len(self.dirty) >= self.max_dirty:
+            self._cond.notify_all()
+            metrics.incr('userstore.backpressure_waits')
+            self._cond.wait_for(lambda: len(self.dirty) < self.max_dirty or self._closed,
+                                DIRTY_WAIT_TIMEOUT)
+
+    def flush(self):
+        """Write every dirty user to the backing store now. Returns how many were written."""
+        with self._flush_lock:
+            with self._cond:
+                if not self.dirty:
+                    return 0
+                names, self.dirty = self.dirty, set()
+                batch = [dict(self.users[name]) for name in names]
+                dirty_since, self._dirty_since = self._dirty_since, None
+                metrics.set_gauge('userstore.dirty', 0)
+                self._cond.notify_all()  # Wake writers waiting on a full dirty set
+
+            started = time.monotonic()
+            try:
+                self.backing.put_many(batch)
+            except Exception as e:
+                print(f"[UserStore] Flush of {len(batch)} users failed, will retry: {e}")
+                metrics.incr('userstore.flush_errors')
+                with self._cond:
+                    if not self.dirty:
+                        self._dirty_since = dirty_since
+                    self.dirty.update(names)
+                    metrics.set_gauge('userstore.dirty', len(self.dirty))
+                return 0
+            finished = time.monotonic()
+
+        metrics.incr_many((('userstore.flushes', 1), ('userstore.flushed_users', len(batch))))
+        metrics.observe('userstore.flush_latency', finished - started)
+        metrics.observe('userstore.flush_lag', finished - dirty_since)  # Oldest change to durable
+        return len(batch)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or len(self.dirty) >= self.max_dirty,
+                                    self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def close(self):
+        """Flush what is left, stop the writer and close the backing store"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        self.backing.close()
+
+
+USER_STORES = ('sqlite', 'journal', 'json')
+
+# Punctuation allowed in each state of iter_json_users, and the state it leads to
+_JSON_TRANSITIONS = {
+    ('open', '{'): 'first',
+    ('first', '}'): 'done',
+    ('colon', ':'): 'value',
+    ('comma', ','): 'key',
+    ('comma', '}'): 'done',
+}
+
+
+def iter_json_users(path, chunk_size=READ_CHUNK):
+    """
+    Records of a users.json file ({username: record}) one at a time. The file
+    is parsed chunk_size characters at a time, so memory stays flat however
+    many users it holds. Raises json.JSONDecodeError on malformed input.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer, pos = '', 0
+        state = 'open'
+        while state != 'done':
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos == len(buffer):
+                buffer, pos = f.read(chunk_size), 0
+                if not buffer:
+                    raise json.JSONDecodeError("Unexpected end of file", '', 0)
+                continue
+            if state == 'first' and buffer[pos] != '}':
+                state = 'key'
+            if state not in ('key', 'value'):
+                state_after = _JSON_TRANSITIONS.get((state, buffer[pos]))
+                if state_after is None:
+                    raise json.JSONDecodeError(f"Unexpected {buffer[pos]!r}", buffer, pos)
+                state, pos = state_after, pos + 1
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0  # The item runs past the chunk; read on
+                continue
+            if state == 'key' and not isinstance(item, str):
+                raise json.JSONDecodeError("Expected a username", buffer, pos)
+            pos = end
+            if state == 'value':
+                yield item
+            state = 'colon' if state == 'key' else 'comma'
+
+
+def shard_path(path, index, count):
+    """Per-shard file name: users.db -> users.3-of-8.db (unchanged for a single shard)"""
+    if count == 1:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{index}-of-{count}{ext}"
+
+
+def open_backend(backend, index=0, count=1, json_path=None):
+    """
+    Open shard `index` of `count` of a backend without the cache. An empty
+    SQLite or journal store imports `json_path` when one is given; only an
+    unsharded layout should pass it (see open_layout for sharded ones).
+    """
+    if backend == 'sqlite':
+        return SqliteUserStore(shard_path(SQLITE_PATH, index, count), json_path=json_path)
+    if backend == 'journal':
+        return JournalUserStore(shard_path(SNAPSHOT_PATH, index, count), shard_path(JOURNAL_PATH, index, count),
+                                json_path=json_path)
+    if backend == 'json':
+        return JsonUserStore(shard_path(JSON_PATH, index, count))
+    raise ValueError(f"Unknown user store {backend!r}; expected one of {USER_STORES}")
+
+
+def open_layout(backend, shards=1, json_path=None):
+    """
+    Open a backend as one store or as a ShardedUserStore of `shards` stores.
+    With `json_path`, users from that file are imported into a layout that
+    holds no users yet; server/user_admin.py leaves it out so it never
+    mixes the development file into the layouts it moves users between.
+    """
+    if shards == 1:
+        return open_backend(backend, json_path=json_path)
+    store = ShardedUserStore([open_backend(backend, i, shards) for i in range(shards)])
+    if json_path and os.path.exists(json_path) and next(store.iter_users(), None) is None:
+        _import_json_into(store, json_path)
+    return store
+
+
+def _import_json_into(store, json_path):
+    """First start of a sharded layout: take over the users of the development file"""
+    imported = 0
+    batch = []
+    try:
+        for record in iter_json_users(json_path):
+            batch.append(record)
+            if len(batch) >= IMPORT_BATCH:
+                store.put_many(batch)
+                imported += len(batch)
+                batch = []
+    except json.JSONDecodeError as e:
+        print(f"[UserStore] Stopped importing {json_path}: {e}")
+    store.put_many(batch)
+    imported += len(batch)
+    print(f"[UserStore] Imported {imported} users from {json_path} into {len(store.shards)} shards")
+
+
+def cache_layout(store):
+    """Put a CachedUserStore in front of `store`, or in front of each shard of a ShardedUserStore"""
+    if isinstance(store, ShardedUserStore):
+        return ShardedUserStore([CachedUserStore(shard) for shard in store.shards])
+    return CachedUserStore(store)
+
+
+def open_user_store(backend=None, shards=None):
+    """
+    Open the backend named by `backend` or $OTHELLO_USER_STORE (default SQLite),
+    split into `shards` or $OTHELLO_USER_SHARDS partitions (default 1), each
+    behind its own in-memory CachedUserStore
+    """
+    backend = backend or os.environ.get(USER_STORE_ENV, 'sqlite')
+    shards = shards or int(os.environ.get(USER_SHARDS_ENV, 1))
+    if backend not in USER_STORES:
+        raise ValueError(f"Unknown user store {backend!r}; expected one of {USER_STORES}")
+    return cache_layout(open_layout(backend, shards, json_path=JSON_PATH))
@@ -0,0 +1,347 @@
+# shared/codec.py
+"""
+Binary codec for the hot messages, negotiated with FEATURE_BINARY_CODEC,
+and compressed frames for large messages, negotiated with FEATURE_DEFLATE.
+
+The stream stays newline-delimited JSON for everything else. A binary frame
+starts with FRAME_MARKER (0x00, which never starts a JSON line), followed by
+a big-endian u16 body length. The body is a one-byte message ID and then
+fixed `struct`-packed fields. Decoded frames are returned as the same
+{"type": ..., "payload": ...} dictionaries the JSON path produces, so
+handlers do not care which codec a message used.
+
+A deflate frame starts with DEFLATE_MARKER (0x01) and a u32 body length; the
+body is one JSON message compressed with raw deflate and DEFLATE_DICTIONARY.
+It is returned inflated, as the JSON line it replaced.
+"""
+
+import json
+import struct
+import zlib
+from typing import Any, Dict, List, Tuple, Union
+
+from shared.messages import ERROR_INVALID_MOVE, ERROR_NOT_YOUR_TURN, ERROR_GAME_NOT_ACTIVE, ERROR_STALE_MOVE
+
+FRAME_MARKER = 0x00
+_FRAME_HEADER = struct.Struct('!BH')  # marker, body length
+DEFLATE_MARKER = 0x01
+_DEFLATE_HEADER = struct.Struct('!BI')  # marker, compressed length
+MAX_INFLATED_SIZE = 1024 * 1024  # Same as the receive buffer; larger frames are rejected
+DEFLATE_LEVEL = 6
+_RAW_DEFLATE = -15  # wbits for raw deflate: no zlib header or checksum, TCP already has one
+
+# Message IDs
+MSG_ID_MAKE_MOVE = 1
+MSG_ID_MOVE_APPLIED = 2
+MSG_ID_GAME_UPDATE = 3
+MSG_ID_PING = 4
+MSG_ID_PONG = 5
+MSG_ID_MAKE_MOVE_SEQ = 6
+MSG_ID_MOVE_RESULT = 7
+MSG_ID_INVALID_MOVE = 8
+
+# Field layouts (after the message ID byte)
+_MAKE_MOVE = struct.Struct('!BB')            # row, col
+_MAKE_MOVE_SEQ = struct.Struct('!BBI')       # row, col, seq
+_MOVE_RESULT = struct.Struct('!IBI')         # seq, status, version
+_INVALID_MOVE = struct.Struct('!BI')         # status, version
+_MOVE_APPLIED = struct.Struct('!BBBBBBIB')   # row, col, color, turn, black, white, version, flip count
+_GAME_UPDATE = struct.Struct('!QQBBBBI')     # black mask, white mask, turn, black, white, flags, version
+
+_COLOR_CODES = {'black': 1, 'white': 2}
+_COLOR_NAMES = {1: 'black', 2: 'white', 0: None}
+_FLAG_GAME_OVER = 0x01
+
+# Move status byte: 1 is success, 0 an unspecified rejection, higher values a reason
+_STATUS_SUCCESS = 1
+_REJECTION_CODES = {ERROR_INVALID_MOVE: 2, ERROR_NOT_YOUR_TURN: 3, ERROR_GAME_NOT_ACTIVE: 4, ERROR_STALE_MOVE: 5}
+_REJECTION_NAMES = {code: reason for reason, code in _REJECTION_CODES.items()}
+_WINNER_SHIFT = 1  # Winner color code is stored in bits 1-2 of the flags
+
+# board64 <-> bitmasks: bit i of a mask is cell i in row-major order
+_BLACK_BITS = str.maketrans('.BW', '010')
+_WHITE_BITS = str.maketrans('.BW', '001')
+_CELL_SYMBOLS = bytes.maketrans(bytes([3 * ord('0'), 3 * ord('0') + 1, 3 * ord('0') + 2]), b'.BW')
+
+
+
+def _dictionary_samples():
+    """Typical messages, least common first: deflate favours the end of the dictionary"""
+    board = [['', '', '', '', '', '', '', ''],
+             ['', '', 'white', 'black', 'black', '', '', ''],
+             ['', 'black', 'black', 'white', 'black', 'white', '', ''],
+             ['', '', 'white', 'white', 'black', 'black', 'black', ''],
+             ['', '', 'black', 'black', 'white', 'white', '', ''],
+             ['', '', '', 'white', 'black', '', '', ''],
+             ['', '', '', '', '', '', '', ''],
+             ['', '', '', '', '', '', '', '']]
+    state = {'board': board, 'turn': 'black', 'scores': {'black': 12, 'white': 8},
+             'game_over': False, 'winner': None, 'version': 20}
+    player = {'user_id': '00000000-0000-4000-8000-000000000000', 'username': 'player'}
+    return [
+        {'type': 'server_stats', 'payload': {'counters': {'net.bytes_out': 0, 'net.messages_out': 0},
+                                             'gauges': {'connections.active': 0},
+                                             'timings': {'handoff.restore': {'count': 1, 'avg_ms': 0.5,
+                                                                             'max_ms': 0.5}}}},
+        {'type': 'user_logged_in', 'payload': {'success': True, 'user': dict(player, email='player@example.com',
+                                                                            score=0, created_at='2025-01-01T00:00:00')}},
+        {'type': 'room_update', 'payload': {'room_code': 'ABC123', 'players': [player, player]}},
+        {'type': 'game_start', 'payload': {'players': {'black': player['user_id'], 'white': player['user_id']},
+                                           'player_info': {'black': player, 'white': player},
+                                           'game_state': state}},
+        {'type': 'game_update', 'payload': {'game_state': state}},
+    ]
+
+
+# Preset dictionary shared by both ends; changing it requires a new feature name.
+# It matches encode_message output, but is built with the stdlib so it never depends on the backend
+DEFLATE_DICTIONARY = b''.join(json.dumps(sample, separators=(',', ':')).encode('utf-8')
+                              for sample in _dictionary_samples())
+_DEFLATE_TEMPLATE = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, _RAW_DEFLATE, zdict=DEFLATE_DICTIONARY)
+
+
+class CodecError(ValueError):
+    """Raised for malformed or unknown binary frames"""
+
+
+def _frame(body: bytes) -> bytes:
+    return _FRAME_HEADER.pack(FRAME_MARKER, len(body)) + body
+
+
+def board64_to_masks(board64: str) -> Tuple[int, int]:
+    """Convert a compact board string to (black mask, white mask)"""
+    return (int(board64.translate(_BLACK_BITS)[::-1], 2),
+            int(board64.translate(_WHITE_BITS)[::-1], 2))
+
+
+def masks_to_board64(black: int, white: int) -> str:
+    """Convert (black mask, white mask) back to a compact board string"""
+    # Each cell becomes the digit byte b'0'/b'1' of its black bit plus twice
+    # that of its white bit; the per-byte sums never carry, so one big-int
+    # addition combines all 64 cells at once.
+    black_digits = int.from_bytes(format(black, '064b')[::-1].encode('ascii'), 'big')
+    white_digits = int.from_bytes(format(white, '064b')[::-1].encode('ascii'), 'big')
+    cells = (black_digits + 2 * white_digits).to_bytes(64, 'big')
+    return cells.translate(_CELL_SYMBOLS).decode('ascii')
+
+
+# --- Encoders ---
+
+def encode_make_move(row: int, col: int, seq: int = None) -> bytes:
+    if seq is None:
+        return _frame(bytes([MSG_ID_MAKE_MOVE]) + _MAKE_MOVE.pack(row, col))
+    return _frame(bytes([MSG_ID_MAKE_MOVE_SEQ]) + _MAKE_MOVE_SEQ.pack(row, col, seq))
+
+
+def encode_move_result(seq: int, success: bool, version: int, reason: str = None) -> bytes:
+    status = _STATUS_SUCCESS if success else _REJECTION_CODES.get(reason, 0)
+    return _frame(bytes([MSG_ID_MOVE_RESULT]) + _MOVE_RESULT.pack(seq, status, version))
+
+
+def encode_invalid_move(reason: str, version: int) -> bytes:
+    return _frame(bytes([MSG_ID_INVALID_MOVE]) + _INVALID_MOVE.pack(_REJECTION_CODES.get(reason, 0), version))
+
+
+def encode_move_applied(move, color: str, flipped, turn: str, scores: Dict[str, int], version: int) -> bytes:
+    body = bytes([MSG_ID_MOVE_APPLIED]) + _MOVE_APPLIED.pack(
+        move[0], move[1], _COLOR_CODES[color], _COLOR_CODES[turn],
+        scores['black'], scores['white'], version, len(flipped))
+    return _frame(body + bytes(r * 8 + c for r, c in flipped))
+
+
+def encode_game_update(game_state: Dict[str, Any]) -> bytes:
+    """Encode a compact game_state (one with "board64")"""
+    black, white = board64_to_masks(game_state['board64'])
+    flags = _FLAG_GAME_OVER if game_state['game_over'] else 0
+    flags |= _COLOR_CODES.get(game_state['winner'], 0) << _WINNER_SHIFT
+    body = bytes([MSG_ID_GAME_UPDATE]) + _GAME_UPDATE.pack(
+        black, white, _COLOR_CODES[game_state['turn']],
+        game_state['scores']['black'], game_state['scores']['white'], flags, game_state['version'])
+    return _frame(body)
+
+
+def encode_ping() -> bytes:
+    return _frame(bytes([MSG_ID_PING]))
+
+
+def encode_pong() -> bytes:
+    return _frame(bytes([MSG_ID_PONG]))
+
+
+def deflate_message(message: bytes) -> bytes:
+    """Compress one newline-terminated JSON message into a deflate frame"""
+    compressor = _DEFLATE_TEMPLATE.copy()  # Already primed with the dictionary
+    body = compressor.compress(message.rstrip(b'\n')) + compressor.flush()
+    return _DEFLATE_HEADER.pack(DEFLATE_MARKER, len(body)) + body
+
+
+def inflate_message(body: bytes, max_size: int = MAX_INFLATED_SIZE) -> bytes:
+    """Decompress a deflate frame body back into the JSON message (without newline), up to `max_size` bytes"""
+    decompressor = zlib.decompressobj(_RAW_DEFLATE, zdict=DEFLATE_DICTIONARY)
+    try:
+        message = decompressor.decompress(body, max_size)
+    except zlib.error as e:
+        raise CodecError(f"Malformed deflate frame: {e}")
+    if decompressor.unconsumed_tail:
+        raise CodecError("Deflate frame inflates past the size limit")
+    return message
+
+
+# --- Decoders ---
+
+def _decode_make_move(body):
+    row, col = _MAKE_MOVE.unpack_from(body, 1)
+    return {'type': 'make_move', 'payload': {'move': [row, col]}}
+
+
+def _decode_make_move_seq(body):
+    row, col, seq = _MAKE_MOVE_SEQ.unpack_from(body, 1)
+    return {'type': 'make_move', 'payload': {'move': [row, col], 'seq': seq}}
+
+
+def _decode_move_result(body):
+    seq, status, version = _MOVE_RESULT.unpack_from(body, 1)
+    payload = {'seq': seq, 'success': status == _STATUS_SUCCESS, 'version': version}
+    if status in _REJECTION_NAMES:
+        payload['reason'] = _REJECTION_NAMES[status]
+    return {'type': 'move_result', 'payload': payload}
+
+
+def _decode_invalid_move(body):
+    status, version = _INVALID_MOVE.unpack_from(body, 1)
+    return {'type': 'invalid_move', 'payload': {'reason': _REJECTION_NAMES.get(status, ERROR_INVALID_MOVE),
+                                                'version': version}}
+
+
+def _decode_move_applied(body):
+    row, col, color, turn, black, white, version, count = _MOVE_APPLIED.unpack_from(body, 1)
+    start = 1 + _MOVE_APPLIED.size
+    squares = body[start:start + count]
+    if len(squares) != count:
+        raise CodecError("Truncated move_applied frame")
+    return {'type': 'move_applied', 'payload': {
+        'move': [row, col],
+        'color': _COLOR_NAMES[color],
+        'flipped': [[square // 8, square % 8] for square in squares],
+        'turn': _COLOR_NAMES[turn],
+        'scores': {'black': black, 'white': white},
+        'version': version
+    }}
+
+
+def _decode_game_update(body):
+    black_mask, white_mask, turn, black, white, flags, version = _GAME_UPDATE.unpack_from(body, 1)
+    return {'type': 'game_update', 'payload': {'game_state': {
+        'board64': masks_to_board64(black_mask, white_mask),
+        'turn': _COLOR_NAMES[turn],
+        'scores': {'black': black, 'white': white},
+        'game_over': bool(flags & _FLAG_GAME_OVER),
+        'winner': _COLOR_NAMES[(flags >> _WINNER_SHIFT) & 0x03],
+        'version': version
+    }}}
+
+
+_DECODERS = {
+    MSG_ID_MAKE_MOVE: _decode_make_move,
+    MSG_ID_MOVE_APPLIED: _decode_move_applied,
+    MSG_ID_GAME_UPDATE: _decode_game_update,
+    MSG_ID_PING: lambda body: {'type': 'ping', 'payload': {}},
+    MSG_ID_PONG: lambda body: {'type': 'pong', 'payload': {}},
+    MSG_ID_MAKE_MOVE_SEQ: _decode_make_move_seq,
+    MSG_ID_MOVE_RESULT: _decode_move_result,
+    MSG_ID_INVALID_MOVE: _decode_invalid_move,
+}
+
+
+def decode_frame(body: bytes) -> Dict[str, Any]:
+    """Decode one binary frame body into a message dictionary"""
+    if not body:
+        raise CodecError("Empty frame")
+    decoder = _DECODERS.get(body[0])
+    if decoder is None:
+        raise CodecError(f"Unknown message ID: {body[0]}")
+    try:
+        return decoder(body)
+    except (struct.error, KeyError) as e:
+        raise CodecError(f"Malformed frame: {e}")
+
+
+def split_frames(buffer: bytes, allow_deflate: bool = True, max_length: int = None,
+                 allow_binary: bool = True) -> Tuple[List[Union[bytes, Dict[str, Any]]], bytes]:
+    """
+    Split a receive buffer into complete messages
+
+    Args:
+        allow_deflate: False if the peer did not negotiate FEATURE_DEFLATE
+        allow_binary: False if the peer did not negotiate FEATURE_BINARY_CODEC
+        max_length: Longest JSON line, deflate body or inflated message
+            accepted, or None for MAX_INFLATED_SIZE on inflated messages only
+
+    Returns:
+        Tuple of (messages, rest). JSON lines (including inflated deflate
+        frames) are returned as raw bytes without the newline; binary frames
+        are returned decoded. A frame that fails to decode is returned as the
+        CodecError it raised. `rest` is the incomplete tail.
+
+    Raises:
+        CodecError: for a deflate or binary frame that was not allowed, or a message
+            over `max_length`, even an incomplete one. The stream cannot be
+            trusted past either, and `rest` never grows beyond the limit.
+    """
+    messages = []
+    pos = 0
+    size = len(buffer)
+    while pos < size:
+        if buffer[pos] == DEFLATE_MARKER:
+            if not allow_deflate:
+                raise CodecError("Deflate frame from a peer that did not negotiate it")
+            if size - pos < _DEFLATE_HEADER.size:
+                break
+            _, length = _DEFLATE_HEADER.unpack_from(buffer, pos)
+            if max_length is not None and length > max_length:
+                raise CodecError(f"Deflate frame of {length} bytes exceeds the {max_length} byte limit")
+            end = pos + _DEFLATE_HEADER.size + length
+            if end > size:
+                break
+            try:
+                messages.append(inflate_message(buffer[pos + _DEFLATE_HEADER.size:end],
+                                                MAX_INFLATED_SIZE if max_length is None else max_length))
+            except CodecError as e:
+                messages.append(e)
+            pos = end
+        elif buffer[pos] == FRAME_MARKER:
+            if not allow_binary:
+                raise CodecError("Binary frame from a peer that did not negotiate it")
+            if size - pos < _FRAME_HEADER.size:
+                break
+            _, length = _FRAME_HEADER.unpack_from(buffer, pos)
+            end = pos + _FRAME_HEADER.size + length
+            if end > size:
+                break
+            try:
+                messages.append(decode_frame(buffer[pos + _FRAME_HEADER.size:end]))
+            except CodecError as e:
+                messages.append(e)
+            pos = end
+        else:
+            newline = buffer.find(b'\n', pos)
+            if max_length is not None and (size if newline < 0 else newline) - pos > max_length:
+                raise CodecError(f"Message line exceeds the {max_length} byte limit")
+            if newline < 0:
+                break
+            if newline > pos:
+                messages.append(buffer[pos:newline])
+            pos = newline + 1
+    return messages, buffer[pos:]
+
+
+class FrameDecoder:
+    """Incremental decoder for a mixed JSON-line / binary-frame stream"""
+
+    def __init__(self):
+        self.buffer = b''
+
+    def feed(self, data: bytes) -> List[Union[bytes, Dict[str, Any]]]:
+        """Add received bytes and return every message completed by them"""
+        messages, self.buffer = split_frames(self.buffer + data)
+        return messages
@@ -48,8 +48,12 @@ ROOM_CODE_LENGTH = 6
 # Message buffer size
 BUFFER_SIZE = 4096
 
+# Messages at least this large are deflated for clients that negotiated it
+DEFLATE_THRESHOLD = 256
+
 # Timeouts (in seconds)
 CONNECTION_TIMEOUT = 30
+HEARTBEAT_INTERVAL = 10
 MOVE_TIMEOUT = 60
 RECONNECTION_TIMEOUT = 300
 
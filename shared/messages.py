@@ -3,6 +3,10 @@
 Network message types and structures for client-server communication
 """
 
+import json
+import os
+from operator import attrgetter
+
 # Message types - Client to Server
 MSG_LOGIN = "login"
 MSG_REGISTER = "register"
@@ -10,10 +14,15 @@ MSG_CREATE_ROOM = "create_room"
 MSG_JOIN_ROOM = "join_room"
 MSG_LEAVE_ROOM = "leave_room"
 MSG_MAKE_MOVE = "make_move"
-MSG_READY = "ready"
+MSG_READY = "ready"  # Join the matchmaking queue ("ready": false leaves it); answered with the same type
 MSG_CHAT = "chat"
 MSG_DISCONNECT = "disconnect"
 MSG_PING = "ping"
+MSG_RESYNC = "resync"  # Optional "since": the client's state version, to get only later moves
+MSG_RESUME_SESSION = "resume_session"  # Authenticate with a token from a previous login
+MSG_LEADERBOARD_TOP = "leaderboard_top"  # Optional "offset" and "limit"; answered with the same type
+MSG_LEADERBOARD_RANK = "leaderboard_rank"  # Optional "username" (default: yourself); same type reply
+MSG_LIST_ROOMS = "list_rooms"  # Optional "status", "offset", "limit" and "search"; answered with room_list
 
 # Message types - Server to Client
 MSG_LOGIN_RESPONSE = "login_response"
@@ -25,13 +34,22 @@ MSG_ROOM_ERROR = "room_error"
 MSG_GAME_STATE = "game_state"
 MSG_GAME_START = "game_start"
 MSG_GAME_END = "game_end"
-MSG_MOVE_RESULT = "move_result"
-MSG_INVALID_MOVE = "invalid_move"
+MSG_MOVE_RESULT = "move_result"  # Answers a make_move that carried a "seq"
+MSG_INVALID_MOVE = "invalid_move"  # Rejection of a make_move without a "seq"
 MSG_PLAYER_JOINED = "player_joined"
 MSG_PLAYER_LEFT = "player_left"
 MSG_CHAT_MESSAGE = "chat_message"
 MSG_ERROR = "error"
 MSG_PONG = "pong"
+MSG_MATCH_FOUND = "match_found"  # Matchmaking paired you; the room follows with room_update
+MSG_ROOM_LIST = "room_list"
+
+# Optional protocol features, negotiated with MSG_HELLO / MSG_HELLO_ACK
+MSG_HELLO = "hello"
+MSG_HELLO_ACK = "hello_ack"
+FEATURE_COMPACT_BOARD = "compact_board"  # game_state carries "board64" instead of "board"
+FEATURE_BINARY_CODEC = "binary_codec"  # Hot messages use shared/codec.py frames; implies board64
+FEATURE_DEFLATE = "deflate"  # Large JSON messages may arrive as compressed frames
 
 # Error codes
 ERROR_INVALID_CREDENTIALS = "invalid_credentials"
@@ -45,6 +63,8 @@ ERROR_NOT_YOUR_TURN = "not_your_turn"
 ERROR_INVALID_MOVE = "invalid_move"
 ERROR_CONNECTION_LOST = "connection_lost"
 ERROR_SERVER_FULL = "server_full"
+ERROR_RATE_LIMITED = "rate_limited"
+ERROR_STALE_MOVE = "stale_move"  # make_move seq older than the server remembers
 
 class Message:
     """Base message class for structured communication"""
@@ -129,4 +149,318 @@ def create_game_end_message(winner, final_scores, reason):
         "winner": winner,
         "final_scores": final_scores,
         "reason": reason
-    })
\ No newline at end of file
+    })
+
+
+# --- Wire encoding ---
+#
+# Every message on the wire is {"type": ..., "payload": ...} as one JSON
+# line. encode_message/decode_message are the single encode/decode path used
+# by the server's Protocol and the client's NetworkClient. The JSON library
+# is pluggable: the fastest installed backend is used unless
+# OTHELLO_JSON_BACKEND names one. Every backend produces identical compact
+# UTF-8 output, so peers never depend on which one the other side runs.
+
+JSON_BACKENDS = ('orjson', 'ujson', 'json')  # In order of preference
+
+
+def _stdlib_backend():
+    encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+    return lambda obj: encoder.encode(obj).encode('utf-8'), json.loads
+
+
+def _orjson_backend():
+    import orjson
+    return orjson.dumps, orjson.loads
+
+
+def _ujson_backend():
+    import ujson
+    return (lambda obj: ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8'),
+            ujson.loads)
+
+
+_BACKEND_LOADERS = {'orjson': _orjson_backend, 'ujson': _ujson_backend, 'json': _stdlib_backend}
+json_backend = None  # Name of the active backend
+_dumps = _loads = None
+
+
+def set_json_backend(name=None):
+    """
+    Select the JSON library used by encode_message/decode_message.
+    With no name, the first installed backend in JSON_BACKENDS is used.
+    Returns the name of the backend that was selected.
+    """
+    global json_backend, _dumps, _loads
+    for candidate in ([name] if name else JSON_BACKENDS):
+        try:
+            _dumps, _loads = _BACKEND_LOADERS[candidate]()
+        except ImportError:
+            if name:
+                raise
+            continue
+        json_backend = candidate
+        return candidate
+
+
+set_json_backend(os.environ.get('OTHELLO_JSON_BACKEND') or None)
+
+
+def encode_message(msg_type, payload):
+    """Encode one message as wire-ready bytes: compact UTF-8 JSON and a newline"""
+    return _dumps({"type": msg_type, "payload": payload}) + b'\n'
+
+
+def decode_message(data):
+    """Decode one JSON message (str or bytes) into a dictionary, or None if malformed"""
+    try:
+        message = _loads(data)
+    except ValueError:  # Every backend's decode error, including bad UTF-8
+        return None
+    return message if isinstance(message, dict) else None
+
+
+class WireMessage:
+    """
+    Base class for typed wire messages.
+    Subclasses set TYPE and FIELDS, a tuple of payload field names or
+    (name, default) pairs; fields with a None default are optional and left
+    out of the payload while unset. The slots and field tables are built once
+    per class.
+    """
+    __slots__ = ()
+    TYPE = None
+    FIELDS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = [field if isinstance(field, tuple) else (field, _REQUIRED) for field in cls.FIELDS]
+        cls._names = tuple(name for name, _ in fields)
+        cls._defaults = {name: default for name, default in fields if default is not _REQUIRED}
+        cls._optional = frozenset(name for name, default in fields if default is None)
+        # attrgetter returns a bare value for a single name; always produce a tuple
+        if len(cls._names) > 1:
+            getter = attrgetter(*cls._names)
+        elif cls._names:
+            getter = lambda obj, _get=attrgetter(cls._names[0]): (_get(obj),)
+        else:
+            getter = lambda obj: ()
+        cls._getter = staticmethod(getter)
+        cls.to_payload = _compile_to_payload(cls._names, cls._optional)
+        if cls.TYPE:
+            MESSAGE_CLASSES[cls.TYPE] = cls
+
+    def __init__(self, *args, **kwargs):
+        names = self._names
+        if len(args) > len(names):
+            raise TypeError(f"{type(self).__name__} takes at most {len(names)} fields")
+        values = dict(zip(names, args))
+        values.update(kwargs)
+        for name in names:
+            if name in values:
+                setattr(self, name, values.pop(name))
+            elif name in self._defaults:
+                setattr(self, name, self._defaults[name])
+            else:
+                raise TypeError(f"{type(self).__name__} is missing field '{name}'")
+        if values:
+            raise TypeError(f"{type(self).__name__} has no field '{next(iter(values))}'")
+
+    def to_payload(self):
+        """Payload dictionary, with unset optional fields left out (compiled per class)"""
+        return {}
+
+    def encode(self):
+        """Wire-ready bytes for this message (same output as encode_message)"""
+        return _dumps({"type": self.TYPE, "payload": self.to_payload()}) + b'\n'
+
+    @classmethod
+    def from_payload(cls, payload):
+        """Build the message from a decoded payload, ignoring unknown fields"""
+        return cls(**{name: payload[name] for name in cls._names if name in payload})
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._getter(self) == other._getter(other)
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={value!r}" for name, value in zip(self._names, self._getter(self)))
+        return f"{type(self).__name__}({fields})"
+
+
+_REQUIRED = object()
+MESSAGE_CLASSES = {}  # msg_type -> WireMessage subclass
+
+
+def _compile_to_payload(names, optional):
+    """Build a to_payload method with the field table unrolled, like dataclasses do for __init__"""
+    required = ', '.join(f"{name!r}: self.{name}" for name in names if name not in optional)
+    lines = ["def to_payload(self):", f"    payload = {{{required}}}"]
+    for name in names:
+        if name in optional:
+            lines.append(f"    if self.{name} is not None: payload[{name!r}] = self.{name}")
+    lines.append("    return payload")
+    namespace = {}
+    exec('\n'.join(lines), {}, namespace)
+    to_payload = namespace['to_payload']
+    to_payload.__doc__ = WireMessage.to_payload.__doc__
+    return to_payload
+
+
+def parse_message(data):
+    """Decode one JSON message into its typed WireMessage, or None if unknown or malformed"""
+    message = decode_message(data)
+    if message is None:
+        return None
+    cls = MESSAGE_CLASSES.get(message.get("type"))
+    if cls is None:
+        return None
+    try:
+        return cls.from_payload(message.get("payload") or {})
+    except TypeError:
+        return None
+
+
+# Client to Server
+
+class HelloMessage(WireMessage):
+    __slots__ = ('features',)
+    TYPE = MSG_HELLO
+    FIELDS = ('features',)
+
+
+class MakeMoveMessage(WireMessage):
+    __slots__ = ('move', 'seq')
+    TYPE = MSG_MAKE_MOVE
+    FIELDS = ('move', ('seq', None))
+
+
+class ResyncMessage(WireMessage):
+    __slots__ = ('since',)
+    TYPE = MSG_RESYNC
+    FIELDS = (('since', None),)
+
+
+class ResumeSessionMessage(WireMessage):
+    __slots__ = ('token',)
+    TYPE = MSG_RESUME_SESSION
+    FIELDS = ('token',)
+
+
+class PingMessage(WireMessage):
+    __slots__ = ()
+    TYPE = MSG_PING
+
+
+class PongMessage(WireMessage):
+    __slots__ = ()
+    TYPE = MSG_PONG
+
+
+# Server to Client
+
+class HelloAckMessage(WireMessage):
+    __slots__ = ('features',)
+    TYPE = MSG_HELLO_ACK
+    FIELDS = ('features',)
+
+
+class UserRegisteredMessage(WireMessage):
+    __slots__ = ('success', 'user_id')
+    TYPE = "user_registered"
+    FIELDS = ('success', 'user_id')
+
+
+class UserLoggedInMessage(WireMessage):
+    __slots__ = ('success', 'user', 'token')
+    TYPE = "user_logged_in"
+    FIELDS = ('success', ('user', None), ('token', None))  # token: session token for resume_session
+
+
+class ErrorMessage(WireMessage):
+    __slots__ = ('message', 'code', 'resource', 'rejected_type')
+    TYPE = MSG_ERROR
+    FIELDS = ('message', ('code', None), ('resource', None), ('rejected_type', None))
+
+
+class RoomCreatedMessage(WireMessage):
+    __slots__ = ('room_code',)
+    TYPE = MSG_ROOM_CREATED
+    FIELDS = ('room_code',)
+
+
+class RoomJoinedMessage(WireMessage):
+    __slots__ = ('success', 'room_code')
+    TYPE = MSG_ROOM_JOINED
+    FIELDS = ('success', 'room_code')
+
+
+class RoomUpdateMessage(WireMessage):
+    __slots__ = ('room_code', 'players')
+    TYPE = "room_update"
+    FIELDS = ('room_code', 'players')
+
+
+class RoomListMessage(WireMessage):
+    __slots__ = ('status', 'offset', 'total', 'rooms')
+    TYPE = MSG_ROOM_LIST
+    FIELDS = ('status', 'offset', 'total', 'rooms')  # rooms: [{'room_code', 'host', 'players', 'status'}, ...]
+
+
+class GameStartMessage(WireMessage):
+    __slots__ = ('players', 'player_info', 'game_state')
+    TYPE = MSG_GAME_START
+    FIELDS = ('players', 'player_info', 'game_state')
+
+
+class GameUpdateMessage(WireMessage):
+    __slots__ = ('game_state',)
+    TYPE = "game_update"
+    FIELDS = ('game_state',)
+
+
+class MoveAppliedMessage(WireMessage):
+    __slots__ = ('move', 'color', 'flipped', 'turn', 'scores', 'version')
+    TYPE = "move_applied"
+    FIELDS = ('move', 'color', 'flipped', 'turn', 'scores', 'version')
+
+
+class MoveResultMessage(WireMessage):
+    __slots__ = ('seq', 'success', 'version', 'reason')
+    TYPE = MSG_MOVE_RESULT
+    FIELDS = ('seq', 'success', 'version', ('reason', None))
+
+
+class InvalidMoveMessage(WireMessage):
+    __slots__ = ('reason', 'version')
+    TYPE = MSG_INVALID_MOVE
+    FIELDS = ('reason', 'version')
+
+
+class ReadyMessage(WireMessage):
+    __slots__ = ('queued', 'rating')
+    TYPE = MSG_READY
+    FIELDS = ('queued', ('rating', None))  # rating is the one you were queued with
+
+
+class MatchFoundMessage(WireMessage):
+    __slots__ = ('room_code', 'opponent', 'opponent_rating')
+    TYPE = MSG_MATCH_FOUND
+    FIELDS = ('room_code', 'opponent', 'opponent_rating')
+
+
+class GameOverMessage(WireMessage):
+    __slots__ = ('winner', 'scores')
+    TYPE = "game_over"
+    FIELDS = ('winner', 'scores')
+
+
+class LeaderboardTopMessage(WireMessage):
+    __slots__ = ('offset', 'entries')
+    TYPE = MSG_LEADERBOARD_TOP
+    FIELDS = ('offset', 'entries')  # entries: [{'rank', 'username', 'score'}, ...]
+
+
+class LeaderboardRankMessage(WireMessage):
+    __slots__ = ('username', 'rank', 'score')
+    TYPE = MSG_LEADERBOARD_RANK
+    FIELDS = ('username', ('rank', None), ('score', None))  # rank is 1-based; omitted if unranked
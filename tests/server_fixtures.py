@@ -0,0 +1,78 @@
+# tests/server_fixtures.py
+"""
+Shared setup for tests that drive UserManager and RoomManager over socket pairs
+"""
+
+import sys
+import os
+import json
+import shutil
+import socket
+import tempfile
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.password_hasher import PasswordHasher
+from server.room_manager import RoomManager
+from server.user_manager import UserManager
+from server.user_store import SqliteUserStore
+
+
+def read_messages(sock):
+    """Every message the server has written to `sock` so far"""
+    sock.settimeout(0.2)
+    data = b""
+    try:
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+            if data.endswith(b"\n"):
+                sock.settimeout(0.01)
+    except socket.timeout:
+        pass
+    return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+
+class ServerTestCase:
+    """Base class giving each test a fresh UserManager/RoomManager pair on a temporary store"""
+
+    def setup_method(self):
+        self.dir = tempfile.mkdtemp()
+        self.sockets = []
+        self.user_managers = []
+        self.user_manager = self._user_manager()
+        self.room_manager = RoomManager(self.user_manager)
+        self.user_manager.room_manager = self.room_manager
+
+    def teardown_method(self):
+        for sock in self.sockets:
+            sock.close()
+        for user_manager in self.user_managers:
+            user_manager.close()
+        shutil.rmtree(self.dir)
+
+    def _user_manager(self):
+        """A UserManager backed by its own store in the test directory"""
+        path = os.path.join(self.dir, "users%d.db" % len(self.user_managers))
+        user_manager = UserManager(store=SqliteUserStore(path, json_path=None),
+                                   password_hasher=PasswordHasher(rounds=4))
+        self.user_managers.append(user_manager)
+        return user_manager
+
+    def _connect(self, username, features=(), user_manager=None):
+        """Add a logged-in user on a socket pair; returns the user and the client end"""
+        user_manager = user_manager or self.user_manager
+        server_sock, client_sock = socket.socketpair()
+        self.sockets += [server_sock, client_sock]
+        user = user_manager.add_user(server_sock, ("test", len(self.sockets)))
+        user.username = username
+        if features:
+            user_manager.handle_message(
+                user, json.dumps({"type": "hello", "payload": {"features": list(features)}}))
+        return user, client_sock
+
+    def _messages(self, sock):
+        return read_messages(sock)
@@ -0,0 +1,189 @@
+# tests/test_client_network.py
+"""
+Unit tests for NetworkClient message handling (no running server required)
+"""
+
+import sys
+import os
+import json
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client.network import NetworkClient
+from server.game_manager import RealOthelloGame
+
+
+class _RecordingClient(NetworkClient):
+    """NetworkClient that records outgoing messages instead of sending them"""
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    def send_message(self, msg_type, payload=None):
+        self.sent.append((msg_type, payload))
+        return True
+
+
+def _deliver(client, msg_type, payload):
+    client._handle_message(json.dumps({'type': msg_type, 'payload': payload}))
+
+
+class TestMoveDeltas:
+    """Test cases for applying move_applied deltas on the client"""
+
+    def setup_method(self):
+        self.client = _RecordingClient()
+        self.client.current_game_state = RealOthelloGame().get_game_state()
+        self.moves = []
+        self.client.on_move_made = self.moves.append
+
+    def test_in_sequence_delta_is_applied(self):
+        """The next version updates the cached board, turn and scores"""
+        delta = {'move': [2, 3], 'color': 'black', 'flipped': [[3, 3]],
+                 'turn': 'white', 'scores': {'black': 4, 'white': 1}, 'version': 1}
+        _deliver(self.client, 'move_applied', delta)
+
+        state = self.client.current_game_state
+        assert state['board'][2][3] == 'black'
+        assert state['board'][3][3] == 'black'
+        assert state['turn'] == 'white'
+        assert state['version'] == 1
+        assert self.moves == [delta]
+        assert self.client.sent == []
+
+    def test_version_gap_requests_resync(self):
+        """A missed delta is not applied; the client asks for a full snapshot"""
+        delta = {'move': [2, 3], 'color': 'black', 'flipped': [[3, 3]],
+                 'turn': 'white', 'scores': {'black': 4, 'white': 1}, 'version': 5}
+        _deliver(self.client, 'move_applied', delta)
+
+        assert self.client.current_game_state['version'] == 0
+        assert self.moves == []
+        assert self.client.sent == [('resync', {'since': 0})]
+
+    def test_delta_updates_compact_board(self):
+        """Deltas also apply to a compact board64 state"""
+        self.client.current_game_state = RealOthelloGame().get_game_state(compact=True)
+        delta = {'move': [2, 3], 'color': 'black', 'flipped': [[3, 3]],
+                 'turn': 'white', 'scores': {'black': 4, 'white': 1}, 'version': 1}
+        _deliver(self.client, 'move_applied', delta)
+
+        board64 = self.client.current_game_state['board64']
+        assert board64[2 * 8 + 3] == 'B'
+        assert board64[3 * 8 + 3] == 'B'
+        assert board64.count('.') == 59
+
+    def test_replayed_delta_is_ignored(self):
+        """A delta the client already has (e.g. from a resync replay) is skipped quietly"""
+        delta = {'move': [2, 3], 'color': 'black', 'flipped': [[3, 3]],
+                 'turn': 'white', 'scores': {'black': 4, 'white': 1}, 'version': 1}
+        _deliver(self.client, 'move_applied', delta)
+        _deliver(self.client, 'move_applied', delta)
+        assert self.moves == [delta]
+        assert self.client.sent == []
+
+
+class TestMoveSequencing:
+    """Test cases for sequence-numbered move submission"""
+
+    def setup_method(self):
+        self.client = _RecordingClient()
+
+    def test_pipelined_moves_get_their_own_results(self):
+        """Each move_result reaches the callback of the move with the same seq"""
+        results = {}
+        self.client.make_move(3, 4, lambda payload: results.setdefault('first', payload))
+        self.client.make_move(5, 6, lambda payload: results.setdefault('second', payload))
+        assert [payload['seq'] for _, payload in self.client.sent] == [1, 2]
+
+        _deliver(self.client, 'move_result', {'seq': 2, 'success': False, 'version': 1})
+        _deliver(self.client, 'move_result', {'seq': 1, 'success': True, 'version': 1})
+        assert results['first']['success'] is True
+        assert results['second']['success'] is False
+        assert self.client._pending_moves == {}
+
+    def test_game_start_resets_sequence(self):
+        """Sequence numbers are per game"""
+        self.client.make_move(3, 4)
+        _deliver(self.client, 'game_start', {'players': {}, 'player_info': {}, 'game_state': {}})
+        self.client.make_move(3, 4)
+        assert [payload['seq'] for _, payload in self.client.sent] == [1, 1]
+
+    def test_rejection_resyncs_when_behind(self):
+        """A rejection carrying a newer version triggers a resync and the rejection hook"""
+        rejected = []
+        self.client.on_move_rejected = rejected.append
+        self.client.current_game_state = RealOthelloGame().get_game_state()
+        _deliver(self.client, 'invalid_move', {'reason': 'not_your_turn', 'version': 3})
+        assert self.client.sent == [('resync', {'since': 0})]
+        assert rejected == [{'reason': 'not_your_turn', 'version': 3}]
+
+
+class TestSessions:
+    """Test cases for session tokens on the client"""
+
+    def setup_method(self):
+        self.client = _RecordingClient()
+
+    def test_login_keeps_token_with_user_data(self):
+        """The token from user_logged_in is stored alongside the user data"""
+        results = []
+        self.client.login_user("alice", "secret", lambda success, user: results.append(user))
+        _deliver(self.client, 'user_logged_in', {'success': True, 'user': {'username': 'alice'}, 'token': 'T'})
+        assert results == [{'username': 'alice', 'session_token': 'T'}]
+
+    def test_room_requests_send_token_not_user_data(self):
+        """A new connection identifies itself with the token only"""
+        self.client.user_data = {'username': 'alice', 'session_token': 'T'}
+        self.client.create_room(lambda code: None)
+        self.client.join_room('ABC123', lambda success, code: None)
+        self.client.resume_session(lambda success, user: None)
+        assert self.client.sent == [('create_room', {'session_token': 'T'}),
+                                    ('join_room', {'room_code': 'ABC123', 'session_token': 'T'}),
+                                    ('resume_session', {'token': 'T'})]
+
+
+class TestLeaderboardRequests:
+    """Test cases for leaderboard requests on the client"""
+
+    def test_rank_reply_reaches_callback(self):
+        """An unranked reply gives (None, None)"""
+        client = _RecordingClient()
+        ranks = []
+        client.get_rank(lambda rank, score: ranks.append((rank, score)), "bob")
+        _deliver(client, 'leaderboard_rank', {'username': 'bob', 'rank': 3, 'score': 12})
+        _deliver(client, 'leaderboard_rank', {'username': 'bob'})
+        assert client.sent == [('leaderboard_rank', {'username': 'bob'})]
+        assert ranks == [(3, 12), (None, None)]
+
+
+class TestLobbyRequests:
+    """Test cases for lobby listings on the client"""
+
+    def test_room_list_reaches_callback(self):
+        """Only the given filters are sent; the callback gets (total, rooms)"""
+        client = _RecordingClient()
+        pages = []
+        client.list_rooms(lambda total, rooms: pages.append((total, rooms)), offset=20, search="ali")
+        room = {'room_code': 'ABCDE', 'host': 'alice', 'players': 1, 'status': 'waiting'}
+        _deliver(client, 'room_list', {'status': 'waiting', 'offset': 20, 'total': 21, 'rooms': [room]})
+        assert client.sent == [('list_rooms', {'offset': 20, 'search': 'ali'})]
+        assert pages == [(21, [room])]
+
+
+class TestMatchmakingRequests:
+    """Test cases for joining and leaving the matchmaking queue"""
+
+    def test_match_found_reaches_callback(self):
+        """find_match sends ready with the session token; cancel_match leaves the queue"""
+        client = _RecordingClient()
+        client.user_data = {'username': 'alice', 'session_token': 'T'}
+        matches = []
+        client.find_match(lambda room_code, opponent: matches.append((room_code, opponent)))
+        _deliver(client, 'match_found', {'room_code': 'ABCDE', 'opponent': 'bob', 'opponent_rating': 40})
+        client.cancel_match()
+        assert client.sent == [('ready', {'session_token': 'T'}), ('ready', {'ready': False})]
+        assert matches == [('ABCDE', 'bob')]
+        assert 'match_found' not in client.response_handlers
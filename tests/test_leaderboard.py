@@ -0,0 +1,142 @@
+# tests/test_leaderboard.py
+"""
+Unit tests for the score leaderboard (no running server required)
+"""
+
+import sys
+import os
+import json
+import random
+import shutil
+import socket
+import tempfile
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.leaderboard import IndexableSkipList, Leaderboard
+from server.metrics import metrics
+from server.password_hasher import PasswordHasher
+from server.user_manager import UserManager
+from server.user_store import SqliteUserStore
+
+
+class TestIndexableSkipList:
+    """The skip list agrees with a sorted Python list"""
+
+    def test_random_operations(self):
+        """Inserts, removals, ranks and slices match sorted() after every step"""
+        rng = random.Random(7)
+        skip_list = IndexableSkipList()
+        reference = []
+        for _ in range(2000):
+            if reference and rng.random() < 0.4:
+                key = rng.choice(reference)
+                skip_list.remove(key)
+                reference.remove(key)
+            else:
+                key = (rng.randint(-50, 0), f"user{rng.randint(0, 10 ** 6)}")
+                if key in reference:
+                    continue
+                skip_list.insert(key)
+                reference.append(key)
+                reference.sort()
+            assert len(skip_list) == len(reference)
+            if reference:
+                probe = rng.choice(reference)
+                assert skip_list.rank(probe) == reference.index(probe)
+                start = rng.randint(0, len(reference))
+                assert skip_list.slice(start, 5) == reference[start:start + 5]
+
+    def test_missing_key(self):
+        """Ranking or removing an absent key raises KeyError"""
+        skip_list = IndexableSkipList()
+        skip_list.insert((0, "a"))
+        for operation in (skip_list.rank, skip_list.remove):
+            try:
+                operation((0, "b"))
+                assert False, "Should have raised KeyError"
+            except KeyError:
+                pass
+
+
+class TestLeaderboard:
+    """Test cases for ranks, pages and the cached first page"""
+
+    def setup_method(self):
+        self.board = Leaderboard(top_size=3)
+        self.board.load([{'username': name, 'score': score}
+                         for name, score in (("alice", 10), ("bob", 30), ("carol", 20), ("dave", 5))])
+
+    def test_ranks_and_pages(self):
+        """Higher scores rank first; ties are ordered by username"""
+        assert self.board.rank("bob") == (1, 30)
+        assert self.board.rank("dave") == (4, 5)
+        assert self.board.rank("nobody") is None
+        assert [e['username'] for e in self.board.top(1, 2)] == ["carol", "alice"]
+        self.board.update("dave", 20)
+        assert [e['username'] for e in self.board.top()] == ["bob", "carol", "dave", "alice"]
+
+    def test_first_page_is_cached_until_it_changes(self):
+        """The encoded first page is reused while only lower ranks move"""
+        first = self.board.top_message()
+        hits = metrics.get('leaderboard.cache_hits')
+        assert self.board.top_message() is first
+        assert metrics.get('leaderboard.cache_hits') == hits + 1
+
+        self.board.update("dave", 6)  # Still fourth: the first page is unchanged
+        assert self.board.top_message() is first
+
+        self.board.update("dave", 25)  # Moves into the first page
+        page = json.loads(self.board.top_message())['payload']
+        assert [e['username'] for e in page['entries']] == ["bob", "dave", "carol"]
+        assert page['entries'][1] == {'rank': 2, 'username': 'dave', 'score': 25}
+
+    def test_page_arguments_are_validated(self):
+        """Bad offsets and limits fall back to sane values"""
+        page = json.loads(self.board.top_message("x", 10 ** 6))['payload']
+        assert page['offset'] == 0 and len(page['entries']) == 4
+        page = json.loads(self.board.top_message(-1, "all"))['payload']
+        assert page['offset'] == 0 and len(page['entries']) == 3
+        page = json.loads(self.board.top_message(3, 2))['payload']
+        assert [e['rank'] for e in page['entries']] == [4]
+
+    def test_rank_message(self):
+        """Unranked users get a reply without rank or score"""
+        assert json.loads(self.board.rank_message("carol"))['payload'] == {
+            'username': 'carol', 'rank': 2, 'score': 20}
+        assert json.loads(self.board.rank_message("nobody"))['payload'] == {'username': 'nobody'}
+
+
+class TestLeaderboardMessages:
+    """Leaderboard requests and committed game results through UserManager"""
+
+    def setup_method(self):
+        self.dir = tempfile.mkdtemp()
+        store = SqliteUserStore(os.path.join(self.dir, "users.db"), json_path=None)
+        for name, score in (("alice", 10), ("bob", 30)):
+            store.add({"user_id": name, "username": name, "email": "", "password": "",
+                       "score": score, "created_at": None})
+        self.user_manager = UserManager(store=store, password_hasher=PasswordHasher(rounds=4))
+        self.server_sock, self.client_sock = socket.socketpair()
+        self.user = self.user_manager.add_user(self.server_sock, ("test", 0))
+        self.user.username = "alice"
+
+    def teardown_method(self):
+        self.server_sock.close()
+        self.client_sock.close()
+        self.user_manager.close()
+        shutil.rmtree(self.dir)
+
+    def _request(self, msg_type, payload):
+        self.user_manager.handle_message(self.user, json.dumps({"type": msg_type, "payload": payload}))
+        return json.loads(self.client_sock.recv(65536).decode("utf-8").splitlines()[-1])["payload"]
+
+    def test_rank_follows_committed_scores(self):
+        """A committed game result moves the player up the leaderboard"""
+        assert self._request("leaderboard_rank", {}) == {'username': 'alice', 'rank': 2, 'score': 10}
+        self.user_manager.update_user_score("alice", 25)
+        self.user_manager.score_committer.flush()
+        assert self._request("leaderboard_rank", {}) == {'username': 'alice', 'rank': 1, 'score': 35}
+        top = self._request("leaderboard_top", {"limit": 1})
+        assert top['entries'] == [{'rank': 1, 'username': 'alice', 'score': 35}]
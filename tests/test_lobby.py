@@ -0,0 +1,95 @@
+# tests/test_lobby.py
+"""
+Unit tests for the lobby room index (no running server required)
+"""
+
+import sys
+import os
+import json
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.lobby import LOBBY_FINISHED, LOBBY_PLAYING, LOBBY_WAITING
+from server.metrics import metrics
+from tests.server_fixtures import ServerTestCase
+
+
+class TestLobbyIndex(ServerTestCase):
+    """The index follows RoomManager and serves pages without scanning rooms"""
+
+    def setup_method(self):
+        super().setup_method()
+        self.lobby = self.room_manager.lobby
+
+    def _codes(self, status=LOBBY_WAITING, **kwargs):
+        return [entry['room_code'] for entry in self.lobby.page(status, **kwargs)[1]]
+
+    def test_rooms_move_between_listings(self):
+        """Create, join, finish and leave each update the room's listing"""
+        alice, _ = self._connect("alice")
+        bob, _ = self._connect("bob")
+        code = self.room_manager.create_room(alice)
+        assert self.lobby.page() == (1, [{'room_code': code, 'host': 'alice', 'players': 1,
+                                          'status': LOBBY_WAITING}])
+
+        self.room_manager.join_room(bob, code)
+        assert self._codes() == [] and self._codes(LOBBY_PLAYING) == [code]
+
+        room = self.room_manager.rooms[code]
+        room.game_manager.game.game_over = True
+        room.game_manager.end_game()
+        assert self._codes(LOBBY_PLAYING) == [] and self._codes(LOBBY_FINISHED) == [code]
+
+        self.room_manager.leave_room(alice)
+        assert self.lobby.page(LOBBY_FINISHED)[1][0]['host'] == 'bob'
+        self.room_manager.leave_room(bob)
+        assert len(self.lobby) == 0
+
+    def test_pages_and_search(self):
+        """Pages keep creation order; search matches part of the host name"""
+        codes = [self.room_manager.create_room(self._connect(name)[0])
+                 for name in ("alice", "bob", "alicia", "carol")]
+        assert self._codes(offset=1, limit=2) == codes[1:3]
+        assert self.lobby.page(search="ALI")[0] == 2
+        assert self._codes(search="ali", offset=1) == [codes[2]]
+
+    def test_first_page_is_cached_until_waiting_rooms_change(self):
+        """The encoded default page is reused until a waiting room changes"""
+        alice, _ = self._connect("alice")
+        code = self.room_manager.create_room(alice)
+        first = self.lobby.page_message()
+        hits = metrics.get('lobby.cache_hits')
+        assert self.lobby.page_message() is first
+        assert metrics.get('lobby.cache_hits') == hits + 1
+
+        self.room_manager.join_room(self._connect("bob")[0], code)
+        page = json.loads(self.lobby.page_message())['payload']
+        assert page == {'status': LOBBY_WAITING, 'offset': 0, 'total': 0, 'rooms': []}
+
+    def test_list_rooms_message(self):
+        """list_rooms is answered with a validated room_list page"""
+        alice, alice_sock = self._connect("alice")
+        self.room_manager.create_room(self._connect("bob")[0])
+        self.user_manager.handle_message(alice, json.dumps(
+            {"type": "list_rooms", "payload": {"offset": -3, "limit": "all", "status": "bogus"}}))
+        reply = self._messages(alice_sock)[-1]
+        assert reply['type'] == 'room_list'
+        assert reply['payload']['total'] == 1 and reply['payload']['rooms'][0]['host'] == 'bob'
+
+    def test_player_in_a_room_cannot_take_another(self):
+        """create_room and join_room are refused while the player is seated, so no room is stranded"""
+        alice, alice_sock = self._connect("alice")
+        bob, _ = self._connect("bob")
+        code = self.room_manager.create_room(alice)
+        other = self.room_manager.create_room(bob)
+        self.user_manager.handle_message(alice, json.dumps({"type": "create_room", "payload": {}}))
+        self.user_manager.handle_message(alice, json.dumps({"type": "join_room", "payload": {"room_code": other}}))
+        replies = self._messages(alice_sock)
+        assert [r['type'] for r in replies] == ['error', 'room_joined']
+        assert replies[1]['payload']['success'] is False
+        assert alice.current_room is self.room_manager.rooms[code]
+
+        self.user_manager.remove_user(alice)
+        self.user_manager.remove_user(bob)
+        assert not self.room_manager.rooms and len(self.lobby) == 0
@@ -0,0 +1,121 @@
+# tests/test_matchmaking.py
+"""
+Unit tests for the rating-based matchmaking queue (no running server required)
+"""
+
+import sys
+import os
+import json
+import threading
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.matchmaking import Matchmaker
+from server.metrics import metrics
+from tests.server_fixtures import ServerTestCase
+
+
+class TestMatchmaker(ServerTestCase):
+    """Test cases for pairing, window widening and cancellation"""
+
+    def setup_method(self):
+        super().setup_method()
+        self.matchmaker = Matchmaker(self.room_manager, initial_window=50, window_growth=10, max_window=500)
+        self.user_manager.matchmaker = self.matchmaker
+
+    def test_close_ratings_match_at_once(self):
+        """Two players within the initial window share a started game"""
+        alice, alice_sock = self._connect("alice")
+        bob, bob_sock = self._connect("bob")
+        matches = metrics.get('matchmaking.matches')
+        self.matchmaker.enqueue(alice, 1000, now=0)
+        self.matchmaker.enqueue(bob, 1040, now=1)
+
+        assert alice.current_room is bob.current_room is not None
+        assert alice.current_room.game_manager is not None
+        assert len(self.matchmaker) == 0
+        assert metrics.get('matchmaking.matches') == matches + 1
+        types = [m["type"] for m in self._messages(bob_sock)]
+        assert types[0] == "match_found" and "game_start" in types and "room_update" in types
+        found = self._messages(alice_sock)[0]["payload"]
+        assert found == {"room_code": alice.current_room.code, "opponent": "bob", "opponent_rating": 1040}
+
+    def test_window_widens_with_waiting_time(self):
+        """Distant players are paired by tick once the window has grown"""
+        alice, _ = self._connect("alice")
+        bob, _ = self._connect("bob")
+        self.matchmaker.enqueue(alice, 1000, now=0)
+        self.matchmaker.enqueue(bob, 1150, now=0)
+        assert self.matchmaker.tick(now=5) == 0  # Window 100
+        assert self.matchmaker.tick(now=10) == 1  # Window 150
+        assert alice.current_room is bob.current_room is not None
+
+    def test_new_neighbours_are_scheduled(self):
+        """Leaving the queue makes the players on either side neighbours with their own due time"""
+        players = {name: self._connect(name)[0] for name in ("a", "b", "c")}
+        self.matchmaker.enqueue(players["a"], 1000, now=0)
+        self.matchmaker.enqueue(players["c"], 1200, now=0)
+        self.matchmaker.enqueue(players["b"], 1100, now=0)
+        self.matchmaker.cancel(players["b"])
+        assert self.matchmaker.tick(now=14) == 0  # Window 190
+        assert self.matchmaker.tick(now=15) == 1  # Window 200
+        assert players["a"].current_room is players["c"].current_room is not None
+
+    def test_match_waits_for_the_room_lock(self):
+        """Seating a matched pair is serialized with room handlers"""
+        alice, _ = self._connect("alice")
+        bob, _ = self._connect("bob")
+        self.matchmaker.enqueue(alice, 1000, now=0)
+        room_manager = self.user_manager.room_manager
+        with room_manager.lock:
+            matcher = threading.Thread(target=self.matchmaker.enqueue, args=(bob, 1000, 0))
+            matcher.start()
+            matcher.join(0.2)
+            assert matcher.is_alive() and not room_manager.rooms
+        matcher.join(1)
+        assert alice.current_room is bob.current_room is not None
+
+    def test_nearest_neighbour_is_chosen(self):
+        """A new player is paired with the closest rating that fits"""
+        players = {name: self._connect(name)[0] for name in ("a", "b", "c")}
+        self.matchmaker.enqueue(players["a"], 100, now=0)
+        self.matchmaker.enqueue(players["b"], 300, now=0)
+        self.matchmaker.enqueue(players["c"], 280, now=0)
+        assert players["b"].current_room is players["c"].current_room is not None
+        assert players["a"].current_room is None and len(self.matchmaker) == 1
+
+    def test_cancel_and_disconnect_leave_the_queue(self):
+        """Cancelled or disconnected players are never matched"""
+        alice, _ = self._connect("alice")
+        bob, _ = self._connect("bob")
+        carol, _ = self._connect("carol")
+        self.matchmaker.enqueue(alice, 1000, now=0)
+        assert self.matchmaker.cancel(alice) and not self.matchmaker.cancel(alice)
+        self.matchmaker.enqueue(bob, 1000, now=0)
+        self.user_manager.remove_user(bob)
+        self.matchmaker.enqueue(carol, 1000, now=0)
+        assert carol.current_room is None and len(self.matchmaker) == 1
+
+    def test_ready_message(self):
+        """"ready" queues at the leaderboard score and "ready": false leaves"""
+        self.user_manager.leaderboard.update("alice", 1200)
+        alice, alice_sock = self._connect("alice")
+        self.user_manager.handle_message(alice, json.dumps({"type": "ready", "payload": {}}))
+        assert self._messages(alice_sock) == [{"type": "ready", "payload": {"queued": True, "rating": 1200}}]
+        assert len(self.matchmaker) == 1
+
+        self.user_manager.handle_message(alice, json.dumps({"type": "ready", "payload": {"ready": False}}))
+        assert self._messages(alice_sock) == [{"type": "ready", "payload": {"queued": False}}]
+        assert len(self.matchmaker) == 0
+
+    def test_snapshot_round_trip(self):
+        """Queued players keep their waiting time across a handoff"""
+        alice, _ = self._connect("alice")
+        self.matchmaker.enqueue(alice, 1000, now=0)
+        snapshot = self.matchmaker.to_snapshot(now=30)
+        assert snapshot == [[alice.user_id, 1000, 30]]
+
+        restored = Matchmaker(self.user_manager.room_manager)
+        restored.restore_snapshot(snapshot, {alice.user_id: alice}, now=100)
+        assert restored.to_snapshot(now=100) == [[alice.user_id, 1000, 30]]
@@ -306,9 +306,53 @@ class TestNetworkConstants:
         assert (0, 1) in DIRECTIONS    # Right
         assert (0, -1) in DIRECTIONS   # Left
 
+class TestWireMessages:
+    """Test cases for the typed wire messages and the canonical encode/decode path"""
+    
+    def test_typed_message_round_trip(self):
+        """A typed message encodes to one JSON line and parses back equal"""
+        msg = MoveAppliedMessage([2, 3], 'black', [[3, 3]], 'white', {'black': 4, 'white': 1}, 1)
+        data = msg.encode()
+        assert data.endswith(b"\n") and data.count(b"\n") == 1
+        assert json.loads(data)["payload"]["flipped"] == [[3, 3]]
+        assert parse_message(data) == msg
+    
+    def test_optional_fields_are_omitted(self):
+        """Unset optional fields are left out of the payload"""
+        assert ErrorMessage("Invalid move.").to_payload() == {"message": "Invalid move."}
+        assert UserLoggedInMessage(False).to_payload() == {"success": False}
+        try:
+            RoomJoinedMessage(True)
+            assert False, "Should have raised TypeError"
+        except TypeError:
+            pass
+    
+    def test_messages_are_slotted(self):
+        """Typed messages carry no per-instance __dict__"""
+        assert not hasattr(MakeMoveMessage([0, 0]), "__dict__")
+    
+    def test_every_backend_encodes_identically(self):
+        """Peers never depend on which JSON backend the other side runs"""
+        msg = GameOverMessage("black", {"black": 40, "white": 24, "note": "\u00e9"})
+        active = json_backend
+        try:
+            outputs = set()
+            for backend in JSON_BACKENDS:
+                try:
+                    set_json_backend(backend)
+                except ImportError:
+                    continue
+                outputs.add(msg.encode())
+                assert decode_message(msg.encode())["payload"] == msg.to_payload()
+                assert decode_message(b"{not json") is None
+                assert decode_message(b"\xff") is None
+            assert len(outputs) == 1
+        finally:
+            set_json_backend(active)
+
 def run_network_tests():
     """Run all network tests manually"""
-    test_classes = [TestMessageProtocol, TestUtilityFunctions, TestNetworkConstants]
+    test_classes = [TestMessageProtocol, TestWireMessages, TestUtilityFunctions, TestNetworkConstants]
     
     total_tests = 0
     passed_tests = 0
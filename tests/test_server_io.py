@@ -0,0 +1,299 @@
+# tests/test_server_io.py
+"""
+Unit tests for server-side connection I/O (no running server required)
+"""
+
+import sys
+import os
+import json
+import socket
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.user_manager import User, UserManager
+from server.room_manager import RoomManager
+from server.heartbeat import HeartbeatMonitor
+from server.protocols import Protocol
+from server.coalescing import coalesce, estimate_packets
+from server.metrics import metrics
+from server.game_manager import RealOthelloGame
+from shared import codec
+from server.compression import compress_for
+from shared.messages import FEATURE_BINARY_CODEC, FEATURE_DEFLATE
+
+
+def _read_lines(sock, count):
+    """Read `count` newline-terminated messages from a socket"""
+    data = b""
+    while data.count(b"\n") < count:
+        data += sock.recv(65536)
+    return [Protocol.parse_message(line) for line in data.decode('utf-8').splitlines()]
+
+
+class TestWriteCoalescing:
+    """Test cases for per-connection write coalescing"""
+
+    def setup_method(self):
+        self.server_sock, self.client_sock = socket.socketpair()
+        self.user = User(self.server_sock, ("test", 0))
+        metrics.reset()
+
+    def teardown_method(self):
+        self.server_sock.close()
+        self.client_sock.close()
+
+    def test_send_outside_scope_flushes_immediately(self):
+        """Each send outside a coalescing block is its own syscall"""
+        self.user.send(Protocol.room_created("ABCDE"))
+        self.user.send(Protocol.room_joined(True, "ABCDE"))
+
+        messages = _read_lines(self.client_sock, 2)
+        assert [m['type'] for m in messages] == ['room_created', 'room_joined']
+        assert metrics.get('net.send_syscalls') == 2
+
+    def test_sends_inside_scope_are_coalesced(self):
+        """All sends inside one block go out with a single syscall"""
+        with coalesce():
+            self.user.send(Protocol.room_joined(True, "ABCDE"))
+            self.user.send(Protocol.room_update("ABCDE", [self.user]))
+            self.user.send(Protocol.error("test"))
+            assert metrics.get('net.send_syscalls') == 0
+
+        messages = _read_lines(self.client_sock, 3)
+        assert [m['type'] for m in messages] == ['room_joined', 'room_update', 'error']
+        assert metrics.get('net.send_syscalls') == 1
+        assert metrics.get('net.messages_out') == 3
+        assert metrics.get('net.packets_out') == 1
+
+    def test_nested_scopes_flush_once(self):
+        """Only the outermost block flushes"""
+        with coalesce():
+            self.user.send(Protocol.error("outer"))
+            with coalesce():
+                self.user.send(Protocol.error("inner"))
+            assert metrics.get('net.send_syscalls') == 0
+
+        assert len(_read_lines(self.client_sock, 2)) == 2
+        assert metrics.get('net.send_syscalls') == 1
+
+    def test_packet_estimate(self):
+        """Packet estimates round up to whole segments"""
+        assert estimate_packets(1) == 1
+        assert estimate_packets(1448) == 1
+        assert estimate_packets(1449) == 2
+
+
+class TestPreEncodedMessages:
+    """Test cases for wire-ready Protocol messages"""
+
+    def test_builders_return_framed_bytes(self):
+        """Builders return UTF-8 JSON with the newline delimiter included"""
+        message = Protocol.game_over('black', {'black': 40, 'white': 24})
+        assert isinstance(message, bytes)
+        assert message.endswith(b"\n") and message.count(b"\n") == 1
+        assert Protocol.parse_message(message)['payload']['winner'] == 'black'
+
+    def test_broadcast_shares_one_buffer(self):
+        """Every recipient queues the very same bytes object"""
+        users = [User(socket.socket(), ("test", i)) for i in range(3)]
+        message = Protocol.room_update("ABCDE", users)
+        with coalesce():
+            for user in users:
+                user.send(message)
+            assert all(user._outbox[0] is message for user in users)
+            for user in users:
+                user._outbox.clear()  # Nothing to flush to the unconnected sockets
+        for user in users:
+            user.connection.close()
+
+
+class TestHeartbeat:
+    """Test cases for heartbeats and the idle reaper"""
+
+    def setup_method(self):
+        self.user_manager = UserManager()
+        self.user_manager.room_manager = RoomManager(self.user_manager)
+        self.monitor = HeartbeatMonitor(self.user_manager, interval=10, timeout=30)
+        self.server_sock, self.client_sock = socket.socketpair()
+        self.user = self.user_manager.add_user(self.server_sock, ("test", 0))
+        metrics.reset()
+
+    def teardown_method(self):
+        self.server_sock.close()
+        self.client_sock.close()
+
+    def test_active_connection_is_left_alone(self):
+        """Connections that spoke recently are neither pinged nor reaped"""
+        self.monitor.tick(now=self.user.last_seen + 1)
+        assert metrics.get('heartbeat.pings_sent') == 0
+        assert not self.user.reaped
+
+    def test_quiet_connection_is_pinged_once_per_interval(self):
+        """A quiet connection gets one ping per interval"""
+        start = self.user.last_seen
+        self.monitor.tick(now=start + 11)
+        self.monitor.tick(now=start + 12)
+        assert metrics.get('heartbeat.pings_sent') == 1
+        assert _read_lines(self.client_sock, 1)[0]['type'] == 'ping'
+
+        self.monitor.tick(now=start + 22)
+        assert metrics.get('heartbeat.pings_sent') == 2
+
+    def test_silent_connection_is_reaped(self):
+        """A connection silent past the timeout is shut down and its seat counted"""
+        self.user_manager.room_manager.create_room(self.user)
+        self.monitor.tick(now=self.user.last_seen + 31)
+
+        assert self.user.reaped
+        assert metrics.get('heartbeat.reaped_connections') == 1
+        assert metrics.get('heartbeat.reclaimed_seats') == 1
+        # The peer sees EOF, and so does the handler thread blocked in recv
+        self.client_sock.settimeout(1)
+        assert self.client_sock.recv(1024) == b""
+
+    def test_periodic_tasks_run_every_tick(self):
+        """Extra tasks share the heartbeat timer"""
+        calls = []
+        self.monitor.add_task(lambda: calls.append(1))
+        self.monitor.tick()
+        self.monitor.tick()
+        assert len(calls) == 2
+
+
+class TestBinaryCodec:
+    """Test cases for the negotiated binary codec"""
+
+    def test_move_applied_round_trip(self):
+        """A binary move_applied decodes to the same payload as the JSON one"""
+        game = RealOthelloGame()
+        game.make_move((2, 3), 'black')
+        move, color, flipped = game.last_move
+        args = (move, color, flipped, 'white', game.scores, game.version)
+        binary = Protocol.move_applied(*args, binary=True)
+        messages, rest = codec.split_frames(binary)
+        assert rest == b""
+        assert messages == [Protocol.parse_message(Protocol.move_applied(*args))]
+        assert len(binary) * 3 < len(Protocol.move_applied(*args))
+
+    def test_game_update_round_trip(self):
+        """A binary game_update carries the full compact state"""
+        game = RealOthelloGame()
+        game.make_move((2, 3), 'black')
+        state = game.get_game_state(compact=True)
+        messages, _ = codec.split_frames(Protocol.game_update(state, binary=True))
+        assert messages == [{'type': 'game_update', 'payload': {'game_state': state}}]
+
+    def test_mixed_stream_and_partial_frames(self):
+        """JSON lines and binary frames interleave, and split frames wait for more bytes"""
+        stream = b'{"type": "hello"}\n' + codec.encode_make_move(2, 3) + codec.encode_pong()
+        decoder = codec.FrameDecoder()
+        received = []
+        for i in range(len(stream)):
+            received += decoder.feed(stream[i:i + 1])
+        assert received == [b'{"type": "hello"}', {'type': 'make_move', 'payload': {'move': [2, 3]}},
+                            {'type': 'pong', 'payload': {}}]
+        assert decoder.buffer == b""
+
+    def test_sequenced_move_frames(self):
+        """make_move with a seq and move_result round-trip through the binary codec"""
+        messages, _ = codec.split_frames(codec.encode_make_move(2, 3, seq=70000)
+                                         + Protocol.move_result(70000, True, 12, binary=True))
+        assert messages == [{'type': 'make_move', 'payload': {'move': [2, 3], 'seq': 70000}},
+                            Protocol.parse_message(Protocol.move_result(70000, True, 12))]
+
+    def test_rejection_frames_carry_reason(self):
+        """Binary move_result and invalid_move keep the rejection reason"""
+        messages, _ = codec.split_frames(Protocol.move_result(3, False, 9, 'not_your_turn', binary=True)
+                                         + Protocol.invalid_move('invalid_move', 9, binary=True))
+        assert messages == [Protocol.parse_message(Protocol.move_result(3, False, 9, 'not_your_turn')),
+                            Protocol.parse_message(Protocol.invalid_move('invalid_move', 9))]
+
+    def test_unknown_frame_is_reported(self):
+        """Unknown message IDs are returned as a CodecError, not raised"""
+        messages, rest = codec.split_frames(b'\x00\x00\x01\x7f{"type": "ping"}\n')
+        assert isinstance(messages[0], codec.CodecError)
+        assert messages[1] == b'{"type": "ping"}'
+        assert rest == b""
+
+    def test_binary_client_gets_binary_pong(self):
+        """Only clients that negotiated the codec get binary replies"""
+        user_manager = UserManager()
+        server_sock, client_sock = socket.socketpair()
+        client_sock.settimeout(1)
+        try:
+            user = user_manager.add_user(server_sock, ("test", 0))
+            user_manager.handle_message(user, json.dumps({"type": "ping"}))
+            assert _read_lines(client_sock, 1)[0]['type'] == 'pong'
+
+            user_manager.handle_message(
+                user, json.dumps({"type": "hello", "payload": {"features": [FEATURE_BINARY_CODEC]}}))
+            _read_lines(client_sock, 1)  # hello_ack
+            user_manager.handle_message(user, codec.split_frames(codec.encode_ping())[0][0])
+            assert client_sock.recv(1024) == codec.encode_pong()
+        finally:
+            server_sock.close()
+            client_sock.close()
+
+
+class TestDeflate:
+    """Test cases for negotiated per-message compression"""
+
+    def setup_method(self):
+        metrics.reset()
+
+    def test_large_message_round_trip(self):
+        """A full legacy snapshot shrinks to a fraction and inflates back unchanged"""
+        message = Protocol.game_update(RealOthelloGame().get_game_state())
+        compressed = compress_for(message, {FEATURE_DEFLATE})
+        assert compressed[0] == codec.DEFLATE_MARKER
+        assert len(compressed) * 4 < len(message)
+        assert codec.split_frames(compressed) == ([message.rstrip(b"\n")], b"")
+
+    def test_small_or_unnegotiated_messages_are_untouched(self):
+        """Messages under the threshold, binary frames and legacy clients are sent as is"""
+        large = Protocol.game_update(RealOthelloGame().get_game_state())
+        assert compress_for(Protocol.ping(), {FEATURE_DEFLATE}) == Protocol.ping()
+        assert compress_for(large, frozenset()) is large
+        binary = Protocol.game_update(RealOthelloGame().get_game_state(compact=True), binary=True)
+        assert compress_for(binary, {FEATURE_DEFLATE}, threshold=0) is binary
+
+    def test_metrics_per_message_type(self):
+        """Ratio and CPU time are recorded under the message type"""
+        message = Protocol.game_update(RealOthelloGame().get_game_state())
+        compressed = compress_for(message, {FEATURE_DEFLATE})
+        assert metrics.get('compression.bytes_in.game_update') == len(message)
+        assert metrics.get('compression.bytes_out.game_update') == len(compressed)
+        assert 0 < metrics.get('compression.ratio.game_update') < 0.25
+        assert metrics.snapshot()['timings']['compression.cpu.game_update']['count'] == 1
+
+    def test_server_side_limits(self):
+        """Unnegotiated deflate or binary frames and messages over max_length raise, even when incomplete"""
+        compressed = compress_for(Protocol.game_update(RealOthelloGame().get_game_state()), {FEATURE_DEFLATE})
+        for buffer, kwargs in ((compressed, {'allow_deflate': False}),
+                               (codec.encode_ping(), {'allow_binary': False}),
+                               (compressed[:5], {'max_length': len(compressed) - 6}),
+                               (b'{"type": "' + b"a" * 100, {'max_length': 64}),
+                               (b'{"type": "' + b"a" * 100 + b'"}\n', {'max_length': 64})):
+            try:
+                codec.split_frames(buffer, **kwargs)
+                assert False, "Should have raised CodecError"
+            except codec.CodecError:
+                pass
+        assert codec.split_frames(compressed[:5], allow_deflate=True, max_length=len(compressed) - 5) == \
+            ([], compressed[:5])
+
+    def test_inflated_size_follows_max_length(self):
+        """A small deflate frame that inflates past max_length is reported, not returned"""
+        frame = codec.deflate_message(b'{"type": "x", "payload": "' + b"a" * 1000 + b'"}\n')
+        assert len(frame) < 64
+        messages, _ = codec.split_frames(frame, max_length=512)
+        assert isinstance(messages[0], codec.CodecError)
+        assert codec.split_frames(frame, max_length=2048)[0][0].startswith(b'{"type": "x"')
+
+    def test_oversized_frame_is_rejected(self):
+        """A frame that inflates past the limit is reported, not expanded"""
+        bomb = codec.deflate_message(b'{"type": "x", "payload": "' + b"a" * (codec.MAX_INFLATED_SIZE + 1) + b'"}\n')
+        messages, rest = codec.split_frames(bomb + b'{"type": "ping"}\n')
+        assert isinstance(messages[0], codec.CodecError)
+        assert messages[1] == b'{"type": "ping"}'
@@ -0,0 +1,191 @@
+# tests/test_server_limits.py
+"""
+Unit tests for server rate limiting and admission control (no running server required)
+"""
+
+import sys
+import os
+import json
+import socket
+import threading
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.rate_limiter import TokenBucket, RateLimiter
+from server.user_manager import UserManager
+from server.room_manager import RoomManager
+from server.main_server import MAX_MESSAGE_SIZE, Server
+from server.metrics import metrics
+from shared import codec
+from shared.messages import ERROR_RATE_LIMITED, ERROR_SERVER_FULL
+
+
+class TestTokenBucket:
+    """Test cases for the token bucket"""
+
+    def test_burst_then_refill(self):
+        """A full bucket allows a burst, then refills at the configured rate"""
+        bucket = TokenBucket(rate=2, capacity=3, now=0)
+        assert [bucket.consume(0) for _ in range(4)] == [True, True, True, False]
+        assert bucket.consume(0.5)       # One token back after half a second
+        assert not bucket.consume(0.5)
+
+    def test_refill_is_capped(self):
+        """Idle time never accumulates more than the burst size"""
+        bucket = TokenBucket(rate=1, capacity=2, now=0)
+        bucket.consume(0)
+        bucket.consume(0)
+        assert [bucket.consume(100) for _ in range(3)] == [True, True, False]
+
+
+class TestRateLimiter:
+    """Test cases for per-connection, per-type limits"""
+
+    def test_types_have_independent_buckets(self):
+        """Exhausting one type does not throttle another"""
+        limiter = RateLimiter({'make_move': (1, 1), 'join_room': (1, 1)}, (100, 100))
+        assert limiter.allow('make_move', now=0) == (True, False)
+        assert limiter.allow('make_move', now=0) == (False, True)
+        assert limiter.allow('make_move', now=0) == (False, False)
+        assert limiter.allow('join_room', now=0) == (True, False)
+
+    def test_connection_limit_covers_all_types(self):
+        """The connection bucket limits unlisted types too"""
+        limiter = RateLimiter({}, (2, 2))
+        assert limiter.allow('anything', now=0)[0]
+        assert limiter.allow(None, now=0)[0]
+        assert not limiter.allow('anything', now=0)[0]
+
+    def test_streak_resets_after_allowed_message(self):
+        """A new throttled streak is reported again"""
+        limiter = RateLimiter({'make_move': (1, 1)}, (100, 100))
+        limiter.allow('make_move', now=0)
+        assert limiter.allow('make_move', now=0) == (False, True)
+        assert limiter.allow('make_move', now=1) == (True, False)
+        assert limiter.allow('make_move', now=1) == (False, True)
+
+
+class TestMessageThrottling:
+    """Test cases for throttling in UserManager.handle_message"""
+
+    def setup_method(self):
+        self.user_manager = UserManager()
+        self.user_manager.room_manager = RoomManager(self.user_manager)
+        self.server_sock, self.client_sock = socket.socketpair()
+        self.user = self.user_manager.add_user(self.server_sock, ("test", 0))
+        metrics.reset()
+
+    def teardown_method(self):
+        self.server_sock.close()
+        self.client_sock.close()
+
+    def test_flood_gets_one_rejection(self):
+        """A flood is rejected with a single rate_limited error"""
+        message = json.dumps({"type": "make_move", "payload": {"move": [2, 3]}})
+        for _ in range(50):
+            self.user_manager.handle_message(self.user, message)
+
+        self.client_sock.settimeout(1)
+        replies = [json.loads(line) for line in self.client_sock.recv(65536).decode().splitlines()]
+        rejections = [r for r in replies if r['payload'].get('code') == ERROR_RATE_LIMITED]
+        assert len(rejections) == 1
+        assert metrics.get('ratelimit.throttled.make_move') == 30
+        assert metrics.get('ratelimit.throttled_streaks') == 1
+
+
+    def test_type_after_payload_is_still_limited(self):
+        """A message whose "type" is not its first key is charged once it is parsed"""
+        message = json.dumps({"payload": {}, "type": "create_room"})
+        for _ in range(10):
+            self.user_manager.handle_message(self.user, message)
+        assert metrics.get('ratelimit.throttled.create_room') == 7
+
+class TestAdmissionControl:
+    """Test cases for connection, room and in-flight limits"""
+
+    def setup_method(self):
+        self.server = Server('127.0.0.1', 0, max_connections=1, max_rooms=1, max_inflight=1)
+        self.sockets = []
+        metrics.reset()
+
+    def teardown_method(self):
+        self.server.socket.close()
+        for sock in self.sockets:
+            sock.close()
+
+    def _pair(self):
+        server_sock, client_sock = socket.socketpair()
+        self.sockets += [server_sock, client_sock]
+        client_sock.settimeout(1)
+        return server_sock, client_sock
+
+    def test_over_capacity_connection_is_rejected(self):
+        """Connections over the limit get server_full and are closed"""
+        server_sock, client_sock = self._pair()
+        self.server._reject_connection(server_sock, ("test", 0))
+
+        reply = json.loads(client_sock.recv(65536).decode().splitlines()[0])
+        assert reply['payload']['code'] == ERROR_SERVER_FULL
+        assert reply['payload']['resource'] == 'connections'
+        assert client_sock.recv(1024) == b""
+        assert metrics.get('admission.rejected_connections') == 1
+
+    def test_room_limit(self):
+        """create_room over the room limit is answered with server_full"""
+        user_manager = self.server.user_manager
+        first = user_manager.add_user(self._pair()[0], ("a", 0))
+        server_sock, client_sock = self._pair()
+        second = user_manager.add_user(server_sock, ("b", 0))
+
+        user_manager.handle_message(first, json.dumps({"type": "create_room", "payload": {}}))
+        user_manager.handle_message(second, json.dumps({"type": "create_room", "payload": {}}))
+
+        reply = json.loads(client_sock.recv(65536).decode().splitlines()[0])
+        assert reply['payload']['code'] == ERROR_SERVER_FULL
+        assert reply['payload']['resource'] == 'rooms'
+        assert len(self.server.room_manager.rooms) == 1
+        assert metrics.get('admission.rejected_rooms') == 1
+
+    def test_inflight_limit_sheds_messages(self):
+        """Messages read while over the in-flight limit are shed, except pongs"""
+        assert self.server._enter_dispatch() is False
+        assert self.server._enter_dispatch() is True
+        self.server._exit_dispatch()
+        self.server._exit_dispatch()
+
+        server_sock, client_sock = self._pair()
+        user = self.server.user_manager.add_user(server_sock, ("a", 0))
+        user.pending = b'{"type": "pong"}\n{"type": "create_room", "payload": {}}\n'
+        self.server._process_pending(user, overloaded=True)
+
+        replies = [json.loads(line) for line in client_sock.recv(65536).decode().splitlines()]
+        assert len(replies) == 1
+        assert replies[0]['payload']['resource'] == 'workers'
+        assert replies[0]['payload']['rejected_type'] == 'create_room'
+        assert not self.server.room_manager.rooms
+        assert metrics.get('admission.shed_messages') == 1
+
+    def _serve_one(self):
+        """(client socket, handler thread) for one TCP connection served by handle_client"""
+        listener = socket.create_server(('127.0.0.1', 0))
+        client_sock = socket.create_connection(listener.getsockname())
+        server_sock, address = listener.accept()
+        listener.close()
+        self.sockets.append(client_sock)
+        client_sock.settimeout(1)
+        handler = threading.Thread(target=self.server.handle_client, args=(server_sock, address))
+        handler.start()
+        return client_sock, handler
+
+    def test_protocol_violations_close_the_connection(self):
+        """Unnegotiated deflate or binary frames and endless lines drop the client before any decoding"""
+        for data in (codec.deflate_message(b'{"type": "ping"}\n'), b"x" * (MAX_MESSAGE_SIZE + 1),
+                     codec.encode_ping()):
+            client_sock, handler = self._serve_one()
+            client_sock.sendall(data)
+            handler.join(1)
+            assert not handler.is_alive()
+            assert client_sock.recv(1024) == b""
+        assert metrics.get('net.protocol_violations') == 3
+        assert not self.server.user_manager.users
@@ -0,0 +1,279 @@
+# tests/test_server_state.py
+"""
+Unit tests for server-side game and room state (no running server required)
+"""
+
+import sys
+import os
+import json
+import threading
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game.othello_board import OthelloBoard
+from server.game_manager import RealOthelloGame
+from server.room_manager import RoomManager
+from shared.constants import BLACK, WHITE
+from game.othello_rules import OthelloRules
+from shared.messages import FEATURE_BINARY_CODEC, FEATURE_COMPACT_BOARD, ERROR_INVALID_MOVE, ERROR_NOT_YOUR_TURN
+from tests.server_fixtures import ServerTestCase
+
+
+class TestCompactBoard:
+    """Test cases for the compact board string encoding"""
+
+    def test_initial_board_encoding(self):
+        """The starting position encodes to the four centre pieces"""
+        compact = OthelloBoard().to_compact()
+        assert len(compact) == 64
+        assert compact[27:29] == "WB"
+        assert compact[35:37] == "BW"
+        assert compact.count(".") == 60
+
+    def test_round_trip(self):
+        """Decoding an encoded board gives the same cells"""
+        board = OthelloBoard()
+        board.set_cell(0, 0, BLACK)
+        board.set_cell(7, 7, WHITE)
+        restored = OthelloBoard()
+        restored.load_compact(board.to_compact())
+        assert restored.get_board_copy() == board.get_board_copy()
+
+    def test_invalid_string_is_rejected(self):
+        """Wrong lengths and unknown characters raise ValueError"""
+        board = OthelloBoard()
+        for bad in ("", "." * 63, "X" * 64):
+            try:
+                board.load_compact(bad)
+                assert False, "Should have raised ValueError"
+            except ValueError:
+                pass
+
+
+class TestHandoffSnapshot(ServerTestCase):
+    """Test cases for the state captured during a zero-downtime restart"""
+
+    def test_game_snapshot_round_trip(self):
+        """A restored game has the same board, turn and result"""
+        game = RealOthelloGame()
+        assert game.make_move((2, 3), 'black')
+        restored = RealOthelloGame.from_snapshot(game.to_snapshot())
+        assert restored.get_game_state() == game.get_game_state()
+
+    def test_rooms_and_seats_are_restored(self):
+        """Rooms come back with the same seats, colors and board"""
+        alice = self._connect("alice")[0]
+        bob = self._connect("bob")[0]
+        code = self.room_manager.create_room(alice)
+        self.room_manager.join_room(bob, code)
+        self.room_manager.rooms[code].game_manager.game.make_move((2, 3), 'black')
+        snapshot = self.room_manager.to_snapshot()
+
+        new_users = self._user_manager()
+        new_rooms = RoomManager(new_users)
+        new_alice = self._connect("alice", user_manager=new_users)[0]
+        new_alice.user_id = alice.user_id
+        new_bob = self._connect("bob", user_manager=new_users)[0]
+        new_bob.user_id = bob.user_id
+        new_rooms.restore_snapshot(snapshot, {alice.user_id: new_alice, bob.user_id: new_bob})
+
+        room = new_rooms.rooms[code]
+        assert room.players == [new_alice, new_bob]
+        assert new_alice.current_room is room
+        manager = room.game_manager
+        assert manager.player_colors == {alice.user_id: 'black', bob.user_id: 'white'}
+        assert manager.game.get_game_state()['turn'] == 'white'
+        assert manager.game.board.to_compact() == self.room_manager.rooms[code].game_manager.game.board.to_compact()
+
+
+class TestMoveDeltas:
+    """Test cases for move_applied delta updates"""
+
+    def test_move_records_delta_and_version(self):
+        """A move bumps the version and records exactly what changed"""
+        game = RealOthelloGame()
+        assert game.version == 0
+        assert game.make_move((2, 3), 'black')
+        assert game.version == 1
+        assert game.last_move == ((2, 3), 'black', [(3, 3)])
+        assert game.scores == {'black': 4, 'white': 1}
+        assert game.get_game_state()['scores'] == game.scores
+
+    def test_invalid_move_changes_nothing(self):
+        """Rejected moves leave the version untouched"""
+        game = RealOthelloGame()
+        assert not game.make_move((0, 0), 'black')
+        assert game.version == 0
+        assert game.last_move is None
+
+    def test_delta_is_much_smaller_than_snapshot(self):
+        """The delta message is well under half the size of a full game_update"""
+        from server.protocols import Protocol
+        game = RealOthelloGame()
+        game.make_move((2, 3), 'black')
+        move, color, flipped = game.last_move
+        delta = Protocol.move_applied(move, color, flipped, 'white', game.scores, game.version)
+        snapshot = Protocol.game_update(game.get_game_state())
+        assert len(delta) * 2 < len(snapshot)
+        payload = Protocol.parse_message(delta)['payload']
+        assert payload == {'move': [2, 3], 'color': 'black', 'flipped': [[3, 3]],
+                           'turn': 'white', 'scores': {'black': 4, 'white': 1}, 'version': 1}
+
+
+class TestCompactBoardNegotiation(ServerTestCase):
+    """Test cases for the negotiated compact board format"""
+
+    def test_hello_accepts_only_supported_features(self):
+        """Unknown features are dropped from the acknowledgement"""
+        user, client_sock = self._connect("alice", [FEATURE_COMPACT_BOARD, "teleport"])
+        ack = self._messages(client_sock)[0]
+        assert ack['type'] == 'hello_ack'
+        assert ack['payload']['features'] == [FEATURE_COMPACT_BOARD]
+        assert user.features == {FEATURE_COMPACT_BOARD}
+
+    def test_mixed_room_gets_both_formats(self):
+        """Legacy and compact clients each receive the format they understand"""
+        alice, alice_sock = self._connect("alice", [FEATURE_COMPACT_BOARD])
+        bob, bob_sock = self._connect("bob")
+        self._messages(alice_sock)  # hello_ack
+        code = self.room_manager.create_room(alice)
+        self.room_manager.join_room(bob, code)
+
+        compact = [m for m in self._messages(alice_sock) if m['type'] == 'game_start'][0]
+        legacy = [m for m in self._messages(bob_sock) if m['type'] == 'game_start'][0]
+        assert compact['payload']['game_state']['board64'] == OthelloBoard().to_compact()
+        assert 'board' not in compact['payload']['game_state']
+        assert legacy['payload']['game_state']['board'][3][3] == 'white'
+        assert len(json.dumps(compact)) < len(json.dumps(legacy))
+
+    def test_compact_state_matches_legacy_state(self):
+        """Both formats describe the same position"""
+        game = RealOthelloGame()
+        game.make_move((2, 3), 'black')
+        legacy = game.get_game_state()
+        compact = game.get_game_state(compact=True)
+        symbols = {'': '.', 'black': 'B', 'white': 'W'}
+        assert compact['board64'] == ''.join(symbols[cell] for row in legacy['board'] for cell in row)
+        assert {k: v for k, v in compact.items() if k != 'board64'} == \
+               {k: v for k, v in legacy.items() if k != 'board'}
+
+
+class TestMoveSequencing(ServerTestCase):
+    """Test cases for sequence-numbered moves and incremental resync"""
+
+    def setup_method(self):
+        super().setup_method()
+        self.alice, self.alice_sock = self._connect("alice")
+        self.bob, self.bob_sock = self._connect("bob")
+        code = self.room_manager.create_room(self.alice)
+        self.room_manager.join_room(self.bob, code)
+        self.manager = self.room_manager.rooms[code].game_manager
+        self._messages(self.alice_sock)
+        self._messages(self.bob_sock)
+
+    def _move(self, user, move, seq):
+        self.user_manager.handle_message(
+            user, json.dumps({"type": "make_move", "payload": {"move": move, "seq": seq}}))
+
+    def test_move_result_carries_seq_and_version(self):
+        """The mover gets move_result after the broadcast delta"""
+        self._move(self.alice, [2, 3], 1)
+        messages = self._messages(self.alice_sock)
+        assert [m['type'] for m in messages] == ['move_applied', 'move_result']
+        assert messages[1]['payload'] == {'seq': 1, 'success': True, 'version': 1}
+        assert [m['type'] for m in self._messages(self.bob_sock)] == ['move_applied']
+
+    def test_duplicate_seq_is_idempotent(self):
+        """A retransmitted move is answered with the original result and not applied again"""
+        self._move(self.alice, [2, 3], 1)
+        first = self._messages(self.alice_sock)[-1]
+        self._move(self.alice, [2, 3], 1)
+        assert self._messages(self.alice_sock) == [first]
+        assert self.manager.game.version == 1
+
+    def test_rejected_move_result(self):
+        """A failed move with a seq gets move_result instead of an error"""
+        self._move(self.alice, [0, 0], 1)
+        assert self._messages(self.alice_sock) == [
+            {'type': 'move_result', 'payload': {'seq': 1, 'success': False, 'version': 0,
+                                                'reason': ERROR_INVALID_MOVE}}]
+
+    def test_seq_out_of_range_is_refused(self):
+        """seq 0, a bool or one past the u32 range is refused before the move is applied"""
+        for seq in (0, True, 2 ** 32):
+            self._move(self.alice, [2, 3], seq)
+            assert [m['type'] for m in self._messages(self.alice_sock)] == ['error']
+        assert self.manager.game.version == 0
+
+        self.alice.features = frozenset({FEATURE_BINARY_CODEC})
+        self.manager.handle_move(self.alice, (2, 3), seq=2 ** 32)
+        assert self.manager.game.version == 0
+        self.manager.handle_move(self.alice, (2, 3), seq=2 ** 32 - 1)
+        assert self.manager.game.version == 1
+
+    def test_moves_are_serialized_per_game(self):
+        """A move waits while another thread holds the game, so it never sees a half-made turn"""
+        with self.manager.lock:
+            mover = threading.Thread(target=self._move, args=(self.alice, [2, 3], 1))
+            mover.start()
+            mover.join(0.2)
+            assert mover.is_alive() and self.manager.game.version == 0
+        mover.join(1)
+        assert self.manager.game.version == 1
+
+    def test_resync_since_version_replays_moves(self):
+        """A client behind by N versions gets exactly the N missing deltas"""
+        self._move(self.alice, [2, 3], 1)
+        self._move(self.bob, [2, 2], 1)
+        self._messages(self.alice_sock)
+        self.user_manager.handle_message(self.alice, json.dumps({"type": "resync", "payload": {"since": 1}}))
+        replay = self._messages(self.alice_sock)
+        assert [(m['type'], m['payload']['version']) for m in replay] == [('move_applied', 2)]
+
+        self.user_manager.handle_message(self.alice, json.dumps({"type": "resync", "payload": {"since": 7}}))
+        assert self._messages(self.alice_sock)[0]['type'] == 'game_update'
+
+    def test_unsequenced_rejection_is_compact(self):
+        """Moves without a seq are rejected with invalid_move and the current version"""
+        self.user_manager.handle_message(
+            self.bob, json.dumps({"type": "make_move", "payload": {"move": [2, 3]}}))
+        assert self._messages(self.bob_sock) == [
+            {'type': 'invalid_move', 'payload': {'reason': ERROR_NOT_YOUR_TURN, 'version': 0}}]
+
+    def test_move_log_survives_snapshot(self):
+        """Incremental resync still works after a handoff"""
+        self.manager.game.make_move((2, 3), 'black')
+        restored = RealOthelloGame.from_snapshot(self.manager.game.to_snapshot())
+        assert restored.moves_since(0) == self.manager.game.move_log
+        assert restored.moves_since(2) is None
+
+
+class TestLegalMoveMask:
+    """Test cases for the per-turn legal-move bitmask"""
+
+    def test_mask_matches_rules_through_a_game(self):
+        """The mask always holds exactly the moves OthelloRules allows"""
+        game = RealOthelloGame()
+        while not game.game_over:
+            expected = OthelloRules.get_valid_moves(game.board, game.current_turn)
+            assert game.legal_mask == sum(1 << (r * 8 + c) for r, c in expected)
+            color = 'black' if game.current_turn == BLACK else 'white'
+            assert game.make_move(expected[-1], color)
+
+    def test_rejection_reasons(self):
+        """Malformed, out-of-turn and illegal moves are told apart"""
+        game = RealOthelloGame()
+        assert game.rejection_reason((2, 3), 'black') is None
+        assert game.rejection_reason((2, 3), 'white') == ERROR_NOT_YOUR_TURN
+        for bad in [(0, 0), (3, 3), (8, 0), (-1, 2), None, [1], ["2", 3], (True, 3)]:
+            assert game.rejection_reason(bad, 'black') == ERROR_INVALID_MOVE
+            assert not game.make_move(bad, 'black')
+        assert game.version == 0
+
+    def test_restored_game_has_mask(self):
+        """A game rebuilt from a handoff snapshot validates moves immediately"""
+        game = RealOthelloGame()
+        game.make_move((2, 3), 'black')
+        restored = RealOthelloGame.from_snapshot(game.to_snapshot())
+        assert restored.legal_mask == game.legal_mask != 0
@@ -0,0 +1,597 @@
+# tests/test_user_store.py
+"""
+Unit tests for the user account storage backends (no running server required)
+"""
+
+import sys
+import os
+import hashlib
+import io
+import json
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.user_store import (JsonUserStore, SqliteUserStore, JournalUserStore, CachedUserStore,
+                               ShardedUserStore, cache_layout, shard_path, iter_json_users)
+from server import user_admin, user_store
+from server.user_admin import rebalance, export_users, load, read_jsonl
+from server.user_manager import UserManager
+from server.metrics import metrics
+from server.score_committer import ScoreCommitter
+from server.password_hasher import PasswordHasher, is_legacy_hash, verify_password
+from server.game_manager import GameManager
+from server.room_manager import RoomManager
+from server.sessions import SessionTable
+
+
+def _record(username, score=0):
+    return {
+        "user_id": f"id-{username}",
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "hash",
+        "score": score,
+        "created_at": "2025-01-01T00:00:00"
+    }
+
+
+class StoreContract:
+    """Behaviour every backend must share; subclasses provide _open()"""
+
+    def setup_method(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = self._open()
+
+    def teardown_method(self):
+        self.store.close()
+        shutil.rmtree(self.dir)
+
+    def test_add_and_get(self):
+        """A stored user comes back unchanged"""
+        assert self.store.add(_record("alice"))
+        assert self.store.get("alice") == _record("alice")
+        assert self.store.get("bob") is None
+
+    def test_duplicate_username_is_refused(self):
+        """Adding an existing username fails and keeps the first record"""
+        assert self.store.add(_record("alice", score=5))
+        assert not self.store.add(_record("alice"))
+        assert self.store.get("alice")["score"] == 5
+
+    def test_add_score(self):
+        """Scores accumulate; unknown users are reported with None"""
+        self.store.add(_record("alice"))
+        assert self.store.add_score("alice", 3) == 3
+        assert self.store.add_score("alice", 4) == 7
+        assert self.store.add_score("nobody", 1) is None
+
+    def test_add_scores(self):
+        """A batch of score deltas is applied in one call"""
+        self.store.add(_record("alice"))
+        self.store.add(_record("bob", score=1))
+        assert self.store.add_scores({"alice": 2, "bob": 3, "nobody": 1}) == {"alice": 2, "bob": 4, "nobody": None}
+        assert self.store.get("bob")["score"] == 4
+
+
+class TestJsonUserStore(StoreContract):
+    def _open(self):
+        return JsonUserStore(os.path.join(self.dir, "users.json"))
+
+
+class TestSqliteUserStore(StoreContract):
+    def _open(self):
+        return SqliteUserStore(os.path.join(self.dir, "users.db"), json_path=None)
+
+    def test_wal_mode(self):
+        """The database runs in write-ahead logging mode"""
+        assert self.store.db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def test_migrates_json_once(self):
+        """Users in users.json are imported on first open only"""
+        json_path = os.path.join(self.dir, "users.json")
+        with open(json_path, "w") as f:
+            json.dump({"alice": _record("alice", score=9)}, f)
+        db_path = os.path.join(self.dir, "migrated.db")
+
+        store = SqliteUserStore(db_path, json_path=json_path)
+        assert store.get("alice") == _record("alice", score=9)
+        store.add_score("alice", 1)
+        store.close()
+
+        with open(json_path, "w") as f:
+            json.dump({"alice": _record("alice"), "bob": _record("bob")}, f)
+        store = SqliteUserStore(db_path, json_path=json_path)
+        assert store.get("alice")["score"] == 10
+        assert store.get("bob") is None
+        store.close()
+
+
+class TestJournalUserStore(StoreContract):
+    def _open(self, **kwargs):
+        return JournalUserStore(os.path.join(self.dir, "users.snapshot.json"),
+                                os.path.join(self.dir, "users.journal"),
+                                json_path=os.path.join(self.dir, "users.json"), **kwargs)
+
+    def _reopen(self, **kwargs):
+        self.store.close()
+        self.store = self._open(**kwargs)
+
+    def test_mutations_are_appended(self):
+        """Each change is one journal line; the snapshot is untouched"""
+        self.store.add(_record("alice"))
+        self.store.add_scores({"alice": 2, "nobody": 1})
+        self.store.flush()
+        with open(self.store.journal_path) as f:
+            entries = [json.loads(line) for line in f]
+        assert [(e["seq"], e["op"]) for e in entries] == [(1, "put"), (2, "score")]
+        assert not os.path.exists(self.store.snapshot_path)
+
+    def test_replay_after_restart(self):
+        """A reopened store replays the journal to the same state"""
+        self.store.add(_record("alice"))
+        self.store.add_score("alice", 3)
+        self.store.set_password("alice", "new")
+        self._reopen()
+        assert self.store.get("alice") == dict(_record("alice", score=3), password="new")
+
+    def test_torn_last_entry_is_discarded(self):
+        """A partial line from a crash is dropped and later appends stay readable"""
+        self.store.add(_record("alice"))
+        self.store.close()
+        with open(os.path.join(self.dir, "users.journal"), "a") as f:
+            f.write('{"seq":2,"op":"score","username":"ali')
+        self.store = self._open()
+        assert self.store.get("alice")["score"] == 0
+        self.store.add_score("alice", 1)
+        self._reopen()
+        assert self.store.get("alice")["score"] == 1
+
+    def test_compaction_replaces_journal_with_snapshot(self):
+        """Compaction writes a snapshot and later entries replay on top of it"""
+        self.store.add(_record("alice"))
+        self.store.add_score("alice", 2)
+        assert self.store.compact() == 2
+        self.store.add_score("alice", 5)
+        self._reopen()
+        assert self.store.get("alice")["score"] == 7
+        with open(self.store.snapshot_path) as f:
+            assert json.load(f)["seq"] == 2
+
+    def test_interrupted_compaction_does_not_double_apply(self):
+        """Entries in a set-aside journal already covered by the snapshot are skipped"""
+        self.store.add(_record("alice"))
+        self.store.add_score("alice", 2)
+        self.store.compact()
+        self.store.add_score("alice", 1)
+        self.store.close()
+        # Simulate a crash after the snapshot rename but before the old journal was removed
+        with open(os.path.join(self.dir, "users.journal.1"), "w") as f:
+            f.write('{"seq":2,"op":"score","username":"alice","points":2}\n')
+        self.store = self._open()
+        assert self.store.get("alice")["score"] == 3
+        assert not os.path.exists(os.path.join(self.dir, "users.journal.1"))
+
+    def test_background_compaction(self):
+        """The maintenance thread compacts once the threshold is reached"""
+        self._reopen(fsync_interval=0.01, compact_threshold=3)
+        for name in ("a", "b", "c"):
+            self.store.add(_record(name))
+        deadline = time.monotonic() + 2
+        while not os.path.exists(self.store.snapshot_path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert self.store.entries == 0
+        self._reopen()
+        assert len(self.store.all_users()) == 3
+
+    def test_imports_json_file_on_first_start(self):
+        """Users of an existing users.json are the starting state"""
+        self.store.close()
+        with open(os.path.join(self.dir, "users.json"), "w") as f:
+            json.dump({"alice": _record("alice", score=4)}, f)
+        self.store = self._open()
+        assert self.store.get("alice")["score"] == 4
+
+    def test_imported_users_survive_without_json_file(self):
+        """Imported users are in the snapshot, so users.json can go away"""
+        self.store.close()
+        with open(os.path.join(self.dir, "users.json"), "w") as f:
+            json.dump({"alice": _record("alice", score=4)}, f)
+        self.store = self._open()
+        self.store.add(_record("bob"))
+        self.store.close()
+        self.store = JournalUserStore(os.path.join(self.dir, "users.snapshot.json"),
+                                      os.path.join(self.dir, "users.journal"), json_path=None)
+        assert sorted(r["username"] for r in self.store.all_users()) == ["alice", "bob"]
+
+
+class TestCachedUserStore(StoreContract):
+    def _open(self):
+        self.backing = SqliteUserStore(os.path.join(self.dir, "users.db"), json_path=None)
+        return CachedUserStore(self.backing, flush_interval=60)
+
+    def test_writes_are_behind_until_flush(self):
+        """Changes are visible at once but reach the backing store on flush"""
+        self.store.add(_record("alice"))
+        self.store.add_score("alice", 2)
+        assert self.store.get("alice")["score"] == 2
+        assert self.backing.get("alice") is None
+        assert self.store.flush() == 1
+        assert self.backing.get("alice")["score"] == 2
+        assert self.store.flush() == 0
+
+    def test_loads_existing_users_once(self):
+        """Reads are served from memory, not the backing store"""
+        self.backing.add(_record("bob", score=4))
+        self.store.close()
+        self.store = self._open()
+        self.backing.get = None  # Any read through the backing store would now fail
+        assert self.store.get("bob")["score"] == 4
+
+    def test_full_dirty_set_triggers_flush(self):
+        """Reaching max_dirty wakes the writer without waiting for the interval"""
+        self.store.max_dirty = 3
+        flushes = metrics.get('userstore.flushes')
+        for name in ("a", "b", "c"):
+            self.store.add(_record(name))
+        deadline = time.monotonic() + 2
+        while self.backing.get("c") is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert self.backing.get("c") is not None
+        assert metrics.get('userstore.flushes') > flushes
+
+    def test_close_flushes(self):
+        """Closing writes pending changes before closing the backing store"""
+        self.store.add(_record("alice"))
+        self.store.close()
+        self.store = self._open()
+        assert self.backing.get("alice") == _record("alice")
+
+    def test_failed_flush_is_retried(self):
+        """Users stay dirty when the backing write fails"""
+        self.store.add(_record("alice"))
+        real_put_many = self.backing.put_many
+        self.backing.put_many = lambda records: 1 / 0
+        assert self.store.flush() == 0
+        assert self.store.dirty == {"alice"}
+        self.backing.put_many = real_put_many
+        assert self.store.flush() == 1
+
+
+class TestShardedUserStore(StoreContract):
+    def _open(self, count=4):
+        return ShardedUserStore([SqliteUserStore(os.path.join(self.dir, f"users.{i}-of-{count}.db"), json_path=None)
+                                 for i in range(count)])
+
+    def test_users_are_spread_over_shards(self):
+        """Each user lives in exactly the shard its hash picks"""
+        names = [f"user{i}" for i in range(200)]
+        self.store.put_many([_record(name) for name in names])
+        for index, shard in enumerate(self.store.shards):
+            owned = {record["username"] for record in shard.all_users()}
+            assert owned and all(self.store.shard_index(name) == index for name in owned)
+        assert sorted(r["username"] for r in self.store.all_users()) == sorted(names)
+
+    def test_placement_is_stable(self):
+        """A reopened layout finds every user in the same shard"""
+        self.store.put_many([_record(f"user{i}", score=i) for i in range(50)])
+        self.store.close()
+        self.store = self._open()
+        assert self.store.get("user42")["score"] == 42
+
+    def test_rebalance_to_more_shards(self):
+        """Every user is copied into the new layout unchanged"""
+        records = [_record(f"user{i}", score=i) for i in range(100)]
+        self.store.put_many(records)
+        target = self._open(count=8)
+        try:
+            assert rebalance(self.store, target, batch_size=7) == 100
+            assert sorted(target.all_users(), key=lambda r: r["score"]) == records
+        finally:
+            target.close()
+
+    def test_each_shard_gets_its_own_cache(self):
+        """The server's layout writes behind per shard, not through one shared cache"""
+        backing, store = self.store, cache_layout(self.store)
+        self.store = store  # Closing the caches closes the shards behind them
+        assert all(isinstance(shard, CachedUserStore) for shard in store.shards)
+        assert len({id(shard._writer) for shard in store.shards}) == len(store.shards)
+        store.put_many([_record(f"user{i}") for i in range(40)])
+        assert backing.all_users() == []
+        store.flush()
+        assert len(backing.all_users()) == 40
+
+    def test_shard_path(self):
+        """Shard files sit next to the single-store file"""
+        assert shard_path("data/users.db", 3, 8) == "data/users.3-of-8.db"
+        assert shard_path("data/users.db", 0, 1) == "data/users.db"
+
+
+class TestBulkImportExport:
+    """Streaming JSONL export and import through server.user_admin"""
+
+    def setup_method(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = SqliteUserStore(os.path.join(self.dir, "users.db"), json_path=None)
+
+    def teardown_method(self):
+        self.store.close()
+        shutil.rmtree(self.dir)
+
+    def test_iter_users_pages_through_sqlite(self):
+        """Every user comes back once, in username order, across page boundaries"""
+        self.store.put_many([_record(f"user{i:02}") for i in range(10)])
+        names = [record["username"] for record in self.store.iter_users(page_size=3)]
+        assert names == [f"user{i:02}" for i in range(10)]
+
+    def test_export_import_round_trip(self):
+        """Exported JSONL imports into another store unchanged"""
+        records = [_record(f"user{i}", score=i) for i in range(25)]
+        self.store.put_many(records)
+        out = io.StringIO()
+        assert export_users(self.store, out) == 25
+        assert len(out.getvalue().splitlines()) == 25
+
+        target = SqliteUserStore(os.path.join(self.dir, "copy.db"), json_path=None)
+        try:
+            assert load(read_jsonl(io.StringIO(out.getvalue())), target, batch_size=4) == 25
+            assert sorted(target.all_users(), key=lambda r: r["score"]) == records
+        finally:
+            target.close()
+
+    def test_bad_line_is_reported(self):
+        """Import stops with the number of the first invalid line"""
+        lines = [json.dumps(_record("alice")), "", '{"username": "bob"}']
+        try:
+            list(read_jsonl(lines))
+            assert False, "Should have raised ValueError"
+        except ValueError as e:
+            assert str(e).startswith("line 3: missing user_id")
+
+    def test_users_json_is_parsed_in_chunks(self):
+        """A users.json file streams record by record, even across tiny chunks"""
+        users = {f"user{i}": _record(f"user{i}", score=i) for i in range(20)}
+        path = os.path.join(self.dir, "users.json")
+        with open(path, "w") as f:
+            json.dump(users, f, indent=4)
+        assert list(iter_json_users(path, chunk_size=5)) == list(users.values())
+
+    def test_import_command_reports_unreadable_input(self):
+        """A missing or malformed --input ends the command with a message, not a traceback"""
+        missing = os.path.join(self.dir, "missing.json")
+        assert user_admin.main(["import", "--input", missing]) == 1
+        assert user_admin.main(["import", "--input", missing + "l"]) == 1
+
+    def test_rebalance_command_leaves_users_json_alone(self):
+        """Only the server imports users.json; rebalance copies exactly the source layout"""
+        paths = (user_store.SQLITE_PATH, user_store.JSON_PATH)
+        user_store.SQLITE_PATH = os.path.join(self.dir, "layout.db")
+        user_store.JSON_PATH = os.path.join(self.dir, "users.json")
+        try:
+            with open(user_store.JSON_PATH, "w") as f:
+                json.dump({name: _record(name) for name in ("dev1", "dev2")}, f)
+            source = SqliteUserStore(user_store.SQLITE_PATH, json_path=None)
+            source.put_many([_record(f"user{i}") for i in range(10)])
+            source.close()
+
+            assert user_admin.main(["rebalance", "--from-shards", "1", "--to-shards", "4"]) == 0
+            target = user_store.open_layout("sqlite", 4)
+            try:
+                assert sorted(r["username"] for r in target.iter_users()) == sorted(f"user{i}" for i in range(10))
+            finally:
+                target.close()
+        finally:
+            user_store.SQLITE_PATH, user_store.JSON_PATH = paths
+
+
+class TestUserManagerStore:
+    """Registration and login go through the injected store"""
+
+    def setup_method(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = SqliteUserStore(os.path.join(self.dir, "users.db"), json_path=None)
+        self.user_manager = UserManager(store=self.store, password_hasher=PasswordHasher(rounds=4))
+        self.server_sock, self.client_sock = socket.socketpair()
+        self.user = self.user_manager.add_user(self.server_sock, ("test", 0))
+
+    def teardown_method(self):
+        self.server_sock.close()
+        self.client_sock.close()
+        self.user_manager.close()
+        shutil.rmtree(self.dir)
+
+    def _request(self, msg_type, payload):
+        self.user_manager.handle_message(self.user, json.dumps({"type": msg_type, "payload": payload}))
+        return json.loads(self.client_sock.recv(4096).decode("utf-8").splitlines()[-1])
+
+    def test_register_login_and_score(self):
+        """A registered user can log in and keeps score updates"""
+        credentials = {"username": "alice", "email": "a@example.com", "password": "secret"}
+        assert self._request("register_user", credentials)["payload"]["success"]
+        assert not self._request("register_user", credentials)["payload"]["success"]
+
+        self.user_manager.update_user_score("alice", 2)
+        self.user_manager.score_committer.flush()
+        reply = self._request("login_user", {"username": "alice", "password": "secret"})
+        assert reply["payload"]["success"]
+        assert reply["payload"]["user"]["score"] == 2
+        assert not self._request("login_user", {"username": "alice", "password": "wrong"})["payload"]["success"]
+
+    def test_login_issues_a_session_token(self):
+        """The login reply carries a token and never the password hash"""
+        self._request("register_user", {"username": "alice", "email": "a@example.com", "password": "secret"})
+        reply = self._request("login_user", {"username": "alice", "password": "secret"})["payload"]
+        assert reply["token"] and "password" not in reply["user"]
+        assert self.user.session_token == reply["token"]
+
+    def test_connection_keeps_no_copy_of_the_account(self):
+        """The connection object is slotted and holds no credentials"""
+        self._request("register_user", {"username": "alice", "email": "a@example.com", "password": "secret"})
+        self._request("login_user", {"username": "alice", "password": "secret"})
+        assert not hasattr(self.user, "__dict__")
+        assert not hasattr(self.user, "password") and not hasattr(self.user, "email")
+
+    def test_hashing_failure_is_answered(self):
+        """A hash that raises still gets a failed reply instead of leaving the client waiting"""
+        def broken(password):
+            raise ValueError("password cannot be longer than 72 bytes")
+        self.user_manager.password_hasher._timed_hash = broken
+        reply = self._request("register_user", {"username": "alice", "email": "a@example.com", "password": "x"})
+        assert reply == {"type": "user_registered", "payload": {"success": False, "user_id": None}}
+
+    def test_overlong_password_is_refused(self):
+        """Passwords past what bcrypt reads are refused before they are hashed"""
+        reply = self._request("register_user", {"username": "alice", "email": "a@example.com",
+                                                "password": "\u00e9" * 37})
+        assert reply["type"] == "error" and self.store.get("alice") is None
+
+    def test_new_connection_resumes_with_token(self):
+        """Another connection authenticates with the token alone"""
+        self._request("register_user", {"username": "alice", "email": "a@example.com", "password": "secret"})
+        token = self._request("login_user", {"username": "alice", "password": "secret"})["payload"]["token"]
+
+        self.user = self.user_manager.add_user(self.server_sock, ("second", 0))
+        assert not self._request("resume_session", {"token": "forged"})["payload"]["success"]
+        reply = self._request("resume_session", {"token": token})["payload"]
+        assert reply["success"] and reply["user"]["username"] == "alice"
+        assert self.user.username == "alice"
+
+    def test_room_requests_ignore_claimed_identity(self):
+        """create_room trusts a session token, not a user_data dict"""
+        self.user_manager.room_manager = RoomManager(self.user_manager)
+        self._request("create_room", {"user_data": {"username": "mallory", "user_id": "x"}})
+        assert self.user.username is None
+
+    def test_password_is_salted_and_slow(self):
+        """Stored hashes are not the old unsalted sha256"""
+        self._request("register_user", {"username": "alice", "email": "a@example.com", "password": "secret"})
+        stored = self.store.get("alice")["password"]
+        assert not is_legacy_hash(stored)
+        assert stored != hashlib.sha256(b"secret").hexdigest()
+
+    def test_legacy_hash_is_upgraded_on_login(self):
+        """A sha256 hash from an old users file still logs in and is replaced"""
+        record = dict(_record("old"), password=hashlib.sha256(b"secret").hexdigest())
+        self.store.add(record)
+        reply = self._request("login_user", {"username": "old", "password": "secret"})
+        assert reply["payload"]["success"]
+        upgraded = self.store.get("old")["password"]
+        assert not is_legacy_hash(upgraded)
+        assert verify_password("secret", upgraded)
+        assert self._request("login_user", {"username": "old", "password": "secret"})["payload"]["success"]
+
+
+class TestScoreCommitter:
+    """Game results are committed in the background, in batches"""
+
+    def setup_method(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = SqliteUserStore(os.path.join(self.dir, "users.db"), json_path=None)
+        for name in ("alice", "bob"):
+            self.store.add(_record(name))
+
+    def teardown_method(self):
+        self.store.close()
+        shutil.rmtree(self.dir)
+
+    def test_results_are_batched(self):
+        """Results queued together are summed and committed in one call"""
+        calls = []
+        real_add_scores = self.store.add_scores
+        self.store.add_scores = lambda deltas: calls.append(dict(deltas)) or real_add_scores(deltas)
+        committer = ScoreCommitter(self.store, linger=0.2)
+        for name, points in (("alice", 3), ("bob", 1), ("alice", 2)):
+            committer.submit(name, points)
+        committer.flush()
+        committer.close()
+        assert calls == [{"alice": 5, "bob": 1}]
+        assert self.store.get("alice")["score"] == 5
+
+    def test_close_commits_queued_results(self):
+        """Closing the committer drains the queue first"""
+        committer = ScoreCommitter(self.store, linger=10)
+        committer.submit("bob", 7)
+        committer.close()
+        assert self.store.get("bob")["score"] == 7
+
+    def test_game_over_is_sent_before_the_commit(self):
+        """end_game broadcasts without waiting for the score to be stored"""
+        user_manager = UserManager(store=self.store)
+        user_manager.score_committer.close()
+        user_manager.score_committer = ScoreCommitter(self.store, linger=10)
+        sockets = []
+        players = []
+        for name in ("alice", "bob"):
+            server_sock, client_sock = socket.socketpair()
+            sockets += [server_sock, client_sock]
+            player = user_manager.add_user(server_sock, (name, 0))
+            player.username = name
+            players.append((player, client_sock))
+        game_manager = GameManager("ROOM01", [player for player, _ in players], user_manager)
+        game_manager.game.winner = game_manager.player_colors[players[0][0].user_id]
+
+        started = time.monotonic()
+        game_manager.end_game()
+        assert time.monotonic() - started < 1
+        assert b'"game_over"' in players[1][1].recv(65536)
+        assert self.store.get("alice")["score"] == 0
+
+        user_manager.score_committer.close()
+        assert self.store.get("alice")["score"] > 0
+        for sock in sockets:
+            sock.close()
+
+
+class TestPasswordHasher:
+    """The hashing pool is bounded and never runs on the caller's thread"""
+
+    def test_full_queue_is_refused(self):
+        """Requests beyond workers + max_queued are rejected at once"""
+        hasher = PasswordHasher(rounds=4, workers=1, max_queued=1)
+        release = threading.Event()
+        results = []
+        assert hasher.verify("x", "", lambda ok, upgraded: release.wait())
+        assert hasher.hash("y", results.append)
+        assert not hasher.hash("z", results.append)
+        release.set()
+        hasher.wait_idle()
+        assert len(results) == 1 and verify_password("y", results[0])
+        hasher.close()
+
+
+class TestSessionTable:
+    """Session tokens expire after a period without use"""
+
+    def test_resume_extends_expiry(self):
+        """Using a token slides its expiry forward"""
+        sessions = SessionTable(ttl=10)
+        token = sessions.issue("alice", now=0)
+        assert sessions.resume(token, now=8) == "alice"
+        assert sessions.resume(token, now=15) == "alice"
+        assert sessions.resume(token, now=26) is None
+        assert sessions.resume("unknown", now=0) is None
+
+    def test_sweep_drops_only_expired(self):
+        """The sweep removes expired tokens and keeps ones used since"""
+        sessions = SessionTable(ttl=10)
+        idle = sessions.issue("alice", now=0)
+        used = sessions.issue("bob", now=0)
+        sessions.resume(used, now=5)
+        assert sessions.sweep(now=12) == 1
+        assert len(sessions) == 1
+        assert sessions.resume(idle, now=12) is None
+        assert sessions.resume(used, now=12) == "bob"
+
+    def test_snapshot_round_trip(self):
+        """Sessions survive a handoff with their remaining lifetime"""
+        sessions = SessionTable(ttl=10)
+        token = sessions.issue("alice", now=0)
+        restored = SessionTable(ttl=10)
+        restored.restore_snapshot(sessions.to_snapshot(now=4), now=100)
+        assert restored.resume(token, now=105) == "alice"
+        assert SessionTable(ttl=10).sweep() == 0